@@ -0,0 +1,41 @@
+#include "infer_backend.h"
+#include <cstring>
+
+CpuBackend::CpuBackend(const std::string &onnx_file, int batch_size, int channel, int height, int width,
+                       int64_t output_size, int threads)
+        : onnx_file(onnx_file), batch_size(batch_size), channel(channel), height(height), width(width),
+          output_size(output_size), threads(threads) {}
+
+bool CpuBackend::Load() {
+    std::cout << "loading onnx from:" << onnx_file << std::endl;
+    try {
+        net = cv::dnn::readNetFromONNX(onnx_file);
+    } catch (const cv::Exception &e) {
+        std::cout << "read onnx error: " << e.what() << std::endl;
+        return false;
+    }
+    if (net.empty())
+        return false;
+    host_input.resize(InputSize());
+    net.setPreferableBackend(cv::dnn::DNN_BACKEND_OPENCV);
+    net.setPreferableTarget(cv::dnn::DNN_TARGET_CPU);
+    // 算子内部的并行线程数，0 表示沿用 OpenCV 默认 (全部核心)
+    if (threads > 0)
+        cv::setNumThreads(threads);
+    std::cout << "onnx loaded, threads: " << cv::getNumThreads() << std::endl;
+    return true;
+}
+
+bool CpuBackend::Infer(const void *input, float *output) {
+    // 直接把前处理好的 NCHW 数据包装成 blob，不再拷贝
+    std::vector<int> shape = {batch_size, channel, height, width};
+    cv::Mat blob(shape, CV_32F, const_cast<void *>(input));
+    net.setInput(blob);
+    cv::Mat out = net.forward();
+    if (int64_t(out.total()) != OutputSize()) {
+        std::cout << "unexpected onnx output size: " << out.total() << " vs " << OutputSize() << std::endl;
+        return false;
+    }
+    std::memcpy(output, out.ptr<float>(), out.total() * sizeof(float));
+    return true;
+}
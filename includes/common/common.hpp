@@ -7,6 +7,7 @@
 #include <dirent.h>
 #include "NvOnnxParser.h"
 #include "logging.h"
+#include "utils.h"
 
 // These is necessary if we want to be able to write 1_GiB instead of 1.0_GiB.
 // Since the return type is signed, -1_GiB will work as expected.
@@ -31,6 +32,7 @@ inline unsigned int getElementSize(nvinfer1::DataType t)
         case nvinfer1::DataType::kFLOAT: return 4;
         case nvinfer1::DataType::kHALF: return 2;
         case nvinfer1::DataType::kBOOL:
+        case nvinfer1::DataType::kUINT8:
         case nvinfer1::DataType::kINT8: return 1;
     }
     throw std::runtime_error("Invalid DataType.");
@@ -59,30 +61,6 @@ void setReportableSeverity(Logger::Severity severity)
     gLogFatal.setReportableSeverity(severity);
 }
 
-std::vector<std::string>readFolder(const std::string &image_path)
-{
-    std::vector<std::string> image_names;
-    auto dir = opendir(image_path.c_str());
-
-    if ((dir) != nullptr)
-    {
-        struct dirent *entry;
-        entry = readdir(dir);
-        while (entry)
-        {
-            auto temp = image_path + "/" + entry->d_name;
-            if (strcmp(entry->d_name, "") == 0 || strcmp(entry->d_name, ".") == 0 || strcmp(entry->d_name, "..") == 0)
-            {
-                entry = readdir(dir);
-                continue;
-            }
-            image_names.push_back(temp);
-            entry = readdir(dir);
-        }
-    }
-    return image_names;
-}
-
 // 读取TensorRT Engine函数
 bool readTrtFile(const std::string &engineFile, //name of the engine file
                  nvinfer1::ICudaEngine *&engine)
@@ -160,44 +138,4 @@ void onnxToTRTModel(const std::string &modelFile, // name of the onnx model
     delete builder;
 }
 
-std::map<int, std::string> readImageNetLabel(const std::string &fileName)
-{
-    std::map<int, std::string> imagenet_label;
-    std::ifstream file(fileName);
-    if (!file.is_open())
-    {
-        std::cout << "read file error: " << fileName << std::endl;
-    }
-    std::string strLine;
-    while (getline(file, strLine))
-    {
-        int pos1 = strLine.find(":");
-        std::string first = strLine.substr(0, pos1);
-        int pos2 = strLine.find_last_of("'");
-        std::string second = strLine.substr(pos1 + 3, pos2 - pos1 - 3);
-        imagenet_label.insert({atoi(first.c_str()), second});
-    }
-    file.close();
-    return imagenet_label;
-}
-
-std::map<int, std::string> readCOCOLabel(const std::string &fileName)
-{
-    std::map<int, std::string> coco_label;
-    std::ifstream file(fileName);
-    if (!file.is_open())
-    {
-        std::cout << "read file error: " << fileName << std::endl;
-    }
-    std::string strLine;
-    int index = 0;
-    while (getline(file, strLine))
-    {
-        coco_label.insert({index, strLine});
-        index++;
-    }
-    file.close();
-    return coco_label;
-}
-
 #endif //COMMON_H
@@ -0,0 +1,149 @@
+#include "utils.h"
+#include <algorithm>
+#include <cstring>
+#include <dirent.h>
+#include <fstream>
+#include <iostream>
+#include <cerrno>
+#include <sys/stat.h>
+
+std::vector<std::string>readFolder(const std::string &image_path)
+{
+    std::vector<std::string> image_names;
+    auto dir = opendir(image_path.c_str());
+
+    if ((dir) != nullptr)
+    {
+        struct dirent *entry;
+        entry = readdir(dir);
+        while (entry)
+        {
+            auto temp = image_path + "/" + entry->d_name;
+            if (strcmp(entry->d_name, "") == 0 || strcmp(entry->d_name, ".") == 0 || strcmp(entry->d_name, "..") == 0)
+            {
+                entry = readdir(dir);
+                continue;
+            }
+            image_names.push_back(temp);
+            entry = readdir(dir);
+        }
+    }
+    return image_names;
+}
+
+std::map<int, std::string> readImageNetLabel(const std::string &fileName)
+{
+    std::map<int, std::string> imagenet_label;
+    std::ifstream file(fileName);
+    if (!file.is_open())
+    {
+        std::cout << "read file error: " << fileName << std::endl;
+    }
+    std::string strLine;
+    while (getline(file, strLine))
+    {
+        int pos1 = strLine.find(":");
+        std::string first = strLine.substr(0, pos1);
+        int pos2 = strLine.find_last_of("'");
+        std::string second = strLine.substr(pos1 + 3, pos2 - pos1 - 3);
+        imagenet_label.insert({atoi(first.c_str()), second});
+    }
+    file.close();
+    return imagenet_label;
+}
+
+std::map<int, std::string> readCOCOLabel(const std::string &fileName)
+{
+    std::map<int, std::string> coco_label;
+    std::ifstream file(fileName);
+    if (!file.is_open())
+    {
+        std::cout << "read file error: " << fileName << std::endl;
+    }
+    std::string strLine;
+    int index = 0;
+    while (getline(file, strLine))
+    {
+        coco_label.insert({index, strLine});
+        index++;
+    }
+    file.close();
+    return coco_label;
+}
+
+bool isImagePath(const std::string &path)
+{
+    size_t pos = path.find_last_of('.');
+    if (pos == std::string::npos)
+        return false;
+    std::string ext = path.substr(pos + 1);
+    std::transform(ext.begin(), ext.end(), ext.begin(), ::tolower);
+    return ext == "jpg" || ext == "jpeg" || ext == "png" || ext == "bmp" || ext == "tif" || ext == "tiff";
+}
+
+bool makeDirs(const std::string &path)
+{
+    if (path.empty())
+        return true;
+    size_t pos = 0;
+    do {
+        pos = path.find('/', pos + 1);
+        std::string part = path.substr(0, pos);
+        if (!part.empty() && mkdir(part.c_str(), 0755) != 0 && errno != EEXIST)
+            return false;
+    } while (pos != std::string::npos);
+    struct stat st;
+    return stat(path.c_str(), &st) == 0 && S_ISDIR(st.st_mode);
+}
+
+FolderWalker::FolderWalker(const std::string &root, bool recursive) : recursive(recursive)
+{
+    std::string path = root;
+    while (path.size() > 1 && path.back() == '/')
+        path.pop_back();
+    if (DIR *dir = opendir(path.c_str()))
+        levels.push_back({dir, path});
+}
+
+FolderWalker::~FolderWalker()
+{
+    for (Level &level : levels)
+        closedir(static_cast<DIR *>(level.dir));
+}
+
+bool FolderWalker::Next(std::string &path)
+{
+    while (!levels.empty()) {
+        struct dirent *entry = readdir(static_cast<DIR *>(levels.back().dir));
+        if (!entry) {
+            closedir(static_cast<DIR *>(levels.back().dir));
+            levels.pop_back();
+            continue;
+        }
+        if (strcmp(entry->d_name, ".") == 0 || strcmp(entry->d_name, "..") == 0)
+            continue;
+        std::string full = levels.back().path + "/" + entry->d_name;
+        // d_type 不可用 (部分文件系统) 或为符号链接时再 stat；目录只认真实目录
+        bool is_dir = entry->d_type == DT_DIR;
+        bool is_file = entry->d_type == DT_REG;
+        if (entry->d_type == DT_UNKNOWN || entry->d_type == DT_LNK) {
+            struct stat st;
+            if (entry->d_type == DT_UNKNOWN && lstat(full.c_str(), &st) == 0 && S_ISDIR(st.st_mode))
+                is_dir = true;
+            else if (stat(full.c_str(), &st) == 0 && S_ISREG(st.st_mode))
+                is_file = true;
+        }
+        if (is_dir) {
+            if (recursive)
+                if (DIR *dir = opendir(full.c_str()))
+                    levels.push_back({dir, full});
+            continue;
+        }
+        if (is_file && isImagePath(full)) {
+            path = full;
+            count++;
+            return true;
+        }
+    }
+    return false;
+}
@@ -0,0 +1,43 @@
+#ifndef TENSORRT_INFERENCE_UTILS_H
+#define TENSORRT_INFERENCE_UTILS_H
+
+#include <map>
+#include <string>
+#include <vector>
+
+// 不依赖 TensorRT / CUDA 的文件读取工具，CPU 后端构建也会用到
+std::vector<std::string>readFolder(const std::string &image_path);
+std::map<int, std::string> readImageNetLabel(const std::string &fileName);
+std::map<int, std::string> readCOCOLabel(const std::string &fileName);
+// 按扩展名 (jpg/jpeg/png/bmp/tif/tiff，不区分大小写) 判断是否为图片
+bool isImagePath(const std::string &path);
+// 逐级创建目录 (mkdir -p)，已存在时也返回 true
+bool makeDirs(const std::string &path);
+
+// 流式遍历目录下的图片文件 (按扩展名过滤，可递归)，每次 Next 给出一个，不一次性列出整个目录
+// 内存只与目录深度有关，与文件数无关；顺序为 readdir 的顺序 (目录内容不变时固定)
+// 不进入指向目录的符号链接，避免循环
+class FolderWalker
+{
+public:
+    FolderWalker(const std::string &root, bool recursive = true);
+    ~FolderWalker();
+    FolderWalker(const FolderWalker &) = delete;
+    FolderWalker &operator=(const FolderWalker &) = delete;
+    bool Open() const { return !levels.empty(); }
+    // 下一个图片文件的完整路径，遍历结束返回 false
+    bool Next(std::string &path);
+    // 已给出的文件数
+    size_t Count() const { return count; }
+
+private:
+    struct Level{
+        void *dir;
+        std::string path;
+    };
+    std::vector<Level> levels;
+    bool recursive;
+    size_t count = 0;
+};
+
+#endif //TENSORRT_INFERENCE_UTILS_H
@@ -0,0 +1,96 @@
+#ifndef V5lite_TRT_INFER_BACKEND_H
+#define V5lite_TRT_INFER_BACKEND_H
+
+#include <string>
+#include <cstdint>
+#include <utility>
+#include <vector>
+#include <opencv2/opencv.hpp>
+#include "preprocess.h"
+#ifdef V5LITE_WITH_TENSORRT
+#include <cuda_runtime_api.h>
+#include "NvInfer.h"
+#endif
+
+// 推理后端接口：V5lite 只负责前处理 / 后处理，网络前向交给具体后端
+// 输入为 BATCH_SIZE 张 CHW 图像 (元素类型见 InputFormat)，输出为 BATCH_SIZE 份 [anchors, CATEGORY + 5] 的 float 原始预测
+class InferBackend
+{
+public:
+    virtual ~InferBackend() = default;
+    virtual bool Load() = 0;
+    // 同步执行一个 batch，input / output 均为 host 内存
+    virtual bool Infer(const void *input, float *output) = 0;
+    // Load 后可用的输入暂存区 (InputSize 个 InputFormat 元素)，前处理直接写入这里再交给 Infer
+    virtual void *HostInput() = 0;
+    // 输入元素类型，Load 后有效；前处理按它直接写出半精度 / uint8，不再经过 float
+    virtual InputType InputFormat() const { return InputType::Float32; }
+    // 每个 batch 的输入元素个数 / 输出 float 个数
+    virtual int64_t InputSize() const = 0;
+    virtual int64_t OutputSize() const = 0;
+    virtual std::string Name() const = 0;
+    // 把最近一次 Infer 的细分耗时 (ms，如 h2d / compute / d2h) 按顺序累加到 parts，不区分阶段的后端不改动 parts
+    // 累加而不是返回新数组，逐帧调用时不分配内存
+    virtual void AddTimings(std::vector<std::pair<std::string, float>> &parts) const {}
+};
+
+#ifdef V5LITE_WITH_TENSORRT
+// TensorRT 引擎 (.engine)，执行上下文、显存和 stream 在整个进程生命周期内复用
+// 输入绑定可以是 FP32 / FP16 / UINT8 (trtexec --inputIOFormats)，输出绑定必须是 FP32
+class TrtBackend : public InferBackend
+{
+public:
+    explicit TrtBackend(const std::string &engine_file);
+    ~TrtBackend() override;
+    bool Load() override;
+    bool Infer(const void *input, float *output) override;
+    // 锁页内存，H2D 拷贝不需要再经过一次中转
+    void *HostInput() override { return host_input; }
+    InputType InputFormat() const override { return input_type; }
+    int64_t InputSize() const override { return input_bytes / inputElementSize(input_type); }
+    int64_t OutputSize() const override { return output_bytes / sizeof(float); }
+    std::string Name() const override { return "tensorrt"; }
+    void AddTimings(std::vector<std::pair<std::string, float>> &parts) const override;
+
+private:
+    std::string engine_file;
+    nvinfer1::ICudaEngine *engine = nullptr;
+    nvinfer1::IExecutionContext *context = nullptr;
+    void *buffers[2] = {nullptr, nullptr};
+    void *host_input = nullptr;
+    InputType input_type = InputType::Float32;
+    cudaStream_t stream = nullptr;
+    // H2D / 执行 / D2H 的分界，记录在 stream 上，不额外同步
+    cudaEvent_t events[4] = {nullptr, nullptr, nullptr, nullptr};
+    float last_timings[3] = {0, 0, 0};
+    int64_t input_bytes = 0;
+    int64_t output_bytes = 0;
+};
+#endif
+
+// OpenCV DNN 纯 CPU 后端，直接加载导出的 .onnx，无需 GPU
+class CpuBackend : public InferBackend
+{
+public:
+    CpuBackend(const std::string &onnx_file, int batch_size, int channel, int height, int width,
+               int64_t output_size, int threads);
+    bool Load() override;
+    bool Infer(const void *input, float *output) override;
+    void *HostInput() override { return host_input.data(); }
+    int64_t InputSize() const override { return int64_t(batch_size) * channel * height * width; }
+    int64_t OutputSize() const override { return int64_t(batch_size) * output_size; }
+    std::string Name() const override { return "opencv"; }
+
+private:
+    std::string onnx_file;
+    int batch_size;
+    int channel;
+    int height;
+    int width;
+    int64_t output_size;  // 每张图的输出 float 个数
+    int threads;
+    std::vector<float> host_input;
+    cv::dnn::Net net;
+};
+
+#endif //V5lite_TRT_INFER_BACKEND_H
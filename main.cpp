@@ -1,7 +1,16 @@
 // main.cpp
 #include "v5lite.h"
+#include "protocol.h"
+#include "shm_io.h"
+#include "pipeline.h"
+#include <functional>
 #include <iostream>
 #include <string>
+#include <mutex>
+#include <set>
+#include <sstream>
+#include <thread>
+#include <unistd.h>
 #include <sys/stat.h> // 用于判断文件类型
 
 // 辅助函数：判断是否为视频文件
@@ -25,6 +34,102 @@ bool isFolder(const std::string& path) {
     return false;
 }
 
+static float elapsedMs(const std::chrono::high_resolution_clock::time_point &start) {
+    return std::chrono::duration<float, std::milli>(std::chrono::high_resolution_clock::now() - start).count();
+}
+
+// 辅助函数：读取请求的输入图 (共享内存或文件)，decode 耗时记入 decode_ms，失败时返回空图
+cv::Mat readInput(const WebuiRequest &request, float &decode_ms) {
+    auto t_start_dec = std::chrono::high_resolution_clock::now();
+    cv::Mat img = request.shm.empty() ? cv::imread(request.path)
+                                      : readSharedImage(request.shm, request.size, request.width, request.height);
+    decode_ms = elapsedMs(t_start_dec);
+    return img;
+}
+
+// 辅助函数：把画好框的结果图写入 output_shm 或 path 旁的 *_ 文件，成功时记入 result，失败时返回错误信息
+std::string writeOutput(const WebuiRequest &request, const cv::Mat &img, V5lite::InferenceResult &result) {
+    auto t_start_enc = std::chrono::high_resolution_clock::now();
+    if (!request.output_shm.empty()) {
+        if (!writeSharedImage(request.output_shm, img))
+            return "failed to write output: " + request.output_shm;
+        result.output_shm = request.output_shm;
+        result.output_size = img.size();
+    } else {
+        if (request.path.empty())
+            return "shm input needs path or output_shm for the result";
+        std::string rst_name = request.path;
+        rst_name.insert(rst_name.find_last_of("."), "_");
+        cv::imwrite(rst_name, img);
+        result.output_path = rst_name;
+    }
+    result.timings.push_back({"encode", elapsedMs(t_start_enc)});
+    return "";
+}
+
+// 辅助函数：处理经共享内存传入/传出的单张图片请求，失败时直接写错误响应
+bool inferShared(V5lite &model, const WebuiRequest &request, bool render, V5lite::InferenceResult &result,
+                 std::ostream &out) {
+    float decode_ms;
+    cv::Mat img = readInput(request, decode_ms);
+    if (!img.data) {
+        writeError(out, request, "failed to read input: " + (request.shm.empty() ? request.path : request.shm));
+        return false;
+    }
+
+    model.InferenceImage(img, &result, render);
+    result.timings.insert(result.timings.begin(), {"decode", decode_ms});
+    if (!render)
+        return true;
+    std::string error = writeOutput(request, img, result);
+    if (!error.empty()) {
+        writeError(out, request, error);
+        return false;
+    }
+    return true;
+}
+
+// 辅助函数：处理 batch 请求，读得到的图片一起推理，逐项写出响应 (某一项失败不影响其他项)
+void inferBatch(V5lite &model, const WebuiRequest &request, std::ostream &out) {
+    std::vector<std::string> responses(request.items.size());
+    std::vector<cv::Mat> images;
+    std::vector<bool> renders;
+    std::vector<size_t> owners;  // images[k] 对应的 items 下标
+    std::vector<float> decode_times;
+    for (size_t i = 0; i < request.items.size(); i++) {
+        const WebuiRequest &item = request.items[i];
+        float decode_ms;
+        cv::Mat img = readInput(item, decode_ms);
+        if (!img.data) {
+            std::stringstream response;
+            writeError(response, item, "failed to read input: " + (item.shm.empty() ? item.path : item.shm));
+            responses[i] = response.str();
+            continue;
+        }
+        images.push_back(img);
+        renders.push_back(item.render < 0 ? model.render : item.render == 1);
+        owners.push_back(i);
+        decode_times.push_back(decode_ms);
+    }
+
+    std::vector<V5lite::InferenceResult> results;
+    if (!images.empty())
+        model.InferenceBatch(images, results, renders);
+    for (size_t k = 0; k < images.size(); k++) {
+        const WebuiRequest &item = request.items[owners[k]];
+        V5lite::InferenceResult &result = results[k];
+        result.timings.insert(result.timings.begin(), {"decode", decode_times[k]});
+        std::stringstream response;
+        std::string error = renders[k] ? writeOutput(item, images[k], result) : "";
+        if (error.empty())
+            writeResult(response, item, model, result);
+        else
+            writeError(response, item, error);
+        responses[owners[k]] = response.str();
+    }
+    writeBatch(out, request, responses);
+}
+
 int main(int argc, char** argv) {
     if (argc < 3) {
         std::cout << "Usage: ./yolov5_trt [config_path] [input_path/webui]" << std::endl;
@@ -34,45 +139,191 @@ int main(int argc, char** argv) {
     std::string configPath = argv[1];
     std::string inputPath = argv[2];
 
+    // webui 模式下 stdout 只留给协议响应，所有日志 (包括 TensorRT 日志) 改走 stderr
+    bool webui = inputPath == "webui";
+    std::streambuf *protocol_buf = std::cout.rdbuf();
+    if (webui)
+        std::cout.rdbuf(std::cerr.rdbuf());
+    std::ostream protocol_out(protocol_buf);
+
     // 1. 初始化模型
     V5lite V5lite(configPath); // 假设构造函数接收 config 路径
     V5lite.LoadEngine();
 
     // 2. 分发逻辑
-    if (inputPath == "webui") {
+    if (webui) {
         // === WebUI 服务模式 (Pipe通信) ===
         // 这是为了支持 Python 前端 "上传一张，推理一张" 且不重新加载模型
-        std::cout << "READY" << std::endl; // 握手信号
-        
-        std::string line;
-        while (std::getline(std::cin, line)) {
-            if (line == "exit") break;
-            if (line.empty()) continue;
+        // 每个请求一行 JSON，每个响应一行 JSON，协议见 protocol.h
+        writeReady(protocol_out); // 握手信号
+
+        // 读请求放在单独线程: 长视频处理期间也能收到 cancel
+        // protocol_out 会被两个线程写，每条记录整行写入时加锁
+        std::mutex out_mutex;
+        // active 为已入队、尚未写出响应的请求；只有它们的 cancel 才记入 cancelled，响应写出后两边一起删除，
+        // 针对已结束 (或不存在、batch 内部) 请求的 cancel 只回 ack，不会在 cancelled 中一直留下
+        std::mutex cancel_mutex;
+        std::set<std::string> active;
+        std::set<std::string> cancelled;
+        auto isCancelled = [&](const std::string &id) {
+            std::lock_guard<std::mutex> lock(cancel_mutex);
+            return !id.empty() && cancelled.count(id) > 0;
+        };
+        BoundedQueue<WebuiRequest> requests(1024);
+        std::thread reader([&] {
+            std::string line;
+            while (std::getline(std::cin, line)) {
+                if (line.empty()) continue;
+                WebuiRequest request = parseRequest(line);
+                if (request.error.empty() && request.op == "cancel") {
+                    {
+                        std::lock_guard<std::mutex> lock(cancel_mutex);
+                        if (active.count(request.target))
+                            cancelled.insert(request.target);
+                    }
+                    std::lock_guard<std::mutex> lock(out_mutex);
+                    writeAck(protocol_out, request);
+                    continue;
+                }
+                if (!request.id.empty()) {
+                    std::lock_guard<std::mutex> lock(cancel_mutex);
+                    active.insert(request.id);
+                }
+                bool exit = request.error.empty() && request.op == "exit";
+                if (!requests.Push(request) || exit)
+                    break;
+            }
+            requests.Close();
+        });
+
+        WebuiRequest request;
+        int preview_count = 0;
+        // 每个请求处理完 (响应已写出) 后从 active / cancelled 中删除
+        struct Finish{
+            std::function<void()> done;
+            ~Finish() { done(); }
+        };
+        while (requests.Pop(request)) {
+            Finish finish{[&, id = request.id] {
+                std::lock_guard<std::mutex> lock(cancel_mutex);
+                active.erase(id);
+                cancelled.erase(id);
+            }};
+            std::unique_lock<std::mutex> out_lock(out_mutex, std::defer_lock);
+            if (!request.error.empty()) {
+                out_lock.lock();
+                writeError(protocol_out, request, request.error);
+                continue;
+            }
+            if (request.op == "exit") break;
+            if (request.op == "reload") {
+                // 重新读取配置，失败时沿用原配置和引擎
+                std::stringstream response;
+                try {
+                    bool swapped = V5lite.Reload(request.path.empty() ? configPath : request.path);
+                    writeReload(response, request, swapped);
+                } catch (const std::exception &e) {
+                    writeError(response, request, std::string("reload failed: ") + e.what());
+                }
+                out_lock.lock();
+                protocol_out << response.str() << std::flush;
+                continue;
+            }
+            if (request.op == "batch") {
+                std::stringstream response;
+                inferBatch(V5lite, request, response);
+                out_lock.lock();
+                protocol_out << response.str() << std::flush;
+                continue;
+            }
+            if (request.op != "infer") {
+                out_lock.lock();
+                writeError(protocol_out, request, "unknown op: " + request.op);
+                continue;
+            }
+            if (isCancelled(request.id)) {
+                out_lock.lock();
+                writeError(protocol_out, request, "cancelled");
+                continue;
+            }
             
+            V5lite::InferenceResult result;
+            bool render = request.render < 0 ? V5lite.render : request.render == 1;
+            if (!request.shm.empty() || !request.output_shm.empty()) {
+                // 共享内存传输：图片不经过磁盘
+                std::stringstream response;
+                if (inferShared(V5lite, request, render, result, response))
+                    writeResult(response, request, V5lite, result);
+                out_lock.lock();
+                protocol_out << response.str() << std::flush;
+                continue;
+            }
+
             // 判断输入是图片还是视频
-            if (isVideoFile(line)) {
-                std::string resPath = V5lite.InferenceVideo(line);
-                std::cout << resPath << std::endl; // 返回结果路径
+            bool ok;
+            bool folder = isFolder(request.path);
+            if (folder || isVideoFile(request.path)) {
+                // 流式: 每 stream 帧回一条 progress，收到 cancel 后提前结束
+                // 文件夹续跑时帧序号从已处理的图片数开始，fps 只按本次处理的帧计算
+                auto t_start = std::chrono::high_resolution_clock::now();
+                int first_frame = -1;
+                V5lite::FrameCallback on_frame = [&](int frame, int frames_total, const cv::Mat &img,
+                                                     const std::vector<V5lite::DetectRes> &detections) {
+                    if (isCancelled(request.id))
+                        return false;
+                    if (first_frame < 0)
+                        first_frame = frame;
+                    if (request.stream <= 0 || frame % request.stream != 0)
+                        return true;
+                    float seconds = std::chrono::duration<float>(std::chrono::high_resolution_clock::now() - t_start).count();
+                    std::string preview_shm;
+                    cv::Mat preview = img;
+                    if (render) {
+                        if (request.preview_width > 0 && img.cols > request.preview_width)
+                            cv::resize(img, preview, cv::Size(request.preview_width,
+                                                              img.rows * request.preview_width / img.cols));
+                        preview_shm = "/v5l_prev_" + std::to_string(getpid()) + "_" + std::to_string(preview_count++);
+                        if (!writeSharedImage(preview_shm, preview))
+                            preview_shm.clear();
+                    }
+                    std::lock_guard<std::mutex> lock(out_mutex);
+                    writeProgress(protocol_out, request, V5lite, frame, frames_total,
+                                  seconds > 0 ? (frame - first_frame + 1) / seconds : 0.f, detections, preview_shm,
+                                  preview.size());
+                    return true;
+                };
+                if (folder)
+                    ok = V5lite.InferenceFolder(request.path, &result, render, request.output_dir, request.restart,
+                                                on_frame);
+                else
+                    ok = V5lite.InferenceVideo(request.path, &result, render, on_frame);
             } else {
-                std::string resPath = V5lite.InferenceImage(line);
-                std::cout << resPath << std::endl; // 返回结果路径
+                ok = V5lite.InferenceImage(request.path, &result, render);
             }
+            out_lock.lock();
+            if (!ok)
+                writeError(protocol_out, request, folder ? "failed to process folder (see log): " + request.path
+                                                         : "failed to read input: " + request.path);
+            else
+                writeResult(protocol_out, request, V5lite, result); // 返回结果
         }
+        // exit 请求入队后 reader 已自行退出
+        reader.join();
     } 
     else if (isFolder(inputPath)) {
-        // === 原有的文件夹批量模式 ===
+        // === 文件夹批量模式 (可中断续跑) ===
         std::cout << "Mode: Folder Inference" << std::endl;
-        V5lite.InferenceFolder(inputPath);
+        V5lite.InferenceFolder(inputPath, nullptr, V5lite.render);
     }
     else if (isVideoFile(inputPath)) {
         // === 单视频模式 ===
         std::cout << "Mode: Single Video Inference" << std::endl;
-        V5lite.InferenceVideo(inputPath);
+        V5lite.InferenceVideo(inputPath, nullptr, V5lite.render);
     }
     else {
         // === 单图片模式 (默认) ===
         std::cout << "Mode: Single Image Inference" << std::endl;
-        V5lite.InferenceImage(inputPath);
+        V5lite.InferenceImage(inputPath, nullptr, V5lite.render);
     }
 
     return 0;
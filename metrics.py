@@ -0,0 +1,307 @@
+"""
+推理服务的指标与追踪
+- Registry: 计数器 / 仪表 / 直方图，按 Prometheus 文本格式导出 (不依赖 prometheus_client)
+- ServiceMetrics: BackendPool 记录请求数、端到端延迟、排队时间和后端各阶段耗时
+- start_metrics_server: 在单独的端口上提供 /metrics，供 Prometheus 抓取
+- Tracer: 按请求记录 span (排队 / 后端 / 各阶段)，以 JSON Lines 追加到文件
+"""
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# 端到端延迟的桶 (秒)
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+# 后端单个阶段耗时的桶 (秒)
+STAGE_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0)
+
+
+def _format_labels(names, values, extra=()):
+    pairs = list(zip(names, values)) + list(extra)
+    if not pairs:
+        return ""
+    escaped = (str(v).replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n") for _, v in pairs)
+    return "{" + ",".join(f"{k}=\"{v}\"" for (k, _), v in zip(pairs, escaped)) + "}"
+
+
+def _format_value(value):
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class _Family:
+    """同名指标按标签值分组"""
+
+    def __init__(self, kind, name, help_text, labels=()):
+        self.kind = kind
+        self.name = name
+        self.help_text = help_text
+        self.labels = tuple(labels)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def _key(self, labels):
+        return tuple(str(labels.get(name, "")) for name in self.labels)
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} {self.kind}"]
+        with self._lock:
+            items = sorted(self._values.items())
+            lines += self._render_items(items)
+        return lines
+
+    def _render_items(self, items):
+        return [f"{self.name}{_format_labels(self.labels, key)} {_format_value(value)}" for key, value in items]
+
+
+class Counter(_Family):
+    def __init__(self, name, help_text, labels=()):
+        super().__init__("counter", name, help_text, labels)
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def set_total(self, value, **labels):
+        """计数在别处累计时 (如后端重启次数、缓存命中数)，导出前直接同步总数"""
+        with self._lock:
+            self._values[self._key(labels)] = value
+
+
+class Gauge(_Family):
+    def __init__(self, name, help_text, labels=()):
+        super().__init__("gauge", name, help_text, labels)
+
+    def set(self, value, **labels):
+        with self._lock:
+            self._values[self._key(labels)] = value
+
+
+class Histogram(_Family):
+    def __init__(self, name, help_text, labels=(), buckets=LATENCY_BUCKETS):
+        super().__init__("histogram", name, help_text, labels)
+        self.buckets = tuple(sorted(buckets)) + (float("inf"),)
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                state = self._values[key] = [[0] * len(self.buckets), 0.0, 0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    state[0][i] += 1
+                    break
+            state[1] += value
+            state[2] += 1
+
+    def _render_items(self, items):
+        lines = []
+        for key, (counts, total, count) in items:
+            cumulative = 0
+            for bound, n in zip(self.buckets, counts):
+                cumulative += n
+                labels = _format_labels(self.labels, key, [("le", _format_value(bound))])
+                lines.append(f"{self.name}_bucket{labels} {cumulative}")
+            labels = _format_labels(self.labels, key)
+            lines.append(f"{self.name}_sum{labels} {_format_value(total)}")
+            lines.append(f"{self.name}_count{labels} {count}")
+        return lines
+
+
+class Registry:
+    """一组指标；collectors 在每次导出前调用，用于刷新队列长度这类瞬时值"""
+
+    def __init__(self):
+        self._families = []
+        self._collectors = []
+
+    def counter(self, name, help_text, labels=()):
+        return self._add(Counter(name, help_text, labels))
+
+    def gauge(self, name, help_text, labels=()):
+        return self._add(Gauge(name, help_text, labels))
+
+    def histogram(self, name, help_text, labels=(), buckets=LATENCY_BUCKETS):
+        return self._add(Histogram(name, help_text, labels, buckets))
+
+    def _add(self, family):
+        self._families.append(family)
+        return family
+
+    def add_collector(self, collector):
+        self._collectors.append(collector)
+
+    def render(self):
+        """Prometheus 文本格式 (text/plain; version=0.0.4)"""
+        for collector in self._collectors:
+            try:
+                collector()
+            except Exception as e:
+                print(f"指标采集出错: {e}")
+        lines = []
+        for family in self._families:
+            lines += family.render()
+        return "\n".join(lines) + "\n"
+
+
+class ServiceMetrics:
+    """推理池的指标，由 BackendPool 在请求完成时调用 observe_request"""
+
+    def __init__(self, registry=None):
+        self.registry = registry or Registry()
+        r = self.registry
+        self.requests = r.counter("v5lite_requests_total", "Requests handled by the backend pool.",
+                                  ("op", "status"))
+        self.latency = r.histogram("v5lite_request_latency_seconds",
+                                   "End-to-end latency from submit to response.", ("op",))
+        self.queue_wait = r.histogram("v5lite_queue_wait_seconds",
+                                      "Time spent in the pool queue before dispatch.", ("op",))
+        self.stages = r.histogram("v5lite_stage_seconds",
+                                  "Backend stage durations reported in response timings (per frame for videos).",
+                                  ("stage",), STAGE_BUCKETS)
+        self.frames = r.counter("v5lite_frames_total", "Frames processed by successful requests.")
+        self.detections = r.counter("v5lite_detections_total", "Detections returned by successful requests.")
+        self.queue_depth = r.gauge("v5lite_queue_depth", "Requests waiting in the pool queue.")
+        self.queue_capacity = r.gauge("v5lite_queue_capacity", "Pool queue capacity.")
+        self.in_flight = r.gauge("v5lite_in_flight", "Requests in flight per backend.", ("backend",))
+        self.backend_up = r.gauge("v5lite_backend_up", "Whether each backend process is running.", ("backend",))
+        self.restarts = r.counter("v5lite_backend_restarts_total", "Backend process restarts.", ("backend",))
+        self.ready = r.gauge("v5lite_pool_ready", "1 once start-up and warm-up have finished.")
+        self.startup = r.gauge("v5lite_startup_seconds", "Duration of each start-up phase.", ("phase",))
+        self.cache = r.counter("v5lite_cache_events_total",
+                               "Result cache hits, misses, evictions and invalidations.", ("event",))
+        self.cache_entries = r.gauge("v5lite_cache_entries", "Entries in the result cache.")
+        self.cache_bytes = r.gauge("v5lite_cache_bytes", "Bytes held by the result cache.")
+        self.batch_size = r.histogram("v5lite_batch_size", "Requests merged into each batch dispatch.",
+                                      buckets=(1, 2, 4, 8, 16, 32))
+        # 结果视频: 两个计数器之比为每秒视频的输出字节数，playable 为开始编码到文件可以播放的时间
+        self.video_bytes = r.counter("v5lite_video_output_bytes_total", "Bytes written to result videos.")
+        self.video_seconds = r.counter("v5lite_video_output_seconds_total", "Duration of result videos written.")
+        self.video_playable = r.histogram("v5lite_video_playable_seconds",
+                                          "Time from the start of encoding until the result video is playable.")
+
+    def observe_request(self, op, response, queue_wait, latency):
+        if response.get("ok"):
+            status = "cancelled" if response.get("cancelled") else "ok"
+        else:
+            status = "cancelled" if response.get("error") == "cancelled" else "error"
+        self.requests.inc(op=op, status=status)
+        self.latency.observe(latency, op=op)
+        if queue_wait is not None:
+            self.queue_wait.observe(queue_wait, op=op)
+        if status == "error" or op != "infer":
+            return
+        for stage, ms in response.get("timings", {}).items():
+            if stage != "total":
+                self.stages.observe(ms / 1000.0, stage=stage)
+        self.frames.inc(response.get("frames", 1))
+        if response.get("output_bytes"):
+            self.video_bytes.inc(response["output_bytes"])
+            self.video_seconds.inc(response.get("output_seconds", 0.0))
+            self.video_playable.observe(response.get("playable_ms", 0.0) / 1000.0)
+        self.detections.inc(len(response.get("detections", [])))
+
+    def rejected(self, op):
+        self.requests.inc(op=op, status="rejected")
+
+    def render(self):
+        return self.registry.render()
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    registry = None
+
+    def do_GET(self):
+        if self.path.split("?")[0] != "/metrics":
+            self.send_error(404)
+            return
+        body = self.registry.render().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def start_metrics_server(registry, port, host="0.0.0.0"):
+    """在后台线程中提供 http://host:port/metrics，返回 server (shutdown() 停止)，端口被占用时返回 None"""
+    handler = type("MetricsHandler", (_MetricsHandler,), {"registry": registry})
+    try:
+        server = ThreadingHTTPServer((host, int(port)), handler)
+    except OSError as e:
+        print(f"指标端口 {port} 启动失败: {e}")
+        return None
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    print(f"指标: http://{host}:{server.server_address[1]}/metrics")
+    return server
+
+
+class Tracer:
+    """
+    按请求记录 span，每个请求一行 JSON 追加到 path
+    - request: 提交到响应的全程，下分 queue (池中排队) 和 backend (派发到收到响应)
+    - backend 下按响应 timings 依次排列各阶段，最后一个阶段与响应时刻对齐；
+      backend 开头多出的部分是管道传输和在该后端上排队的时间
+    - 视频的 timings 是单帧平均值，不展开为 span
+    sample 为记录比例 (0~1)，高负载时可调低
+    """
+
+    def __init__(self, path, sample=1.0):
+        self.path = path
+        self.sample = float(sample)
+        self._lock = threading.Lock()
+
+    def sampled(self):
+        return self.sample >= 1.0 or random.random() < self.sample
+
+    def record(self, trace_id, op, response, submitted, dispatched, done, backend=None):
+        """submitted / dispatched / done 为 time.time() 时刻，dispatched 为 None 表示未派发"""
+        def span(name, start, end, parent=None, **attrs):
+            record = {"name": name, "start": round(start, 6), "duration_ms": round((end - start) * 1000.0, 3)}
+            if parent:
+                record["parent"] = parent
+            if attrs:
+                record["attrs"] = attrs
+            return record
+
+        spans = [span("request", submitted, done, op=op, ok=bool(response.get("ok")))]
+        if dispatched is not None:
+            spans.append(span("queue", submitted, dispatched, "request"))
+            spans.append(span("backend", dispatched, done, "request", backend=backend))
+            if response.get("ok") and response.get("frames", 1) <= 1:
+                spans += self._stage_spans(response.get("timings", {}), dispatched, done)
+        line = {"trace_id": str(trace_id), "op": op, "time": time.strftime("%Y-%m-%dT%H:%M:%S"), "spans": spans}
+        if not response.get("ok"):
+            line["error"] = response.get("error", "")
+        with self._lock:
+            try:
+                with open(self.path, "a", encoding="utf-8") as f:
+                    f.write(json.dumps(line, ensure_ascii=False) + "\n")
+            except OSError as e:
+                print(f"写入追踪记录失败: {e}")
+
+    @staticmethod
+    def _stage_spans(timings, dispatched, done):
+        stages = [(k, v) for k, v in timings.items() if k != "total" and "." not in k]
+        start = max(dispatched, done - sum(v for _, v in stages) / 1000.0)
+        spans = []
+        for name, ms in stages:
+            end = start + ms / 1000.0
+            spans.append({"name": name, "start": round(start, 6), "duration_ms": round(ms, 3), "parent": "backend"})
+            # "execute.h2d" 这类细分依次排在父阶段内
+            child = start
+            for key, value in timings.items():
+                if key.startswith(name + "."):
+                    spans.append({"name": key, "start": round(child, 6), "duration_ms": round(value, 3),
+                                  "parent": name})
+                    child += value / 1000.0
+            start = end
+        return spans
@@ -0,0 +1,456 @@
+"""
+模型转换产物登记表: .pt -> ONNX -> TensorRT engine 的增量构建
+- ONNX 以 (权重哈希, imgsz, batch, export 脚本版本) 为键，不同精度的引擎共用同一个 ONNX
+- engine 以 (ONNX 键, 精度, trtexec 版本) 为键，已存在的产物直接复用，不再重新构建
+- trtexec 的 timing cache 在多次构建之间保留，加快后续构建
+- ConversionJobs 在后台线程中执行转换任务，日志逐行流式回传，可取消
+产物存放在 artifact_dir 下，index.json 记录每个产物的元数据，供界面列出和选择
+"""
+import collections
+import hashlib
+import itertools
+import json
+import os
+import queue
+import re
+import shutil
+import subprocess
+import threading
+import time
+import uuid
+
+import yaml
+
+# config.yaml 中 convert 段的默认值
+CONVERT_DEFAULTS = {
+    "export_script": "export.py",                     # YOLOv5 导出脚本
+    "trtexec": "/usr/src/tensorrt/bin/trtexec",      # trtexec 路径
+    "artifact_dir": "./artifacts",                    # 转换产物目录
+    "python": "python",                               # 运行导出脚本的解释器
+    "max_jobs": 1,                                    # 同时执行的转换任务数
+    "input_format": "fp32",                           # 引擎输入绑定的数据类型 (fp32 / fp16)
+}
+
+PRECISIONS = ("fp32", "fp16", "int8")
+# fp16 输入让 C++ 端直接写半精度，host 内存和 H2D 拷贝减半；uint8 输入需要在 ONNX 内做归一化，export.py 不支持
+INPUT_FORMATS = ("fp32", "fp16")
+
+
+def load_convert_config(config_path):
+    """读取 config.yaml 中的 convert 段，缺省项使用默认值"""
+    settings = dict(CONVERT_DEFAULTS)
+    try:
+        with open(config_path, "r", encoding="utf-8") as f:
+            root = yaml.safe_load(f) or {}
+        settings.update(root.get("convert") or {})
+    except (OSError, yaml.YAMLError) as e:
+        print(f"读取 convert 配置失败，使用默认值: {e}")
+    return settings
+
+
+def file_sha256(path, chunk=1 << 20):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(chunk), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def tool_version(path):
+    """工具版本: 可执行文件 / 脚本的实际路径、大小和修改时间，升级或修改后即视为新版本"""
+    resolved = shutil.which(path) or path
+    try:
+        st = os.stat(resolved)
+    except OSError:
+        return "missing"
+    text = f"{os.path.realpath(resolved)}:{st.st_size}:{st.st_mtime_ns}"
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()[:16]
+
+
+def artifact_key(*parts):
+    return hashlib.sha256("|".join(str(p) for p in parts).encode("utf-8")).hexdigest()[:20]
+
+
+class ConversionError(Exception):
+    pass
+
+
+class ConversionCancelled(ConversionError):
+    pass
+
+
+class ArtifactRegistry:
+    """转换产物登记表，index.json 的读写由锁保护，可在多个线程中同时使用"""
+
+    def __init__(self, artifact_dir=CONVERT_DEFAULTS["artifact_dir"], export_script=CONVERT_DEFAULTS["export_script"],
+                 trtexec=CONVERT_DEFAULTS["trtexec"], python=CONVERT_DEFAULTS["python"],
+                 input_format=CONVERT_DEFAULTS["input_format"]):
+        if input_format not in INPUT_FORMATS:
+            raise ValueError(f"不支持的输入格式: {input_format}")
+        self.artifact_dir = os.path.abspath(artifact_dir)
+        self.export_script = export_script
+        self.trtexec = trtexec
+        self.python = python
+        self.input_format = input_format
+        self.index_path = os.path.join(self.artifact_dir, "index.json")
+        self.timing_cache = os.path.join(self.artifact_dir, "timing.cache")
+        self._lock = threading.Lock()
+        self._building = {}
+
+    @classmethod
+    def from_config(cls, config_path):
+        settings = load_convert_config(config_path)
+        return cls(settings["artifact_dir"], settings["export_script"], settings["trtexec"], settings["python"],
+                   settings["input_format"])
+
+    # --- 登记表 ---
+    def _read_index(self):
+        try:
+            with open(self.index_path, "r", encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def _write_index(self, index):
+        os.makedirs(self.artifact_dir, exist_ok=True)
+        tmp = self.index_path + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(index, f, ensure_ascii=False, indent=2)
+        os.replace(tmp, self.index_path)
+
+    def lookup(self, key):
+        """返回登记过且文件仍存在的产物元数据，否则返回 None"""
+        with self._lock:
+            entry = self._read_index().get(key)
+        if entry and os.path.exists(entry["path"]):
+            return entry
+        return None
+
+    def _register(self, key, entry):
+        with self._lock:
+            index = self._read_index()
+            index[key] = entry
+            self._write_index(index)
+
+    def engines(self):
+        """所有仍存在的引擎产物，按构建时间从新到旧"""
+        with self._lock:
+            index = self._read_index()
+        entries = [e for e in index.values() if e["kind"] == "engine" and os.path.exists(e["path"])]
+        return sorted(entries, key=lambda e: e["created"], reverse=True)
+
+    # --- 构建 ---
+    def _key_lock(self, key):
+        """同一产物同时只构建一次，后到的任务等待后直接复用"""
+        with self._lock:
+            return self._building.setdefault(key, threading.Lock())
+
+    def _run(self, cmd, log, job=None):
+        """运行外部命令，stdout/stderr 合并后逐行交给 log；job 被取消时终止进程"""
+        log("$ " + " ".join(cmd))
+        try:
+            process = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, text=True,
+                                       errors="replace", bufsize=1)
+        except FileNotFoundError:
+            raise ConversionError(f"找不到命令 '{cmd[0]}'")
+        if job is not None:
+            job.attach(process)
+        tail = collections.deque(maxlen=40)
+        try:
+            for line in process.stdout:
+                line = line.rstrip("\n")
+                tail.append(line)
+                log(line)
+        finally:
+            process.stdout.close()
+            returncode = process.wait()
+            if job is not None:
+                job.attach(None)
+        if job is not None and job.cancel_requested:
+            raise ConversionCancelled("任务已取消")
+        if returncode != 0:
+            raise ConversionError(f"命令执行失败 (返回码 {returncode}):\n" + "\n".join(tail))
+
+    def export_onnx(self, pt_path, input_size=640, batch_size=1, weights_sha=None, log=print, job=None):
+        """步骤 1: .pt -> ONNX，已有相同键的 ONNX 时直接复用"""
+        weights_sha = weights_sha or file_sha256(pt_path)
+        export_version = tool_version(self.export_script)
+        key = artifact_key("onnx", weights_sha, input_size, batch_size, export_version)
+        with self._key_lock(key):
+            entry = self.lookup(key)
+            if entry:
+                log(f"[Step 1] 复用已导出的 ONNX: {entry['path']}")
+                return entry
+
+            base_name = os.path.splitext(os.path.basename(pt_path))[0]
+            out_dir = os.path.join(self.artifact_dir, "onnx", key)
+            onnx_path = os.path.join(out_dir, f"{base_name}.onnx")
+            # 在独立的临时目录中导出，export.py 会把 ONNX 写在权重文件旁边
+            work_dir = os.path.join(self.artifact_dir, "tmp", uuid.uuid4().hex[:12])
+            os.makedirs(work_dir)
+            try:
+                work_pt = os.path.join(work_dir, f"{base_name}.pt")
+                shutil.copyfile(pt_path, work_pt)
+                log(f"[Step 1] 正在导出 ONNX: {pt_path} ...")
+                start = time.time()
+                self._run([self.python, self.export_script, "--weights", work_pt,
+                           "--img-size", str(input_size), "--batch-size", str(batch_size),
+                           "--device", "0"], log, job)
+                generated = os.path.splitext(work_pt)[0] + ".onnx"
+                if not os.path.exists(generated):
+                    raise ConversionError("未检测到生成的 ONNX 文件。")
+                os.makedirs(out_dir, exist_ok=True)
+                os.replace(generated, onnx_path)
+            finally:
+                shutil.rmtree(work_dir, ignore_errors=True)
+
+            entry = {"kind": "onnx", "key": key, "path": onnx_path, "weights": os.path.basename(pt_path),
+                     "weights_sha": weights_sha, "imgsz": int(input_size), "batch": int(batch_size),
+                     "export_version": export_version, "created": time.time(),
+                     "build_seconds": round(time.time() - start, 1)}
+            self._register(key, entry)
+        log(f"[Success] ONNX 文件已就绪: {onnx_path}")
+        return entry
+
+    def build_engine(self, onnx_entry, precision="fp16", log=print, job=None):
+        """步骤 2: ONNX -> TensorRT engine，已有相同键的引擎时直接复用"""
+        if precision not in PRECISIONS:
+            raise ConversionError(f"不支持的精度: {precision}")
+        trtexec_version = tool_version(self.trtexec)
+        key_parts = ["engine", onnx_entry["key"], precision, trtexec_version]
+        if self.input_format != "fp32":
+            # fp32 输入不计入键，已有引擎的键保持不变
+            key_parts.append(self.input_format)
+        key = artifact_key(*key_parts)
+        with self._key_lock(key):
+            entry = self.lookup(key)
+            if entry:
+                log(f"[Step 2] 复用已构建的引擎: {entry['path']}")
+                return entry
+
+            base_name = os.path.splitext(os.path.basename(onnx_entry["path"]))[0]
+            out_dir = os.path.join(self.artifact_dir, "engines", key)
+            os.makedirs(out_dir, exist_ok=True)
+            engine_path = os.path.join(out_dir, f"{base_name}_{onnx_entry['imgsz']}_b{onnx_entry['batch']}_{precision}.engine")
+            partial = engine_path + ".partial"
+            cmd = [self.trtexec, f"--onnx={onnx_entry['path']}", f"--saveEngine={partial}",
+                   f"--timingCacheFile={self.timing_cache}"]
+            if precision == "fp16":
+                cmd.append("--fp16")
+            elif precision == "int8":
+                cmd.append("--int8")
+            if self.input_format == "fp16":
+                cmd.append("--inputIOFormats=fp16:chw")
+            log("[Step 2] 正在构建 TensorRT 引擎 (使用 trtexec) ...")
+            start = time.time()
+            try:
+                self._run(cmd, log, job)
+            except ConversionError:
+                if os.path.exists(partial):
+                    os.remove(partial)
+                if not os.listdir(out_dir):
+                    os.rmdir(out_dir)
+                raise
+            if not os.path.exists(partial):
+                raise ConversionError("trtexec 未生成引擎文件。")
+            os.replace(partial, engine_path)
+
+            entry = {"kind": "engine", "key": key, "path": engine_path, "onnx": onnx_entry["path"],
+                     "onnx_key": onnx_entry["key"], "weights": onnx_entry["weights"],
+                     "weights_sha": onnx_entry["weights_sha"], "imgsz": onnx_entry["imgsz"],
+                     "batch": onnx_entry["batch"], "precision": precision, "input_format": self.input_format,
+                     "trtexec_version": trtexec_version,
+                     "created": time.time(), "build_seconds": round(time.time() - start, 1)}
+            self._register(key, entry)
+        log(f"Engine saved to: {engine_path}")
+        return entry
+
+    def convert(self, pt_path, input_size=640, batch_size=1, precision="fp16", log=print, job=None):
+        """完整转换流程，返回引擎产物的元数据；失败时抛出 ConversionError"""
+        if precision not in PRECISIONS:
+            raise ConversionError(f"不支持的精度: {precision}")
+        weights_sha = file_sha256(pt_path)
+        onnx_entry = self.export_onnx(pt_path, input_size, batch_size, weights_sha, log, job)
+        if job is not None and job.cancel_requested:
+            raise ConversionCancelled("任务已取消")
+        return self.build_engine(onnx_entry, precision, log, job)
+
+
+class ConversionJob:
+    """一个后台转换任务: 状态、完整日志 (同时写入 log_path)、结果和取消标志"""
+
+    def __init__(self, job_id, pt_path, input_size, batch_size, precision, log_path):
+        self.id = job_id
+        self.pt_path = pt_path
+        self.input_size = int(input_size)
+        self.batch_size = int(batch_size)
+        self.precision = precision
+        self.log_path = log_path
+        self.status = "queued"  # queued / running / done / failed / cancelled
+        self.result = None
+        self.error = ""
+        self.cancel_requested = False
+        self.created = time.time()
+        self.lines = []
+        self._process = None
+        self._cond = threading.Condition()
+        # 日志文件在任务存续期间保持打开 (行缓冲)，_finish 时关闭；写文件不占 _cond，不阻塞 follow
+        self._log_file = open(log_path, "a", encoding="utf-8", buffering=1)
+        self._file_lock = threading.Lock()
+
+    @property
+    def finished(self):
+        return self.status in ("done", "failed", "cancelled")
+
+    def log(self, line):
+        with self._file_lock:
+            if self._log_file is not None:
+                self._log_file.write(line + "\n")
+        with self._cond:
+            self.lines.append(line)
+            self._cond.notify_all()
+
+    def attach(self, process):
+        with self._cond:
+            self._process = process
+            cancel = process is not None and self.cancel_requested
+        if cancel:
+            process.terminate()
+
+    def cancel(self):
+        """排队中的任务不再执行；运行中的任务终止当前的外部命令"""
+        with self._cond:
+            if self.finished:
+                return False
+            self.cancel_requested = True
+            process = self._process
+        if process is not None:
+            process.terminate()
+        return True
+
+    def _finish(self, status, result=None, error=""):
+        with self._file_lock:
+            if self._log_file is not None:
+                self._log_file.close()
+                self._log_file = None
+        with self._cond:
+            self.status = status
+            self.result = result
+            self.error = error
+            self._cond.notify_all()
+
+    def follow(self, start=0, timeout=0.5):
+        """
+        生成器: 逐步产出 (新增日志行列表, 是否已结束)
+        没有新日志时每 timeout 秒产出一次空列表，调用方可借此刷新状态
+        """
+        offset = start
+        while True:
+            with self._cond:
+                if len(self.lines) == offset and not self.finished:
+                    self._cond.wait(timeout)
+                lines = self.lines[offset:]
+                finished = self.finished and offset + len(lines) == len(self.lines)
+            offset += len(lines)
+            yield lines, finished
+            if finished:
+                return
+
+
+class ConversionJobs:
+    """
+    后台转换任务队列: max_jobs 个工作线程依次执行 registry.convert
+    提交后立即返回任务，界面通过 job.follow() 流式读取日志，不占用 Gradio 的处理线程
+    """
+
+    def __init__(self, registry, max_jobs=1, keep=50):
+        self.registry = registry
+        self.max_jobs = max(1, int(max_jobs))
+        self.keep = keep
+        self._ids = itertools.count(1)
+        self._jobs = collections.OrderedDict()
+        self._lock = threading.Lock()
+        self._queue = queue.Queue()
+        self._workers = [threading.Thread(target=self._work, daemon=True) for _ in range(self.max_jobs)]
+        for t in self._workers:
+            t.start()
+
+    def submit(self, pt_path, input_size=640, batch_size=1, precision="fp16"):
+        log_dir = os.path.join(self.registry.artifact_dir, "logs")
+        os.makedirs(log_dir, exist_ok=True)
+        with self._lock:
+            job_id = f"{time.strftime('%Y%m%d-%H%M%S')}-{next(self._ids)}"
+            job = ConversionJob(job_id, pt_path, input_size, batch_size, precision,
+                                os.path.join(log_dir, f"{job_id}.log"))
+            self._jobs[job_id] = job
+            # 只保留最近 keep 个任务的记录，日志文件仍在 log_dir 中
+            while len(self._jobs) > self.keep:
+                oldest = next(iter(self._jobs.values()))
+                if not oldest.finished:
+                    break
+                self._jobs.popitem(last=False)
+            busy = sum(1 for j in self._jobs.values() if not j.finished) - 1
+        job.log(f"====== 任务 {job_id}: {os.path.basename(pt_path)} | {input_size} | b{batch_size} | {precision} ======")
+        if busy >= self.max_jobs:
+            job.log(f"排队中，前面还有 {busy - self.max_jobs + 1} 个任务 ...")
+        self._queue.put(job)
+        return job
+
+    def get(self, job_id):
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def jobs(self):
+        with self._lock:
+            return list(self._jobs.values())
+
+    def cancel(self, job_id):
+        job = self.get(job_id)
+        return job is not None and job.cancel()
+
+    def _work(self):
+        while True:
+            job = self._queue.get()
+            if job.cancel_requested:
+                job.log("任务已取消")
+                job._finish("cancelled")
+                continue
+            job.status = "running"
+            start = time.time()
+            try:
+                entry = self.registry.convert(job.pt_path, job.input_size, job.batch_size, job.precision,
+                                              log=job.log, job=job)
+            except ConversionCancelled as e:
+                job.log(f"\n[Cancelled] {e}")
+                job._finish("cancelled", error=str(e))
+            except ConversionError as e:
+                job.log(f"\n[Error] 转换失败: {e}")
+                job._finish("failed", error=str(e))
+            except Exception as e:
+                job.log(f"\n[Error] 转换异常: {e!r}")
+                job._finish("failed", error=repr(e))
+            else:
+                job.log(f"\n====== 转换成功! ({time.time() - start:.1f} s) ======")
+                job._finish("done", result=entry)
+
+
+def select_engine(entry, config_path):
+    """
+    把引擎产物设为 config.yaml 中的当前模型 (engine_file / onnx_file / 输入尺寸 / batch)
+    逐行替换顶层键的值，保留文件中的注释和其余内容
+    """
+    values = {"engine_file": json.dumps(entry["path"]), "onnx_file": json.dumps(entry["onnx"]),
+              "IMAGE_WIDTH": str(entry["imgsz"]), "IMAGE_HEIGHT": str(entry["imgsz"]),
+              "BATCH_SIZE": str(entry["batch"])}
+    with open(config_path, "r", encoding="utf-8") as f:
+        lines = f.read().split("\n")
+    for i, line in enumerate(lines):
+        match = re.match(r"^([A-Za-z_]+):(\s*)([^#]*?)(\s*#.*)?$", line)
+        if match and match.group(1) in values:
+            key, space, _, comment = match.groups()
+            lines[i] = f"{key}:{space or ' '}{values.pop(key)}{comment or ''}"
+    text = "\n".join(lines)
+    for key, value in values.items():
+        text = text.rstrip("\n") + f"\n{key}: {value}\n"
+    with open(config_path, "w", encoding="utf-8") as f:
+        f.write(text)
@@ -0,0 +1,143 @@
+#ifndef V5lite_TRT_PIPELINE_H
+#define V5lite_TRT_PIPELINE_H
+
+#include <algorithm>
+#include <condition_variable>
+#include <mutex>
+#include <vector>
+
+// 流水线各阶段之间的有界阻塞队列
+// Push 在队列满时阻塞 (反压)，Close 之后 Push 失败，Pop 取完剩余元素后返回 false
+// 每次 Push / Pop 时采样队列长度，用于统计平均 / 最大占用，判断哪个阶段是瓶颈
+// 元素存放在构造时分配好的环形数组中，Push / Pop 本身不再分配内存
+template <class T>
+class BoundedQueue
+{
+public:
+    explicit BoundedQueue(size_t capacity) : capacity(capacity > 0 ? capacity : 1), slots(this->capacity) {}
+
+    bool Push(T item) {
+        std::unique_lock<std::mutex> lock(mutex);
+        not_full.wait(lock, [this] { return closed || count < capacity; });
+        if (closed)
+            return false;
+        slots[(head + count) % capacity] = std::move(item);
+        count++;
+        sample();
+        not_empty.notify_one();
+        return true;
+    }
+
+    bool Pop(T &item) {
+        std::unique_lock<std::mutex> lock(mutex);
+        not_empty.wait(lock, [this] { return closed || count > 0; });
+        if (count == 0)
+            return false;
+        sample();
+        item = std::move(slots[head]);
+        head = (head + 1) % capacity;
+        count--;
+        not_full.notify_one();
+        return true;
+    }
+
+    void Close() {
+        std::lock_guard<std::mutex> lock(mutex);
+        closed = true;
+        not_empty.notify_all();
+        not_full.notify_all();
+    }
+
+    size_t Capacity() const { return capacity; }
+
+    float AverageOccupancy() {
+        std::lock_guard<std::mutex> lock(mutex);
+        return samples > 0 ? float(occupancy_sum) / samples : 0.f;
+    }
+
+    size_t MaxOccupancy() {
+        std::lock_guard<std::mutex> lock(mutex);
+        return max_occupancy;
+    }
+
+private:
+    void sample() {
+        occupancy_sum += count;
+        samples++;
+        if (count > max_occupancy)
+            max_occupancy = count;
+    }
+
+    size_t capacity;
+    std::vector<T> slots;
+    size_t head = 0;
+    size_t count = 0;
+    bool closed = false;
+    std::mutex mutex;
+    std::condition_variable not_empty;
+    std::condition_variable not_full;
+    size_t occupancy_sum = 0;
+    size_t samples = 0;
+    size_t max_occupancy = 0;
+};
+
+// 多个工作线程从 jobs 取任务、从 buffers 取缓冲区: 两步在同一把锁下完成，先取缓冲区再取任务
+// 缓冲区因此按任务顺序分配。下游按 seq 重排 (InOrder) 时，最早的未完成任务一定已经拿到缓冲区，
+// 不会出现缓冲区全被后面的任务占住、最早的任务等不到缓冲区而整条流水线停住的情况
+template <class Job, class Buffer>
+class OrderedTake
+{
+public:
+    OrderedTake(BoundedQueue<Job> &jobs, BoundedQueue<Buffer> &buffers) : jobs(jobs), buffers(buffers) {}
+
+    // jobs 取完或任一队列关闭时返回 false，已取出的缓冲区放回 buffers
+    bool Take(Job &job, Buffer &buffer) {
+        std::lock_guard<std::mutex> lock(mutex);
+        if (!buffers.Pop(buffer))
+            return false;
+        if (!jobs.Pop(job)) {
+            buffers.Push(std::move(buffer));
+            return false;
+        }
+        return true;
+    }
+
+private:
+    BoundedQueue<Job> &jobs;
+    BoundedQueue<Buffer> &buffers;
+    std::mutex mutex;
+};
+
+// 按 seq (从 0 连续编号) 依次取出: 多个线程完成的顺序不定，先到的暂存在 pending 中
+// 暂存数受上游在途的缓冲区数限制
+template <class T>
+class InOrder
+{
+public:
+    explicit InOrder(BoundedQueue<T> &queue) : queue(queue) {}
+
+    bool Pop(T &item) {
+        while (true) {
+            auto found = std::find_if(pending.begin(), pending.end(), [this](const T &p) { return p.seq == next; });
+            if (found != pending.end()) {
+                item = std::move(*found);
+                pending.erase(found);
+                break;
+            }
+            if (!queue.Pop(item))
+                return false;
+            if (item.seq == next)
+                break;
+            pending.push_back(std::move(item));
+        }
+        next++;
+        return true;
+    }
+
+private:
+    BoundedQueue<T> &queue;
+    std::vector<T> pending;
+    int next = 0;
+};
+
+#endif //V5lite_TRT_PIPELINE_H
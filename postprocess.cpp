@@ -0,0 +1,240 @@
+#include "postprocess.h"
+#include <algorithm>
+#include <cmath>
+#include <cstdio>
+#include <map>
+
+std::vector<V5lite::DecodeLevel> buildDecodeLevels(const std::vector<std::vector<int>> &grids,
+                                           const std::vector<std::vector<int>> &anchors) {
+    std::vector<V5lite::DecodeLevel> levels;
+    int position = 0;
+    for (int n = 0; n < (int)grids.size(); n++)
+        for (int c = 0; c < grids[n][0]; c++)
+        {
+            const std::vector<int> &anchor = anchors[n * grids[n][0] + c];
+            levels.push_back({position, grids[n][1], grids[n][2], anchor[0], anchor[1]});
+            position += grids[n][1] * grids[n][2];
+        }
+    return levels;
+}
+
+void decodeOutput(const float *out, const std::vector<V5lite::DecodeLevel> &levels, int category, int width,
+                  int height, float obj_threshold, float ratio, int top_k, std::vector<V5lite::DetectRes> &result) {
+    const int row_size = category + 5;
+    result.clear();
+    for (const V5lite::DecodeLevel &level : levels)
+    {
+        const int cells = level.grid_h * level.grid_w;
+        const float *obj = out + level.start * row_size + 4;
+        for (int i = 0; i < cells; i++)
+        {
+            // 类别分数在 [0, 1]，prob = obj * cls <= obj，objectness 不过阈值的格子可以直接跳过
+            if (obj[i * row_size] < obj_threshold)
+                continue;
+            const float *row = out + (level.start + i) * row_size;
+            const float *cls = row + 5;
+            int best = 0;
+            for (int k = 1; k < category; k++)
+                if (cls[k] > cls[best])
+                    best = k;
+            V5lite::DetectRes box;
+            box.prob = row[4] * cls[best];
+            if (box.prob < obj_threshold)
+                continue;
+            int h = i / level.grid_w;
+            int w = i % level.grid_w;
+            box.classes = best;
+            // 保持与旧实现相同的运算顺序和精度 (double)，结果逐位一致
+            box.x = (row[0] * 2 - 0.5 + w) / level.grid_w * width * ratio;
+            box.y = (row[1] * 2 - 0.5 + h) / level.grid_h * height * ratio;
+            double tw = row[2] * 2;
+            double th = row[3] * 2;
+            box.w = tw * tw * level.anchor_w * ratio;
+            box.h = th * th * level.anchor_h * ratio;
+            box.w = box.w < box.h ? box.w : box.h;
+            box.h = box.w < box.h ? box.w : box.h;
+            result.push_back(box);
+        }
+    }
+    if (top_k > 0 && (int)result.size() > top_k)
+    {
+        std::partial_sort(result.begin(), result.begin() + top_k, result.end(),
+                          [](const V5lite::DetectRes &left, const V5lite::DetectRes &right) {
+                              return left.prob > right.prob;
+                          });
+        result.resize(top_k);
+    }
+}
+
+void decodeOutputReference(const float *out, const std::vector<std::vector<int>> &grids,
+                           const std::vector<std::vector<int>> &anchors, int category, int width, int height,
+                           float obj_threshold, float ratio, std::vector<V5lite::DetectRes> &result) {
+    result.clear();
+    int position = 0;
+    for (int n = 0; n < (int)grids.size(); n++)
+    {
+        for (int c = 0; c < grids[n][0]; c++)
+        {
+            std::vector<int> anchor = anchors[n * grids[n][0] + c];
+            for (int h = 0; h < grids[n][1]; h++)
+                for (int w = 0; w < grids[n][2]; w++)
+                {
+                    const float *row = out + position * (category + 5);
+                    position++;
+                    V5lite::DetectRes box;
+                    auto max_pos = std::max_element(row + 5, row + category + 5);
+                    box.prob = row[4] * row[max_pos - row];
+                    if (box.prob < obj_threshold)
+                        continue;
+                    box.classes = max_pos - row - 5;
+                    box.x = (row[0] * 2 - 0.5 + w) / grids[n][2] * width * ratio;
+                    box.y = (row[1] * 2 - 0.5 + h) / grids[n][1] * height * ratio;
+                    box.w = pow(row[2] * 2, 2) * anchor[0] * ratio;
+                    box.h = pow(row[3] * 2, 2) * anchor[1] * ratio;
+                    box.w = box.w < box.h ? box.w : box.h;
+                    box.h = box.w < box.h ? box.w : box.h;
+                    result.push_back(box);
+                }
+        }
+    }
+}
+
+float boxIoU(const V5lite::DetectRes &det_a, const V5lite::DetectRes &det_b, bool diou) {
+    cv::Point2f center_a(det_a.x, det_a.y);
+    cv::Point2f center_b(det_b.x, det_b.y);
+    cv::Point2f left_up(std::min(det_a.x - det_a.w / 2, det_b.x - det_b.w / 2),
+                        std::min(det_a.y - det_a.h / 2, det_b.y - det_b.h / 2));
+    cv::Point2f right_down(std::max(det_a.x + det_a.w / 2, det_b.x + det_b.w / 2),
+                           std::max(det_a.y + det_a.h / 2, det_b.y + det_b.h / 2));
+    float distance_d = (center_a - center_b).x * (center_a - center_b).x + (center_a - center_b).y * (center_a - center_b).y;
+    float distance_c = (left_up - right_down).x * (left_up - right_down).x + (left_up - right_down).y * (left_up - right_down).y;
+    float inter_l = det_a.x - det_a.w / 2 > det_b.x - det_b.w / 2 ? det_a.x - det_a.w / 2 : det_b.x - det_b.w / 2;
+    float inter_t = det_a.y - det_a.h / 2 > det_b.y - det_b.h / 2 ? det_a.y - det_a.h / 2 : det_b.y - det_b.h / 2;
+    float inter_r = det_a.x + det_a.w / 2 < det_b.x + det_b.w / 2 ? det_a.x + det_a.w / 2 : det_b.x + det_b.w / 2;
+    float inter_b = det_a.y + det_a.h / 2 < det_b.y + det_b.h / 2 ? det_a.y + det_a.h / 2 : det_b.y + det_b.h / 2;
+    if (inter_b < inter_t || inter_r < inter_l)
+        return 0;
+    float inter_area = (inter_b - inter_t) * (inter_r - inter_l);
+    float union_area = det_a.w * det_a.h + det_b.w * det_b.h - inter_area;
+    if (union_area == 0)
+        return 0;
+    if (!diou)
+        return inter_area / union_area;
+    return inter_area / union_area - distance_d / distance_c;
+}
+
+static void sortByScore(std::vector<V5lite::DetectRes> &detections) {
+    sort(detections.begin(), detections.end(), [=](const V5lite::DetectRes &left, const V5lite::DetectRes &right) {
+        return left.prob > right.prob;
+    });
+}
+
+// 已按得分排序的框两两比较，被抑制的框 prob 置 0 后删除
+static void pairwiseSuppress(std::vector<V5lite::DetectRes> &detections, float nms_threshold, bool diou) {
+    for (int i = 0; i < (int)detections.size(); i++)
+        for (int j = i + 1; j < (int)detections.size(); j++)
+        {
+            if (detections[i].classes == detections[j].classes)
+            {
+                float iou = boxIoU(detections[i], detections[j], diou);
+                if (iou > nms_threshold)
+                    detections[j].prob = 0;
+            }
+        }
+
+    detections.erase(std::remove_if(detections.begin(), detections.end(), [](const V5lite::DetectRes &det)
+    { return det.prob == 0; }), detections.end());
+}
+
+void nmsBoxes(std::vector<V5lite::DetectRes> &detections, float nms_threshold, bool diou, int max_det) {
+    NmsScratch scratch;
+    nmsBoxes(detections, nms_threshold, diou, max_det, scratch);
+}
+
+void nmsBoxes(std::vector<V5lite::DetectRes> &detections, float nms_threshold, bool diou, int max_det,
+              NmsScratch &scratch) {
+    typedef NmsScratch::SweepBox SweepBox;
+    sortByScore(detections);
+    // 阈值为负时不相交的框也会互相抑制，无法按空间剪枝
+    if (nms_threshold < 0) {
+        pairwiseSuppress(detections, nms_threshold, diou);
+    } else {
+        const int count = detections.size();
+        std::vector<char> &suppressed = scratch.suppressed;
+        suppressed.assign(count, 0);
+
+        // 按类别分桶 (下标为类别号)，桶内保持得分顺序；桶只清空不释放
+        std::vector<std::vector<SweepBox>> &buckets = scratch.buckets;
+        for (std::vector<SweepBox> &bucket : buckets)
+            bucket.clear();
+        for (int i = 0; i < count; i++) {
+            const V5lite::DetectRes &det = detections[i];
+            if (det.classes >= (int)buckets.size())
+                buckets.resize(det.classes + 1);
+            buckets[det.classes].push_back({det.x - det.w / 2, det.y - det.h / 2, det.x + det.w / 2,
+                                            det.y + det.h / 2, i});
+        }
+
+        std::vector<SweepBox> &active = scratch.active;
+        for (std::vector<SweepBox> &boxes : buckets) {
+            std::sort(boxes.begin(), boxes.end(), [](const SweepBox &a, const SweepBox &b) {
+                return a.left < b.left;
+            });
+            active.clear();
+            for (const SweepBox &box : boxes) {
+                // 右边界已在当前框左边的框不可能再与之后的框相交
+                size_t kept = 0;
+                for (size_t k = 0; k < active.size(); k++)
+                    if (!(active[k].right < box.left))
+                        active[kept++] = active[k];
+                active.resize(kept);
+
+                for (const SweepBox &other : active) {
+                    if (other.bottom < box.top || box.bottom < other.top)
+                        continue;
+                    // 抑制与被抑制框自身是否已被抑制无关，只看得分高低
+                    int high = std::min(box.rank, other.rank);
+                    int low = std::max(box.rank, other.rank);
+                    if (suppressed[low])
+                        continue;
+                    if (boxIoU(detections[high], detections[low], diou) > nms_threshold)
+                        suppressed[low] = 1;
+                }
+                active.push_back(box);
+            }
+        }
+        for (int i = 0; i < count; i++)
+            if (suppressed[i])
+                detections[i].prob = 0;
+        detections.erase(std::remove_if(detections.begin(), detections.end(), [](const V5lite::DetectRes &det)
+        { return det.prob == 0; }), detections.end());
+    }
+    if (max_det > 0 && (int)detections.size() > max_det)
+        detections.resize(max_det);
+}
+
+void nmsBoxesReference(std::vector<V5lite::DetectRes> &detections, float nms_threshold, bool diou) {
+    sortByScore(detections);
+    pairwiseSuppress(detections, nms_threshold, diou);
+}
+
+std::string labelName(const std::map<int, std::string> &labels, int classes) {
+    auto iter = labels.find(classes);
+    return iter == labels.end() ? std::to_string(classes) : iter->second;
+}
+
+void drawDetections(cv::Mat &img, const std::vector<V5lite::DetectRes> &detections,
+                    const std::map<int, std::string> &labels, const std::vector<cv::Scalar> &colors) {
+    for (const auto &rect : detections) {
+        char t[256];
+        sprintf(t, "%.2f", rect.prob);
+        std::string name = labelName(labels, rect.classes) + "-" + t;
+        if (rect.track_id >= 0)
+            name = "#" + std::to_string(rect.track_id) + " " + name;
+
+        cv::putText(img, name, cv::Point(rect.x - rect.w / 2, rect.y - rect.h / 2 - 5), cv::FONT_HERSHEY_COMPLEX, 0.7,
+                    colors[rect.classes], 2);
+        cv::Rect rst(rect.x - rect.w / 2, rect.y - rect.h / 2, rect.w, rect.h);
+        cv::rectangle(img, rst, colors[rect.classes], 2, cv::LINE_8, 0);
+    }
+}
@@ -0,0 +1,59 @@
+#ifndef V5lite_TRT_POSTPROCESS_H
+#define V5lite_TRT_POSTPROCESS_H
+
+#include <map>
+#include <string>
+#include <vector>
+#include "v5lite.h"
+
+// 把 grids / anchors 展开成按输出顺序排列的 DecodeLevel 平铺数组
+std::vector<V5lite::DecodeLevel> buildDecodeLevels(const std::vector<std::vector<int>> &grids,
+                                                   const std::vector<std::vector<int>> &anchors);
+
+// 解码单张图的原始输出: 先只看 objectness (row[4])，过阈值的格子才扫类别分数并计算框
+// ratio 为原图相对网络输入的缩放；top_k > 0 时只保留得分最高的 top_k 个候选 (按得分降序)
+void decodeOutput(const float *out, const std::vector<V5lite::DecodeLevel> &levels, int category, int width,
+                  int height, float obj_threshold, float ratio, int top_k, std::vector<V5lite::DetectRes> &result);
+
+// 旧版逐格解码，仅用于对拍和基准测试
+void decodeOutputReference(const float *out, const std::vector<std::vector<int>> &grids,
+                           const std::vector<std::vector<int>> &anchors, int category, int width, int height,
+                           float obj_threshold, float ratio, std::vector<V5lite::DetectRes> &result);
+
+// 两个框的 IoU；diou 为 true 时减去中心距离项 (DIoU)，不相交时返回 0
+float boxIoU(const V5lite::DetectRes &det_a, const V5lite::DetectRes &det_b, bool diou = true);
+
+// nmsBoxes 的临时缓冲区: 按类别号索引的分桶和扫描状态，同一个 scratch 跨调用复用时不再重复分配
+struct NmsScratch{
+    // 扫描用的轴对齐包围盒，rank 为框在得分排序中的位置
+    struct SweepBox{
+        float left;
+        float top;
+        float right;
+        float bottom;
+        int rank;
+    };
+    std::vector<char> suppressed;
+    std::vector<std::vector<SweepBox>> buckets;
+    std::vector<SweepBox> active;
+};
+
+// NMS: 按得分降序排序后，同类中与任意一个得分更高的框重叠超过 nms_threshold 的框被抑制
+// 按类别分桶，桶内按左边界排序扫描，只对包围盒相交的框对计算 IoU，结果与 nmsBoxesReference 完全一致
+// max_det > 0 时最多保留 max_det 个框
+void nmsBoxes(std::vector<V5lite::DetectRes> &detections, float nms_threshold, bool diou = true, int max_det = 0);
+// 同上，临时缓冲区用 scratch 中的 (逐帧调用时传入同一个 scratch)
+void nmsBoxes(std::vector<V5lite::DetectRes> &detections, float nms_threshold, bool diou, int max_det,
+              NmsScratch &scratch);
+
+// 旧版两两比较的 NMS (O(n^2))，仅用于对拍和基准测试
+void nmsBoxesReference(std::vector<V5lite::DetectRes> &detections, float nms_threshold, bool diou = true);
+
+// 类别名，labels 中没有时用类别号
+std::string labelName(const std::map<int, std::string> &labels, int classes);
+
+// 在原图上画出检测框和 "类别-得分" 标签 (跟踪框前加 "#轨迹号")，colors 按类别号索引
+void drawDetections(cv::Mat &img, const std::vector<V5lite::DetectRes> &detections,
+                    const std::map<int, std::string> &labels, const std::vector<cv::Scalar> &colors);
+
+#endif //V5lite_TRT_POSTPROCESS_H
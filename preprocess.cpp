@@ -0,0 +1,173 @@
+#include "preprocess.h"
+#include <cstring>
+
+static float letterboxRatio(const cv::Mat &img, int width, int height) {
+    return float(width) / float(img.cols) < float(height) / float(img.rows) ? float(width) / float(img.cols)
+                                                                             : float(height) / float(img.rows);
+}
+
+// 尺寸已经合适 (缩放比为 1) 的图直接引用原图，不经过缩放缓存
+static bool keepsSize(const cv::Mat &img, int width, int height) {
+    float ratio = letterboxRatio(img, width, height);
+    return cv::saturate_cast<int>(img.cols * ratio) == img.cols && cv::saturate_cast<int>(img.rows * ratio) == img.rows;
+}
+
+size_t inputElementSize(InputType type) {
+    switch (type) {
+        case InputType::Float16:
+            return 2;
+        case InputType::Uint8:
+            return 1;
+        default:
+            return sizeof(float);
+    }
+}
+
+const char *inputTypeName(InputType type) {
+    switch (type) {
+        case InputType::Float16:
+            return "fp16";
+        case InputType::Uint8:
+            return "uint8";
+        default:
+            return "fp32";
+    }
+}
+
+// 每个像素值 (0~255) 对应的输入元素，只有 256 种取值，查表代替逐元素的乘法和类型转换
+// 半精度表由 float 表经 convertTo(CV_16F) 得到，与 FP32 路径再转半精度的结果逐位一致
+struct InputTables {
+    float f32[256];
+    uint16_t f16[256];
+    uint8_t u8[256];
+
+    InputTables() {
+        const float scale = 1.0f / 255;
+        for (int v = 0; v < 256; v++) {
+            f32[v] = v * scale;
+            u8[v] = uint8_t(v);
+        }
+        cv::Mat(1, 256, CV_32F, f32).convertTo(cv::Mat(1, 256, CV_16F, f16), CV_16F);
+    }
+};
+
+static const InputTables &inputTables() {
+    static const InputTables tables;
+    return tables;
+}
+
+template <typename T>
+static void letterboxRows(const std::vector<cv::Mat> &images, const std::vector<cv::Mat> &resized, T *dst,
+                          const T *table, int width, int height) {
+    const int batch = images.size();
+    const size_t channelLength = size_t(width) * height;
+    // 归一化 + 通道交换 + 转 CHW 合成一趟，每个任务处理一行
+    cv::parallel_for_(cv::Range(0, batch * height), [&](const cv::Range &range) {
+        for (int r = range.start; r < range.end; r++) {
+            int b = r / height;
+            int y = r % height;
+            T *plane_r = dst + (size_t(b) * 3 + 0) * channelLength + size_t(y) * width;
+            T *plane_g = dst + (size_t(b) * 3 + 1) * channelLength + size_t(y) * width;
+            T *plane_b = dst + (size_t(b) * 3 + 2) * channelLength + size_t(y) * width;
+            const cv::Mat *img = nullptr;
+            if (images[b].data)
+                img = keepsSize(images[b], width, height) ? &images[b] : &resized[b];
+            int cols = 0;
+            if (img && y < img->rows) {
+                cols = std::min(img->cols, width);
+                const uchar *p = img->ptr<uchar>(y);
+                for (int x = 0; x < cols; x++, p += 3) {
+                    plane_b[x] = table[p[0]];
+                    plane_g[x] = table[p[1]];
+                    plane_r[x] = table[p[2]];
+                }
+            }
+            // letterbox 填充区域 (三种类型的 0 都是全 0 字节)
+            size_t pad = (width - cols) * sizeof(T);
+            std::memset(plane_r + cols, 0, pad);
+            std::memset(plane_g + cols, 0, pad);
+            std::memset(plane_b + cols, 0, pad);
+        }
+    });
+}
+
+void letterboxCHW(const std::vector<cv::Mat> &images, void *dst, InputType type, int width, int height,
+                  std::vector<cv::Mat> &resized) {
+    const int batch = images.size();
+    if (resized.size() < images.size())
+        resized.resize(images.size());
+
+    // 缩放: 尺寸已经合适时直接引用原图，不再拷贝；缩放结果写入复用的 resized，尺寸不变时不重新分配
+    for (int b = 0; b < batch; b++) {
+        const cv::Mat &src_img = images[b];
+        if (!src_img.data)
+            continue;
+        CV_Assert(src_img.type() == CV_8UC3);
+        if (!keepsSize(src_img, width, height)) {
+            float ratio = letterboxRatio(src_img, width, height);
+            cv::resize(src_img, resized[b], cv::Size(), ratio, ratio);
+        }
+    }
+
+    const InputTables &tables = inputTables();
+    switch (type) {
+        case InputType::Float16:
+            letterboxRows(images, resized, static_cast<uint16_t *>(dst), tables.f16, width, height);
+            break;
+        case InputType::Uint8:
+            letterboxRows(images, resized, static_cast<uint8_t *>(dst), tables.u8, width, height);
+            break;
+        default:
+            letterboxRows(images, resized, static_cast<float *>(dst), tables.f32, width, height);
+            break;
+    }
+}
+
+// 一维上的 tile 个数，第 i 个 tile 的起点在 [0, length - tile] 上均匀分布
+static int tileCount(int length, int tile, float overlap) {
+    if (length <= tile)
+        return 1;
+    int step = std::max(1, int(tile * (1.f - overlap)));
+    return (length - tile + step - 1) / step + 1;
+}
+
+static int tileStart(int length, int tile, int count, int i) {
+    return count > 1 ? int(int64_t(length - tile) * i / (count - 1)) : 0;
+}
+
+void tileGrid(const cv::Size &image, const cv::Size &tile, float overlap, std::vector<cv::Rect> &rects) {
+    rects.clear();
+    int width = std::min(tile.width, image.width);
+    int height = std::min(tile.height, image.height);
+    int rows = tileCount(image.height, tile.height, overlap);
+    int cols = tileCount(image.width, tile.width, overlap);
+    for (int r = 0; r < rows; r++)
+        for (int c = 0; c < cols; c++)
+            rects.push_back(cv::Rect(tileStart(image.width, tile.width, cols, c),
+                                     tileStart(image.height, tile.height, rows, r), width, height));
+}
+
+void letterboxCHWReference(const std::vector<cv::Mat> &images, float *dst, int width, int height) {
+    int index = 0;
+    for (const cv::Mat &src_img : images)
+    {
+        if (!src_img.data)
+            continue;
+        float ratio = letterboxRatio(src_img, width, height);
+        cv::Mat flt_img = cv::Mat::zeros(cv::Size(width, height), CV_8UC3);
+        cv::Mat rsz_img;
+        cv::resize(src_img, rsz_img, cv::Size(), ratio, ratio);
+        rsz_img.copyTo(flt_img(cv::Rect(0, 0, rsz_img.cols, rsz_img.rows)));
+        flt_img.convertTo(flt_img, CV_32FC3, 1.0 / 255);
+
+        //HWC TO CHW
+        int channelLength = width * height;
+        std::vector<cv::Mat> split_img = {
+                cv::Mat(height, width, CV_32FC1, dst + channelLength * (index + 2)),
+                cv::Mat(height, width, CV_32FC1, dst + channelLength * (index + 1)),
+                cv::Mat(height, width, CV_32FC1, dst + channelLength * index)
+        };
+        index += 3;
+        cv::split(flt_img, split_img);
+    }
+}
@@ -0,0 +1,34 @@
+#ifndef V5lite_TRT_PREPROCESS_H
+#define V5lite_TRT_PREPROCESS_H
+
+#include <cstddef>
+#include <cstdint>
+#include <vector>
+#include <opencv2/opencv.hpp>
+
+// 网络输入绑定的数据类型，由后端按引擎 (TensorRT 的 getTensorDataType) 决定
+// Float16 为 Float32 结果按 IEEE 半精度舍入 (与 convertTo(CV_16F) 逐位一致)；
+// Uint8 直接写 0~255 的像素，除以 255 由网络内部完成
+enum class InputType { Float32, Float16, Uint8 };
+size_t inputElementSize(InputType type);
+const char *inputTypeName(InputType type);
+
+// 网络输入的前处理: 等比缩放贴到左上角 (右下补 0)，除以 255，BGR→RGB，HWC→CHW
+// 每张图只 resize 一次，之后一趟遍历查表直接写出 3 个平面，按 (batch, 行) 并行
+// dst 至少 images.size() * 3 * height * width 个 type 元素，可以是复用的 (pinned) 缓冲区
+// resized 为各 batch 位置的缩放缓存，跨调用复用以避免重复分配
+void letterboxCHW(const std::vector<cv::Mat> &images, void *dst, InputType type, int width, int height,
+                  std::vector<cv::Mat> &resized);
+inline void letterboxCHW(const std::vector<cv::Mat> &images, float *dst, int width, int height,
+                         std::vector<cv::Mat> &resized) {
+    letterboxCHW(images, dst, InputType::Float32, width, height, resized);
+}
+
+// 切片推理的 tile 网格: 按 overlap 比例重叠铺满整图，首尾 tile 贴齐图像边缘 (实际重叠不小于 overlap)
+// 图像在某一维上不大于 tile 时该维只有一个 tile (宽 / 高取图像尺寸)；结果按行写入 rects (先清空，复用容量)
+void tileGrid(const cv::Size &image, const cv::Size &tile, float overlap, std::vector<cv::Rect> &rects);
+
+// 旧版实现 (zeros + resize + copyTo + convertTo + split)，仅用于对拍和基准测试
+void letterboxCHWReference(const std::vector<cv::Mat> &images, float *dst, int width, int height);
+
+#endif //V5lite_TRT_PREPROCESS_H
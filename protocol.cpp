@@ -0,0 +1,251 @@
+#include "protocol.h"
+#include "yaml-cpp/yaml.h"
+#include <cstdio>
+#include <map>
+
+static std::string formatFloat(float value, int precision) {
+    char t[64];
+    snprintf(t, sizeof(t), "%.*f", precision, value);
+    return t;
+}
+
+static void parseFields(const YAML::Node &node, WebuiRequest &request) {
+    if (node["v"])
+        request.version = node["v"].as<int>();
+    if (node["id"])
+        request.id = node["id"].as<std::string>();
+    request.op = node["op"] ? node["op"].as<std::string>() : "infer";
+    if (node["path"])
+        request.path = node["path"].as<std::string>();
+    if (node["shm"])
+        request.shm = node["shm"].as<std::string>();
+    if (node["size"])
+        request.size = node["size"].as<size_t>();
+    if (node["width"])
+        request.width = node["width"].as<int>();
+    if (node["height"])
+        request.height = node["height"].as<int>();
+    if (node["output_shm"])
+        request.output_shm = node["output_shm"].as<std::string>();
+    if (node["render"])
+        request.render = node["render"].as<bool>() ? 1 : 0;
+    if (node["stream"]) {
+        // 允许 true/false 或每隔多少帧回传一次
+        std::string stream = node["stream"].as<std::string>();
+        request.stream = stream == "true" ? 1 : stream == "false" ? 0 : node["stream"].as<int>();
+    }
+    if (node["preview_width"])
+        request.preview_width = node["preview_width"].as<int>();
+    if (node["target"])
+        request.target = node["target"].as<std::string>();
+    if (node["output_dir"])
+        request.output_dir = node["output_dir"].as<std::string>();
+    if (node["restart"])
+        request.restart = node["restart"].as<bool>();
+}
+
+WebuiRequest parseRequest(const std::string &line) {
+    WebuiRequest request;
+    if (line.empty() || line[0] != '{') {
+        // 旧版协议：整行就是文件路径
+        request.op = line == "exit" ? "exit" : "infer";
+        request.path = line;
+        return request;
+    }
+    try {
+        // JSON 是 YAML 的子集，直接复用 yaml-cpp 解析
+        YAML::Node node = YAML::Load(line);
+        parseFields(node, request);
+        if (node["items"]) {
+            for (size_t i = 0; i < node["items"].size(); i++) {
+                WebuiRequest item;
+                item.id = request.id + "." + std::to_string(i);
+                parseFields(node["items"][i], item);
+                item.op = "infer";
+                request.items.push_back(item);
+            }
+        }
+    } catch (const YAML::Exception &e) {
+        request.error = std::string("malformed request: ") + e.what();
+        return request;
+    }
+    if (request.version > PROTOCOL_VERSION)
+        request.error = "unsupported protocol version " + std::to_string(request.version);
+    return request;
+}
+
+std::string jsonEscape(const std::string &text) {
+    std::string escaped;
+    escaped.reserve(text.size() + 2);
+    for (const char &c : text) {
+        switch (c) {
+            case '"': escaped += "\\\""; break;
+            case '\\': escaped += "\\\\"; break;
+            case '\n': escaped += "\\n"; break;
+            case '\r': escaped += "\\r"; break;
+            case '\t': escaped += "\\t"; break;
+            default:
+                if ((unsigned char)c < 0x20) {
+                    char t[8];
+                    snprintf(t, sizeof(t), "\\u%04x", c);
+                    escaped += t;
+                } else {
+                    escaped += c;
+                }
+        }
+    }
+    return escaped;
+}
+
+static void writeHeader(std::ostream &out, const WebuiRequest &request, bool ok) {
+    out << "{\"v\":" << PROTOCOL_VERSION << ",\"id\":\"" << jsonEscape(request.id) << "\",\"op\":\""
+        << jsonEscape(request.op) << "\",\"ok\":" << (ok ? "true" : "false");
+}
+
+void writeReady(std::ostream &out) {
+    WebuiRequest request;
+    request.op = "ready";
+    writeHeader(out, request, true);
+    out << "}" << std::endl;
+}
+
+void writeError(std::ostream &out, const WebuiRequest &request, const std::string &message) {
+    writeHeader(out, request, false);
+    out << ",\"error\":\"" << jsonEscape(message) << "\"}" << std::endl;
+}
+
+void writeAck(std::ostream &out, const WebuiRequest &request) {
+    writeHeader(out, request, true);
+    out << "}" << std::endl;
+}
+
+void writeReload(std::ostream &out, const WebuiRequest &request, bool engine_reloaded) {
+    writeHeader(out, request, true);
+    out << ",\"engine_reloaded\":" << (engine_reloaded ? "true" : "false") << "}" << std::endl;
+}
+
+void writeBatch(std::ostream &out, const WebuiRequest &request, const std::vector<std::string> &items) {
+    writeHeader(out, request, true);
+    out << ",\"results\":[";
+    for (size_t i = 0; i < items.size(); i++) {
+        std::string item = items[i];
+        while (!item.empty() && item.back() == '\n')
+            item.pop_back();
+        out << (i ? "," : "") << item;
+    }
+    out << "]}" << std::endl;
+}
+
+void writeDetections(std::ostream &out, const V5lite &model, const std::vector<V5lite::DetectRes> &detections) {
+    // bbox 为原图坐标系下的 [left, top, width, height]
+    out << "[";
+    for (size_t i = 0; i < detections.size(); i++) {
+        const auto &det = detections[i];
+        if (i > 0)
+            out << ",";
+        out << "{\"class\":" << det.classes << ",\"label\":\"" << jsonEscape(model.GetLabel(det.classes))
+            << "\",\"score\":" << formatFloat(det.prob, 4) << ",\"bbox\":["
+            << formatFloat(det.x - det.w / 2, 1) << "," << formatFloat(det.y - det.h / 2, 1) << ","
+            << formatFloat(det.w, 1) << "," << formatFloat(det.h, 1) << "]";
+        if (det.track_id >= 0)
+            out << ",\"track\":" << det.track_id;
+        out << "}";
+    }
+    out << "]";
+}
+
+void writeTracks(std::ostream &out, const V5lite &model, const std::vector<V5lite::TrackSummary> &tracks) {
+    out << "[";
+    for (size_t i = 0; i < tracks.size(); i++) {
+        const auto &track = tracks[i];
+        if (i > 0)
+            out << ",";
+        out << "{\"id\":" << track.id << ",\"class\":" << track.classes << ",\"label\":\""
+            << jsonEscape(model.GetLabel(track.classes)) << "\",\"first_frame\":" << track.first_frame
+            << ",\"last_frame\":" << track.last_frame << ",\"hits\":" << track.hits
+            << ",\"max_score\":" << formatFloat(track.max_score, 4)
+            << ",\"mean_score\":" << formatFloat(track.mean_score, 4) << "}";
+    }
+    out << "]";
+}
+
+void writeResult(std::ostream &out, const WebuiRequest &request, const V5lite &model,
+                 const V5lite::InferenceResult &result) {
+    writeHeader(out, request, true);
+    out << ",\"output\":\"" << jsonEscape(result.output_path) << "\"";
+    out << ",\"frames\":" << result.frames;
+    if (result.cancelled)
+        out << ",\"cancelled\":true";
+    if (result.tiles > 0)
+        out << ",\"tiles\":" << result.tiles;
+    if (result.batch > 1)
+        out << ",\"batch\":" << result.batch;
+    if (result.detected_frames > 0 && result.detected_frames < result.frames)
+        out << ",\"detected_frames\":" << result.detected_frames;
+    if (result.output_bytes > 0) {
+        // 结果视频的大小、每分钟视频的字节数和从开始编码到可以播放的时间
+        out << ",\"output_bytes\":" << result.output_bytes;
+        if (result.output_seconds > 0)
+            out << ",\"output_seconds\":" << formatFloat(result.output_seconds, 2) << ",\"bytes_per_minute\":"
+                << int64_t(result.output_bytes * 60.0 / result.output_seconds);
+        out << ",\"playable_ms\":" << formatFloat(result.playable_ms, 1);
+    }
+    if (!result.sidecar.empty()) {
+        // 文件夹: 逐图检测结果文件、按检查点跳过的文件数和读不出的文件数
+        out << ",\"sidecar\":\"" << jsonEscape(result.sidecar) << "\",\"resumed\":" << result.resumed
+            << ",\"unreadable\":" << result.unreadable;
+    }
+    if (!result.output_shm.empty())
+        out << ",\"image\":{\"shm\":\"" << jsonEscape(result.output_shm) << "\",\"width\":"
+            << result.output_size.width << ",\"height\":" << result.output_size.height << ",\"channels\":3}";
+
+    float total = 0;
+    out << ",\"timings\":{";
+    for (const auto &stage : result.timings) {
+        out << "\"" << stage.first << "\":" << formatFloat(stage.second, 3) << ",";
+        // "postprocess.nms" 这类带点的是上一阶段的细分，不重复计入 total
+        if (stage.first.find('.') == std::string::npos)
+            total += stage.second;
+    }
+    out << "\"total\":" << formatFloat(total, 3) << "}";
+    if (result.wall_time > 0)
+        out << ",\"wall\":" << formatFloat(result.wall_time, 3);
+    if (!result.queues.empty()) {
+        out << ",\"queues\":{";
+        for (size_t i = 0; i < result.queues.size(); i++)
+            out << (i ? "," : "") << "\"" << result.queues[i].first << "\":" << formatFloat(result.queues[i].second, 2);
+        out << "}";
+    }
+
+    if (!result.tracks.empty()) {
+        // 每个目标一条轨迹，counts 为各类别的目标数
+        std::map<std::string, int> counts;
+        for (const auto &track : result.tracks)
+            counts[model.GetLabel(track.classes)]++;
+        out << ",\"tracks\":";
+        writeTracks(out, model, result.tracks);
+        out << ",\"counts\":{";
+        for (auto it = counts.begin(); it != counts.end(); ++it)
+            out << (it == counts.begin() ? "" : ",") << "\"" << jsonEscape(it->first) << "\":" << it->second;
+        out << "}";
+    }
+
+    out << ",\"detections\":";
+    writeDetections(out, model, result.detections);
+    out << "}" << std::endl;
+}
+
+void writeProgress(std::ostream &out, const WebuiRequest &request, const V5lite &model, int frame, int frames_total,
+                   float fps, const std::vector<V5lite::DetectRes> &detections, const std::string &preview_shm,
+                   const cv::Size &preview_size) {
+    WebuiRequest progress = request;
+    progress.op = "progress";
+    writeHeader(out, progress, true);
+    out << ",\"frame\":" << frame << ",\"frames_total\":" << frames_total << ",\"fps\":" << formatFloat(fps, 2);
+    if (!preview_shm.empty())
+        out << ",\"preview\":{\"shm\":\"" << jsonEscape(preview_shm) << "\",\"width\":" << preview_size.width
+            << ",\"height\":" << preview_size.height << ",\"channels\":3}";
+    out << ",\"detections\":";
+    writeDetections(out, model, detections);
+    out << "}" << std::endl;
+}
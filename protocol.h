@@ -0,0 +1,78 @@
+#ifndef V5lite_TRT_PROTOCOL_H
+#define V5lite_TRT_PROTOCOL_H
+
+#include <string>
+#include <ostream>
+#include "v5lite.h"
+
+// webui 模式的请求/响应协议 (JSON Lines)
+// 请求: 每行一个 JSON 对象，例如
+//   {"v": 1, "id": "7", "op": "infer", "path": "/abs/path/to/image.jpg"}
+// 图片也可以经共享内存传入/传出，不落盘:
+//   {"v": 1, "id": "8", "op": "infer", "shm": "/in_8", "size": 52133, "output_shm": "/out_8"}
+//   shm/size 为编码后的图片字节；再给出 width/height 时按原始 BGR 帧解释
+//   给出 output_shm 时结果图以原始 BGR 写入该段 (由调用方 unlink)，否则写到 path 旁的 *_ 文件
+// "render": false 时后端不画框、不输出结果图，只回传 detections
+// 视频可流式返回: "stream": N 时每 N 帧 (第一帧总会) 先回一条 op 为 "progress" 的记录 (同一 id)，
+//   含 frame/frames_total/fps/detections，render 时另带 preview (缩到 preview_width 宽的 BGR 帧，共享内存，由调用方 unlink)
+//   最后仍以一条普通响应结束
+// 取消: {"v": 1, "id": "9", "op": "cancel", "target": "7"}，正在处理或排队中的请求 7 提前结束，
+//   其响应带 "cancelled": true；cancel 自身也有一条响应。target 已结束或不存在 (含 batch 内部的 id) 时只回 ack
+// 重新加载配置: {"v": 1, "id": "10", "op": "reload"}，可用 path 指定其他配置文件
+//   阈值、标签、anchors 等就地生效，引擎相关的项变化时才重新加载引擎，响应带 "engine_reloaded"
+// 批量推理: {"v": 1, "id": "11", "op": "batch", "items": [{"id": "a", "shm": ..., "size": ...}, ...]}，
+//   items 中的图片凑成网络 batch 一起推理 (超过 BATCH_SIZE 时分组)，响应的 results 按顺序给出每一项的完整响应，
+//   某一项读图失败只影响该项；各项的 preprocess / execute / postprocess 为整批耗时，batch 为本批图片数
+// 文件夹: infer 的 path 为目录时流式处理其中的全部图片，结果写到 output_dir (可选，默认见 config.yaml 的 output_dir)，
+//   响应的 output 为输出目录，另有 sidecar (detections.jsonl)、resumed (按检查点跳过的文件数)、unreadable；
+//   中断后同样的请求从检查点继续，"restart": true 时从头开始；stream 与 cancel 同视频 (frames_total 为 0)
+// 兼容旧版：非 JSON 的行直接视为 path，op 为 infer，id 为空
+// 响应: stdout 上每个请求恰好一行 JSON，日志全部走 stderr
+// timings 依次为 decode / preprocess / execute / postprocess / draw / encode (ms)，
+//   "execute.h2d"、"postprocess.nms" 这类带点的键是前一阶段的细分耗时，不计入 total
+// 开启切片推理 (config.yaml 的 tile) 且图像大于 tile 时另有 tiles (推理的 tile 总数)
+// 视频跟踪模式 (config.yaml 的 detect_interval / track) 下检测框带 track (轨迹号)，
+//   响应另有 tracks (每个目标的首末帧、匹配次数、得分)、counts (各类别目标数)，隔帧检测时还有 detected_frames
+// 视频请求另有 wall (流水线下实际的单帧耗时) 和 queues (各阶段间队列的平均占用)
+const int PROTOCOL_VERSION = 1;
+
+struct WebuiRequest{
+    int version = PROTOCOL_VERSION;
+    std::string id;
+    std::string op;
+    std::string path;
+    std::string shm;
+    size_t size = 0;
+    int width = 0;
+    int height = 0;
+    std::string output_shm;
+    int render = -1;  // -1 表示沿用 config.yaml 中的 render
+    int stream = 0;
+    int preview_width = 0;
+    std::string target;
+    // 文件夹请求的输出目录 (为空时用 config.yaml 的 output_dir) 和是否忽略检查点从头处理
+    std::string output_dir;
+    bool restart = false;
+    // op 为 batch 时的各项 (普通的单图 infer 请求)
+    std::vector<WebuiRequest> items;
+    std::string error;
+};
+
+WebuiRequest parseRequest(const std::string &line);
+std::string jsonEscape(const std::string &text);
+void writeReady(std::ostream &out);
+void writeError(std::ostream &out, const WebuiRequest &request, const std::string &message);
+void writeDetections(std::ostream &out, const V5lite &model, const std::vector<V5lite::DetectRes> &detections);
+void writeTracks(std::ostream &out, const V5lite &model, const std::vector<V5lite::TrackSummary> &tracks);
+void writeResult(std::ostream &out, const WebuiRequest &request, const V5lite &model,
+                 const V5lite::InferenceResult &result);
+// 视频流式推理的中间记录，preview_shm 为空时不带预览图
+void writeProgress(std::ostream &out, const WebuiRequest &request, const V5lite &model, int frame, int frames_total,
+                   float fps, const std::vector<V5lite::DetectRes> &detections, const std::string &preview_shm,
+                   const cv::Size &preview_size);
+void writeAck(std::ostream &out, const WebuiRequest &request);
+void writeReload(std::ostream &out, const WebuiRequest &request, bool engine_reloaded);
+// batch 请求的响应，items 为各项已写好的响应 (writeResult / writeError 的输出)
+void writeBatch(std::ostream &out, const WebuiRequest &request, const std::vector<std::string> &items);
+
+#endif //V5lite_TRT_PROTOCOL_H
@@ -0,0 +1,89 @@
+#include "session.h"
+#include <atomic>
+#include <cstdlib>
+#include <new>
+
+std::vector<std::vector<V5lite::DetectRes>> &InferSession::Boxes(size_t frames) {
+    // 只增不减: 帧数变少时多出的几份留着 (连同其容量) 给下次用
+    if (boxes.size() < frames) {
+        if (boxes.capacity() < frames)
+            growths++;
+        boxes.resize(frames);
+    }
+    for (size_t i = 0; i < frames; i++)
+        boxes[i].clear();
+    return boxes;
+}
+
+size_t InferSession::Bytes() const {
+    size_t bytes = input.capacity() + output.capacity() * sizeof(float);
+    for (const std::vector<V5lite::DetectRes> &result : boxes)
+        bytes += result.capacity() * sizeof(V5lite::DetectRes);
+    bytes += candidates.capacity() * sizeof(V5lite::DetectRes) + rects.capacity() * sizeof(cv::Rect);
+    bytes += nms.suppressed.capacity() + nms.active.capacity() * sizeof(NmsScratch::SweepBox);
+    for (const std::vector<NmsScratch::SweepBox> &bucket : nms.buckets)
+        bytes += bucket.capacity() * sizeof(NmsScratch::SweepBox);
+    return bytes;
+}
+
+// 常量初始化，早于任何动态初始化中的 new
+static std::atomic<size_t> allocations(0);
+
+size_t allocationCount() {
+    return allocations.load(std::memory_order_relaxed);
+}
+
+#ifdef V5LITE_COUNT_ALLOCS
+bool allocationCounting() {
+    return true;
+}
+
+// 替换全局的 operator new / delete: 只多一次原子加，内存仍由 malloc / free 管理
+void *operator new(std::size_t size) {
+    allocations.fetch_add(1, std::memory_order_relaxed);
+    if (void *p = std::malloc(size ? size : 1))
+        return p;
+    throw std::bad_alloc();
+}
+
+void *operator new[](std::size_t size) {
+    return operator new(size);
+}
+
+void *operator new(std::size_t size, const std::nothrow_t &) noexcept {
+    allocations.fetch_add(1, std::memory_order_relaxed);
+    return std::malloc(size ? size : 1);
+}
+
+void *operator new[](std::size_t size, const std::nothrow_t &tag) noexcept {
+    return operator new(size, tag);
+}
+
+void operator delete(void *p) noexcept {
+    std::free(p);
+}
+
+void operator delete[](void *p) noexcept {
+    std::free(p);
+}
+
+void operator delete(void *p, std::size_t) noexcept {
+    std::free(p);
+}
+
+void operator delete[](void *p, std::size_t) noexcept {
+    std::free(p);
+}
+
+void operator delete(void *p, const std::nothrow_t &) noexcept {
+    std::free(p);
+}
+
+void operator delete[](void *p, const std::nothrow_t &) noexcept {
+    std::free(p);
+}
+#else
+bool allocationCounting() {
+    return false;
+}
+#endif
@@ -0,0 +1,61 @@
+#ifndef V5lite_TRT_SESSION_H
+#define V5lite_TRT_SESSION_H
+
+#include <cstddef>
+#include <cstdint>
+#include <string>
+#include <utility>
+#include <vector>
+#include <opencv2/opencv.hpp>
+#include "v5lite.h"
+#include "postprocess.h"
+
+// 推理会话: 一次推理 (单图 / 多图 batch / 流水线中的一个前处理线程) 用到的 host 缓冲区、中间结果和检测结果容器
+// 由 V5lite 持有，在整个进程生命周期内复用；缓冲区只增不减，输入尺寸和 batch 组成不变时 (稳态) 每帧不再分配内存
+// 显存、执行上下文、stream 和锁页输入由后端 (TrtBackend) 在 Load 时分配，同样一直复用，不在这里管理
+class InferSession
+{
+public:
+    // 至少 bytes 字节的网络输入 (元素类型由后端决定) 和 length 个 float 的输出缓冲区 (多个网络 batch 连续存放)，
+    // 容量不够时才重新分配
+    void *Input(size_t bytes) { return fit(input, bytes); }
+    float *Output(size_t length) { return fit(output, length); }
+    // 至少 frames 份检测结果，前 frames 份已清空并保留上一帧的容量
+    std::vector<std::vector<V5lite::DetectRes>> &Boxes(size_t frames);
+    // 以上缓冲区扩容的次数，稳态下不再增加
+    size_t Growths() const { return growths; }
+    // 当前持有的 host 内存 (字节，不含 Mat 的像素缓存)
+    size_t Bytes() const;
+
+    // 送入检测的帧、tile 视图和 letterbox 的缩放缓存 (Mat 尺寸不变时 resize 直接写入原有内存)
+    std::vector<cv::Mat> frames;
+    std::vector<cv::Mat> views;
+    std::vector<cv::Mat> resized;
+    // 切片网格和单个 tile 的解码结果
+    std::vector<cv::Rect> rects;
+    std::vector<V5lite::DetectRes> candidates;
+    NmsScratch nms;
+    // 后端细分耗时 (h2d / compute / d2h) 的累计
+    std::vector<std::pair<std::string, float>> parts;
+
+private:
+    template <typename T>
+    T *fit(std::vector<T> &buffer, size_t length) {
+        if (buffer.capacity() < length)
+            growths++;
+        buffer.resize(length);
+        return buffer.data();
+    }
+
+    std::vector<uint8_t> input;
+    std::vector<float> output;
+    std::vector<std::vector<V5lite::DetectRes>> boxes;
+    size_t growths = 0;
+};
+
+// 进程内 operator new 的累计调用次数，前后两次相减即为其间的分配次数，用来确认稳态下没有分配
+// 只有编译时定义了 V5LITE_COUNT_ALLOCS (cmake -DCOUNT_ALLOCS=ON，alloc_bench 始终开启) 才计数，否则恒为 0
+size_t allocationCount();
+bool allocationCounting();
+
+#endif //V5lite_TRT_SESSION_H
@@ -0,0 +1,59 @@
+#include "shm_io.h"
+#include <sys/mman.h>
+#include <sys/stat.h>
+#include <fcntl.h>
+#include <unistd.h>
+
+cv::Mat readSharedImage(const std::string &name, size_t size, int width, int height) {
+    if (size == 0)
+        return cv::Mat();
+    if (width > 0 && height > 0 && size != size_t(width) * height * 3) {
+        std::cout << "shared frame size mismatch: " << name << std::endl;
+        return cv::Mat();
+    }
+    int fd = shm_open(name.c_str(), O_RDONLY, 0);
+    if (fd < 0) {
+        std::cout << "shm_open failed: " << name << std::endl;
+        return cv::Mat();
+    }
+    void *addr = mmap(nullptr, size, PROT_READ, MAP_SHARED, fd, 0);
+    close(fd);
+    if (addr == MAP_FAILED) {
+        std::cout << "mmap failed: " << name << std::endl;
+        return cv::Mat();
+    }
+
+    cv::Mat img;
+    if (width > 0 && height > 0) {
+        // 原始帧：拷贝一次到私有内存，后续会在上面画框
+        cv::Mat(height, width, CV_8UC3, addr).copyTo(img);
+    } else {
+        img = cv::imdecode(cv::Mat(1, (int)size, CV_8UC1, addr), cv::IMREAD_COLOR);
+    }
+    munmap(addr, size);
+    return img;
+}
+
+bool writeSharedImage(const std::string &name, const cv::Mat &img) {
+    size_t size = img.total() * img.elemSize();
+    int fd = shm_open(name.c_str(), O_CREAT | O_EXCL | O_RDWR, 0600);
+    if (fd < 0) {
+        std::cout << "shm_open failed: " << name << std::endl;
+        return false;
+    }
+    if (ftruncate(fd, size) != 0) {
+        close(fd);
+        shm_unlink(name.c_str());
+        return false;
+    }
+    void *addr = mmap(nullptr, size, PROT_READ | PROT_WRITE, MAP_SHARED, fd, 0);
+    close(fd);
+    if (addr == MAP_FAILED) {
+        shm_unlink(name.c_str());
+        return false;
+    }
+    cv::Mat dst(img.rows, img.cols, img.type(), addr);
+    img.copyTo(dst);
+    munmap(addr, size);
+    return true;
+}
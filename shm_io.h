@@ -0,0 +1,13 @@
+#ifndef V5lite_TRT_SHM_IO_H
+#define V5lite_TRT_SHM_IO_H
+
+#include <string>
+#include <opencv2/opencv.hpp>
+
+// POSIX 共享内存图像传输，webui 模式下替代临时文件
+// 读取: width/height 大于 0 时按原始 BGR 帧解释，否则按编码后的图片字节 (jpg/png...) 解码
+cv::Mat readSharedImage(const std::string &name, size_t size, int width = 0, int height = 0);
+// 写入: 新建共享内存段并写入连续的 BGR 像素，段由读取方负责 unlink
+bool writeSharedImage(const std::string &name, const cv::Mat &img);
+
+#endif //V5lite_TRT_SHM_IO_H
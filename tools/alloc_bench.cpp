@@ -0,0 +1,142 @@
+// 稳态零分配检查: 按 V5lite 每帧的 CPU 路径 (前处理 -> 解码 -> NMS -> 画框，外加流水线队列的一次往返) 逐帧执行，
+// 缓冲区全部来自 InferSession，统计预热之后每个阶段 operator new 的调用次数，不需要 GPU / 模型
+// 用法: ./alloc_bench [frames] [input_size] [batch] [category] [tile_size]
+// tile_size > 0 时按切片推理的方式把 1080p 帧切成 tile 再前处理
+// 任一阶段在稳态下有分配时返回 1
+// OpenCV 自身的像素缓冲走 cv::fastMalloc (不经过 operator new)，另外检查 Mat 和输入缓冲区的地址在预热后不再变化；
+// OpenCV 并行框架每次调度会 new 任务对象，与本仓库的缓冲区管理无关，这里以单线程运行
+#include <algorithm>
+#include <cstring>
+#include <iostream>
+#include <map>
+#include "../preprocess.h"
+#include "../postprocess.h"
+#include "../pipeline.h"
+#include "../session.h"
+#include "bench_data.h"
+
+struct StageCount{
+    std::string name;
+    size_t allocations;
+};
+
+int main(int argc, char **argv) {
+    int frames = argc > 1 ? atoi(argv[1]) : 200;
+    int size = argc > 2 ? atoi(argv[2]) : 640;
+    int batch = argc > 3 ? atoi(argv[3]) : 4;
+    int category = argc > 4 ? atoi(argv[4]) : 80;
+    int tile_size = argc > 5 ? atoi(argv[5]) : 0;
+    const int warmup = 5;
+    const float obj_threshold = 0.3f;
+    const float nms_threshold = 0.45f;
+    const std::vector<std::vector<int>> anchors = {{10, 13}, {16, 30}, {33, 23}, {30, 61}, {62, 45},
+                                                   {59, 119}, {116, 90}, {156, 198}, {373, 326}};
+    if (!allocationCounting()) {
+        std::cerr << "alloc_bench must be built with V5LITE_COUNT_ALLOCS" << std::endl;
+        return 1;
+    }
+    cv::setNumThreads(1);
+    std::mt19937 rng(42);
+    cv::Mat frame = syntheticFrame(rng);
+    std::vector<std::vector<int>> grids;
+    std::vector<float> network_output = syntheticOutput(rng, size, category, 0.01f, grids);
+    const size_t output_size = network_output.size();
+    std::vector<V5lite::DecodeLevel> levels = buildDecodeLevels(grids, anchors);
+    std::map<int, std::string> labels;
+    std::vector<cv::Scalar> colors(category, cv::Scalar(255, 0, 0));
+
+    InferSession session;
+    std::vector<cv::Mat> sources(batch, frame);
+    std::vector<cv::Mat> canvases(batch);
+    const size_t input_length = size_t(3) * size * size;
+    // 流水线中的输入缓冲区在两个队列之间循环，与 V5lite::RunPipeline 的 free_inputs 相同
+    BoundedQueue<std::vector<float>> free_inputs(2), prepared(2);
+    for (int i = 0; i < 2; i++)
+        free_inputs.Push(std::vector<float>(input_length * batch));
+
+    std::vector<StageCount> stages = {{"preprocess", 0}, {"decode", 0}, {"nms", 0}, {"draw", 0}, {"queue", 0}};
+    const float *input_address = nullptr;
+    std::vector<const uchar *> resized_address;
+    bool stable = true;
+    size_t candidates = 0, kept = 0;
+    for (int f = 0; f < warmup + frames; f++) {
+        bool counted = f >= warmup;
+        size_t mark = allocationCount();
+        auto stage = [&](int index) {
+            size_t now = allocationCount();
+            if (counted)
+                stages[index].allocations += now - mark;
+            mark = now;
+        };
+
+        // 前处理: 整帧 letterbox，或切片后逐 tile letterbox
+        std::vector<cv::Mat> &views = session.views;
+        if (tile_size > 0) {
+            tileGrid(frame.size(), cv::Size(tile_size, tile_size), 0.2f, session.rects);
+            views.resize(session.rects.size());
+            for (size_t i = 0; i < views.size(); i++)
+                views[i] = sources[0](session.rects[i]);
+        } else {
+            session.frames.assign(sources.begin(), sources.end());
+        }
+        const std::vector<cv::Mat> &images = tile_size > 0 ? views : session.frames;
+        float *input = static_cast<float *>(session.Input(input_length * images.size() * sizeof(float)));
+        letterboxCHW(images, input, size, size, session.resized);
+        stage(0);
+
+        // 解码: 每张图一份网络输出 (模拟 D2H 拷贝到会话的输出缓冲区)
+        float *output = session.Output(output_size * images.size());
+        for (size_t i = 0; i < images.size(); i++)
+            std::memcpy(output + i * output_size, network_output.data(), output_size * sizeof(float));
+        std::vector<std::vector<V5lite::DetectRes>> &boxes = session.Boxes(images.size());
+        for (size_t i = 0; i < images.size(); i++) {
+            float ratio = std::max(float(images[i].cols) / size, float(images[i].rows) / size);
+            decodeOutput(output + i * output_size, levels, category, size, size, obj_threshold, ratio, 0, boxes[i]);
+        }
+        candidates = boxes[0].size();
+        stage(1);
+
+        for (size_t i = 0; i < images.size(); i++)
+            nmsBoxes(boxes[i], nms_threshold, true, 0, session.nms);
+        kept = boxes[0].size();
+        stage(2);
+
+        for (int b = 0; b < batch; b++) {
+            sources[b].copyTo(canvases[b]);
+            drawDetections(canvases[b], boxes[std::min<size_t>(b, images.size() - 1)], labels, colors);
+        }
+        stage(3);
+
+        std::vector<float> buffer;
+        free_inputs.Pop(buffer);
+        prepared.Push(std::move(buffer));
+        prepared.Pop(buffer);
+        free_inputs.Push(std::move(buffer));
+        stage(4);
+
+        // 预热之后缓冲区地址不应再变化
+        if (f == warmup - 1) {
+            input_address = input;
+            for (const cv::Mat &mat : session.resized)
+                resized_address.push_back(mat.data);
+        } else if (counted) {
+            stable = stable && input == input_address;
+            for (size_t i = 0; i < resized_address.size(); i++)
+                stable = stable && session.resized[i].data == resized_address[i];
+        }
+    }
+
+    bool ok = stable;
+    std::cerr << frames << " frames after " << warmup << " warm-up, batch " << batch << ", input " << size
+              << (tile_size > 0 ? ", tile " + std::to_string(tile_size) : std::string()) << ", " << candidates
+              << " candidates / " << kept << " kept per image" << std::endl;
+    std::cerr << "stage\tallocations" << std::endl;
+    for (const StageCount &stage : stages) {
+        std::cerr << stage.name << "\t" << stage.allocations << std::endl;
+        ok = ok && stage.allocations == 0;
+    }
+    std::cerr << "session: " << session.Bytes() / 1024 << " KB, " << session.Growths() << " growths, buffers "
+              << (stable ? "stable" : "MOVED") << std::endl;
+    std::cerr << (ok ? "OK: steady state allocates nothing" : "FAILED: steady state allocates") << std::endl;
+    return ok ? 0 : 1;
+}
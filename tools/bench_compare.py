@@ -0,0 +1,68 @@
+#!/usr/bin/env python3
+"""
+对比两次基准测试的 JSON (tools/stage_bench 或 tools/load_bench.py 的输出)，用于提交之间的回归检查
+用法: python tools/bench_compare.py baseline.json current.json [--threshold 10]
+
+逐项比较所有带 p50/p95/p99 的条目 (越小越好) 和 throughput_rps (越大越好)；
+任一条目的 p95 变慢或吞吐下降超过 threshold (%) 时返回 1
+"""
+import argparse
+import json
+import sys
+
+
+def flatten(node, prefix=""):
+    """取出所有分位数条目和吞吐: {路径: 条目}"""
+    found = {}
+    if isinstance(node, dict):
+        if "p50" in node and "p95" in node:
+            found[prefix] = node
+            return found
+        for key, value in node.items():
+            path = f"{prefix}.{key}" if prefix else key
+            if key == "throughput_rps":
+                found[path] = value
+            else:
+                found.update(flatten(value, path))
+    return found
+
+
+def change(old, new):
+    return (new - old) / old * 100.0 if old else 0.0
+
+
+def main():
+    parser = argparse.ArgumentParser(description="对比两次基准测试结果")
+    parser.add_argument("baseline")
+    parser.add_argument("current")
+    parser.add_argument("--threshold", type=float, default=10.0, help="判定回归的变化百分比")
+    args = parser.parse_args()
+    with open(args.baseline, encoding="utf-8") as f:
+        baseline = json.load(f)
+    with open(args.current, encoding="utf-8") as f:
+        current = json.load(f)
+
+    print(f"baseline {baseline.get('commit', args.baseline)}  ->  current {current.get('commit', args.current)}")
+    old_items, new_items = flatten(baseline), flatten(current)
+    regressions = []
+    for path in sorted(set(old_items) & set(new_items)):
+        old, new = old_items[path], new_items[path]
+        if isinstance(old, dict):
+            cells = [f"{q} {old[q]:.3f} -> {new[q]:.3f} ({change(old[q], new[q]):+.1f}%)" for q in ("p50", "p95", "p99")]
+            worse = change(old["p95"], new["p95"]) > args.threshold
+        else:
+            cells = [f"{old:.3f} -> {new:.3f} ({change(old, new):+.1f}%)"]
+            worse = change(old, new) < -args.threshold
+        print(f"{'!' if worse else ' '} {path:<32} " + "  ".join(cells))
+        if worse:
+            regressions.append(path)
+    for path in sorted(set(old_items) ^ set(new_items)):
+        print(f"  {path:<32} (只在{'基线' if path in old_items else '当前'}结果中)")
+    if regressions:
+        print(f"\n{len(regressions)} 项回归超过 {args.threshold}%: {', '.join(regressions)}")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
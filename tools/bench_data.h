@@ -0,0 +1,64 @@
+#ifndef V5lite_TRT_BENCH_DATA_H
+#define V5lite_TRT_BENCH_DATA_H
+
+// tools 下各基准共用的计时、对拍和合成输入，合成数据由调用方传入固定种子的 rng，每次运行完全相同
+#include <chrono>
+#include <random>
+#include <vector>
+#include <opencv2/opencv.hpp>
+#include "../postprocess.h"
+
+// 连续调用 f iterations 次，返回平均每次的耗时 (ms)
+template <class F>
+inline float timeIt(int iterations, F f) {
+    auto t_start = std::chrono::high_resolution_clock::now();
+    for (int i = 0; i < iterations; i++)
+        f();
+    auto t_end = std::chrono::high_resolution_clock::now();
+    return std::chrono::duration<float, std::milli>(t_end - t_start).count() / iterations;
+}
+
+// 两组检测结果逐框逐字段完全相同 (包括顺序)
+inline bool sameBoxes(const std::vector<V5lite::DetectRes> &a, const std::vector<V5lite::DetectRes> &b) {
+    if (a.size() != b.size())
+        return false;
+    for (size_t i = 0; i < a.size(); i++)
+        if (a[i].classes != b[i].classes || a[i].x != b[i].x || a[i].y != b[i].y || a[i].w != b[i].w ||
+            a[i].h != b[i].h || a[i].prob != b[i].prob)
+            return false;
+    return true;
+}
+
+// 合成帧 (默认 1080p): 渐变加噪声
+inline cv::Mat syntheticFrame(std::mt19937 &rng, int width = 1920, int height = 1080) {
+    cv::Mat frame(height, width, CV_8UC3);
+    for (int y = 0; y < frame.rows; y++) {
+        uchar *row = frame.ptr<uchar>(y);
+        for (int x = 0; x < frame.cols * 3; x++)
+            row[x] = uchar((x / 3 + y + int(rng() % 32)) & 255);
+    }
+    return frame;
+}
+
+// 合成 sigmoid 之后的网络输出 (strides 8/16/32，每格 3 个 anchor)，grids 返回对应的输出布局
+// 大部分格子 objectness 低于 0.3，约 positive 比例的格子为正样本
+inline std::vector<float> syntheticOutput(std::mt19937 &rng, int size, int category, float positive,
+                                          std::vector<std::vector<int>> &grids) {
+    std::uniform_real_distribution<float> unit(0.f, 1.f);
+    grids.clear();
+    int rows = 0;
+    for (int stride : {8, 16, 32}) {
+        grids.push_back({3, size / stride, size / stride});
+        rows += 3 * (size / stride) * (size / stride);
+    }
+    std::vector<float> output(size_t(rows) * (category + 5));
+    for (int r = 0; r < rows; r++) {
+        float *row = output.data() + size_t(r) * (category + 5);
+        for (int k = 0; k < category + 5; k++)
+            row[k] = unit(rng);
+        row[4] = unit(rng) < positive ? 0.3f + 0.7f * unit(rng) : 0.3f * unit(rng);
+    }
+    return output;
+}
+
+#endif //V5lite_TRT_BENCH_DATA_H
@@ -0,0 +1,209 @@
+#!/usr/bin/env python3
+"""
+webui 协议的压测工具: 按给定并发数持续向后端池发送图片推理请求，统计端到端延迟和吞吐
+用法: python tools/load_bench.py --concurrency 4 --requests 200 --out bench.json
+      python tools/load_bench.py --exe tools/stub_backend.py     # 无 GPU 时用桩后端验证流程
+
+- 图片取自 samples/ 和 tree/ (跳过结果图 *_.jpg)，按轮询顺序发送
+- 每个客户端线程发完一个请求、收到响应后再发下一个 (闭环)，并发数即同时在途的请求数
+- 结果缓存关闭，每个请求都真正经过后端
+- 输出 JSON: 延迟 p50/p95/p99、吞吐、各阶段 (响应中的 timings) 的分位数，以及提交号和配置，
+  用 tools/bench_compare.py 对比两次结果
+"""
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import threading
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import yaml  # noqa: E402
+
+from trt_service import BackendPool, engine_batch_size, infer_image_bytes, load_webui_config  # noqa: E402
+
+IMAGE_EXTS = (".jpg", ".jpeg", ".png", ".bmp")
+
+
+def percentile(sorted_values, q):
+    """线性插值的分位数，与 tools/stage_bench.cpp 的算法一致"""
+    if not sorted_values:
+        return 0.0
+    pos = q * (len(sorted_values) - 1)
+    lo = int(pos)
+    hi = min(lo + 1, len(sorted_values) - 1)
+    return sorted_values[lo] + (sorted_values[hi] - sorted_values[lo]) * (pos - lo)
+
+
+def summarize(values):
+    values = sorted(values)
+    return {
+        "p50": round(percentile(values, 0.50), 3),
+        "p95": round(percentile(values, 0.95), 3),
+        "p99": round(percentile(values, 0.99), 3),
+        "mean": round(sum(values) / len(values), 3) if values else 0.0,
+        "min": round(values[0], 3) if values else 0.0,
+        "max": round(values[-1], 3) if values else 0.0,
+        "count": len(values),
+    }
+
+
+def collect_images(folders):
+    paths = []
+    for folder in folders:
+        if not os.path.isdir(folder):
+            continue
+        for name in sorted(os.listdir(folder)):
+            stem, ext = os.path.splitext(name)
+            # *_.jpg 是推理输出的结果图
+            if ext.lower() in IMAGE_EXTS and not stem.endswith("_"):
+                paths.append(os.path.join(folder, name))
+    return paths
+
+
+def git_commit():
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, capture_output=True,
+                                text=True).stdout.strip()
+        dirty = subprocess.run(["git", "status", "--porcelain", "--untracked-files=no"], cwd=ROOT,
+                               capture_output=True, text=True).stdout.strip()
+        return commit + ("-dirty" if dirty else "")
+    except OSError:
+        return ""
+
+
+def model_summary(config_path):
+    try:
+        with open(config_path, "r", encoding="utf-8") as f:
+            root = yaml.safe_load(f) or {}
+    except (OSError, yaml.YAMLError):
+        return {}
+    keys = ["backend", "engine_file", "onnx_file", "BATCH_SIZE", "IMAGE_WIDTH", "IMAGE_HEIGHT",
+            "obj_threshold", "nms_threshold"]
+    return {k: root[k] for k in keys if k in root}
+
+
+def run(pool, images, concurrency, total, duration, transport, render):
+    """concurrency 个闭环客户端，发满 total 个请求或到 duration 秒为止"""
+    payloads = []
+    for path in images:
+        with open(path, "rb") as f:
+            payloads.append((path, f.read()))
+    lock = threading.Lock()
+    counter = [0]
+    latencies = []
+    stages = {}
+    errors = []
+
+    def client():
+        while True:
+            with lock:
+                index = counter[0]
+                if (total and index >= total) or (duration and time.time() - start >= duration):
+                    return
+                counter[0] += 1
+            path, data = payloads[index % len(payloads)]
+            t0 = time.perf_counter()
+            if transport == "shm":
+                response, _ = infer_image_bytes(pool, data, render=render)
+            else:
+                response = pool.infer({"op": "infer", "path": os.path.abspath(path), "render": render})
+            elapsed = (time.perf_counter() - t0) * 1000.0
+            with lock:
+                if not response.get("ok"):
+                    errors.append(response.get("error", ""))
+                    continue
+                latencies.append(elapsed)
+                for name, value in response.get("timings", {}).items():
+                    stages.setdefault(name, []).append(value)
+
+    start = time.time()
+    threads = [threading.Thread(target=client) for _ in range(concurrency)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    wall = time.time() - start
+    return {
+        "requests": len(latencies) + len(errors),
+        "errors": len(errors),
+        "error_samples": sorted(set(errors))[:5],
+        "duration_s": round(wall, 3),
+        "throughput_rps": round(len(latencies) / wall, 3) if wall > 0 else 0.0,
+        "latency_ms": summarize(latencies),
+        "stages_ms": {name: summarize(values) for name, values in stages.items()},
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="webui 协议压测")
+    parser.add_argument("--config", default=os.path.join(ROOT, "config.yaml"))
+    parser.add_argument("--exe", default=None, help="后端可执行文件，默认取 config.yaml 的 webui.exe_path")
+    parser.add_argument("--pool-size", type=int, default=None)
+    parser.add_argument("--max-inflight", type=int, default=None)
+    parser.add_argument("--max-batch", type=int, default=None, help="合并 batch 的上限，默认按 config.yaml")
+    parser.add_argument("--batch-wait-ms", type=float, default=None)
+    parser.add_argument("--concurrency", type=int, default=4)
+    parser.add_argument("--requests", type=int, default=200, help="请求总数，0 表示只按 --duration")
+    parser.add_argument("--duration", type=float, default=0.0, help="最长压测秒数，0 表示不限")
+    parser.add_argument("--warmup", type=int, default=10, help="正式计时前的请求数 (不计入结果)")
+    parser.add_argument("--transport", choices=["shm", "file"], default="shm")
+    parser.add_argument("--no-render", action="store_true", help="后端只回传检测结果，不画框")
+    parser.add_argument("--images", nargs="*", default=[os.path.join(ROOT, "samples"), os.path.join(ROOT, "tree")])
+    parser.add_argument("--out", default="", help="结果 JSON 路径，默认打印到 stdout")
+    args = parser.parse_args()
+
+    images = collect_images(args.images)
+    if not images:
+        print(f"没有找到图片: {args.images}", file=sys.stderr)
+        return 1
+    settings = load_webui_config(args.config)
+    pool_size = args.pool_size or settings["pool_size"]
+    max_inflight = args.max_inflight or settings["max_inflight"]
+    max_batch = args.max_batch or int(settings["max_batch"]) or engine_batch_size(args.config)
+    batch_wait_ms = settings["batch_wait_ms"] if args.batch_wait_ms is None else args.batch_wait_ms
+    render = not args.no_render
+    pool = BackendPool(pool_size=pool_size, queue_depth=max(16, args.concurrency * 2), max_inflight=max_inflight,
+                       queue_timeout=60.0, exe_path=args.exe or settings["exe_path"], config_path=args.config,
+                       transport=args.transport, render="backend" if render else "ui", cache_entries=0, warmup=0,
+                       max_batch=max_batch, batch_wait_ms=batch_wait_ms)
+    try:
+        if not pool.wait_ready():
+            print("后端启动失败:\n" + pool.recent_logs(), file=sys.stderr)
+            return 1
+        if args.warmup:
+            run(pool, images, args.concurrency, args.warmup, 0, args.transport, render)
+        results = run(pool, images, args.concurrency, args.requests, args.duration, args.transport, render)
+    finally:
+        pool.close()
+
+    report = {
+        "bench": "load_bench",
+        "commit": git_commit(),
+        "time": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "host": platform.node(),
+        "model": model_summary(args.config),
+        "params": {"concurrency": args.concurrency, "requests": args.requests, "duration": args.duration,
+                   "warmup": args.warmup, "transport": args.transport, "render": render,
+                   "pool_size": pool_size, "max_inflight": max_inflight, "max_batch": max_batch,
+                   "batch_wait_ms": batch_wait_ms, "images": len(images)},
+        "results": results,
+    }
+    text = json.dumps(report, ensure_ascii=False, indent=2)
+    latency = results["latency_ms"]
+    print(f"{results['requests']} requests, {results['errors']} errors, {results['throughput_rps']} req/s, "
+          f"latency p50 {latency['p50']} / p95 {latency['p95']} / p99 {latency['p99']} ms", file=sys.stderr)
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as f:
+            f.write(text + "\n")
+    else:
+        print(text)
+    return 1 if results["errors"] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
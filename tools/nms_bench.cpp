@@ -0,0 +1,58 @@
+// NMS 对拍 + 基准测试: 候选框数从 100 增加到 50k，与旧版两两比较的 NMS 逐框对比
+// 用法: ./nms_bench [nms_threshold] [category] [max_reference]
+// 候选数超过 max_reference (默认 20000) 时跳过旧版实现；有差异时返回非 0
+#include <iostream>
+#include <random>
+#include "../postprocess.h"
+#include "bench_data.h"
+
+// 模拟密集场景: 框聚集在若干目标附近，大量同类框互相重叠
+static std::vector<V5lite::DetectRes> randomBoxes(int count, int category, std::mt19937 &rng) {
+    std::uniform_real_distribution<float> unit(0.f, 1.f);
+    std::normal_distribution<float> jitter(0.f, 6.f);
+    int objects = std::max(1, count / 20);
+    std::vector<V5lite::DetectRes> centers(objects);
+    for (auto &c : centers) {
+        c.x = unit(rng) * 4000;
+        c.y = unit(rng) * 3000;
+        c.w = 20 + unit(rng) * 120;
+        c.h = c.w;
+        c.classes = int(unit(rng) * category) % category;
+    }
+    std::vector<V5lite::DetectRes> boxes(count);
+    for (auto &box : boxes) {
+        const V5lite::DetectRes &c = centers[int(unit(rng) * objects) % objects];
+        box.classes = c.classes;
+        box.x = c.x + jitter(rng);
+        box.y = c.y + jitter(rng);
+        box.w = std::max(1.f, c.w + jitter(rng));
+        box.h = box.w;
+        box.prob = 0.3f + 0.7f * unit(rng);
+    }
+    return boxes;
+}
+
+int main(int argc, char **argv) {
+    float nms_threshold = argc > 1 ? atof(argv[1]) : 0.2f;
+    int category = argc > 2 ? atoi(argv[2]) : 2;
+    int max_reference = argc > 3 ? atoi(argv[3]) : 20000;
+    std::mt19937 rng(42);
+    bool all_same = true;
+    std::cout << "candidates\tkept\treference(ms)\tdiou(ms)\tiou(ms)\tidentical" << std::endl;
+    for (int count : {100, 1000, 5000, 10000, 20000, 50000}) {
+        std::vector<V5lite::DetectRes> boxes = randomBoxes(count, category, rng);
+        std::vector<V5lite::DetectRes> expected = boxes, actual = boxes, plain = boxes;
+        float new_ms = timeIt(1, [&] { nmsBoxes(actual, nms_threshold, true); });
+        float iou_ms = timeIt(1, [&] { nmsBoxes(plain, nms_threshold, false); });
+        std::cout << count << "\t" << actual.size() << "\t";
+        if (count <= max_reference) {
+            float ref_ms = timeIt(1, [&] { nmsBoxesReference(expected, nms_threshold, true); });
+            bool same = sameBoxes(expected, actual);
+            all_same = all_same && same;
+            std::cout << ref_ms << "\t" << new_ms << "\t" << iou_ms << "\t" << (same ? "yes" : "NO") << std::endl;
+        } else {
+            std::cout << "-\t" << new_ms << "\t" << iou_ms << "\t-" << std::endl;
+        }
+    }
+    return all_same ? 0 : 1;
+}
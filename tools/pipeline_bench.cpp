@@ -0,0 +1,139 @@
+// 流水线调度压力测试: 按 V5lite::RunPipeline 的阶段布局 (读帧 -> 多线程前处理 -> 按 seq 推理 -> 回收输入缓冲区)
+// 只搬运序号，不需要 GPU / OpenCV；领取 delay_seq 的前处理线程故意停顿，其余线程趁机领取后面的 batch
+// 用法: ./pipeline_bench [batches] [preprocess_threads] [queue_depth] [delay_seq] [delay_ms] [rounds] [naive]
+// 任一轮长时间没有进展 (死锁) 时返回 1，参数无效时返回 2；带 naive (任意位置) 时按旧的顺序 (先取 batch 再取缓冲区) 复现死锁
+#include <atomic>
+#include <chrono>
+#include <cstdlib>
+#include <cstring>
+#include <iostream>
+#include <string>
+#include <thread>
+#include "../pipeline.h"
+
+struct Batch{
+    int seq = 0;
+    std::vector<int> input;
+};
+
+// 跑一轮，返回推理完成的 batch 数；卡住时线程阻塞在本轮的队列上无法回收，直接结束进程
+static int runRound(int batches, int threads, int depth, int delay_seq, int delay_ms, bool naive) {
+    BoundedQueue<Batch> decoded(depth), prepared(depth);
+    BoundedQueue<std::vector<int>> free_inputs(depth + threads + 1);
+    for (size_t i = 0; i < free_inputs.Capacity(); i++)
+        free_inputs.Push(std::vector<int>(1));
+    std::atomic<int> inferred(0);
+    std::atomic<int> running(threads);
+
+    std::thread source([&] {
+        for (int seq = 0; seq < batches; seq++) {
+            Batch batch;
+            batch.seq = seq;
+            if (!decoded.Push(std::move(batch)))
+                break;
+        }
+        decoded.Close();
+    });
+    OrderedTake<Batch, std::vector<int>> take(decoded, free_inputs);
+    std::vector<std::thread> preprocessors;
+    for (int t = 0; t < threads; t++) {
+        preprocessors.emplace_back([&] {
+            Batch batch;
+            std::vector<int> input;
+            while (true) {
+                if (naive) {
+                    if (!decoded.Pop(batch))
+                        break;
+                    if (batch.seq == delay_seq)
+                        std::this_thread::sleep_for(std::chrono::milliseconds(delay_ms));
+                    if (!free_inputs.Pop(input))
+                        break;
+                } else {
+                    if (!take.Take(batch, input))
+                        break;
+                    if (batch.seq == delay_seq)
+                        std::this_thread::sleep_for(std::chrono::milliseconds(delay_ms));
+                }
+                batch.input = std::move(input);
+                batch.input[0] = batch.seq;
+                if (!prepared.Push(std::move(batch)))
+                    break;
+            }
+            if (--running == 0)
+                prepared.Close();
+        });
+    }
+    std::thread inferencer([&] {
+        InOrder<Batch> ordered(prepared);
+        Batch batch;
+        while (ordered.Pop(batch)) {
+            if (batch.input.empty() || batch.input[0] != batch.seq)
+                std::cerr << "batch " << batch.seq << " carries the wrong input" << std::endl;
+            free_inputs.Push(std::move(batch.input));
+            inferred++;
+        }
+    });
+
+    // 看门狗: 一段时间没有进展即视为死锁
+    int last = -1;
+    auto progress_at = std::chrono::steady_clock::now();
+    while (inferred < batches) {
+        std::this_thread::sleep_for(std::chrono::milliseconds(10));
+        if (inferred != last) {
+            last = inferred;
+            progress_at = std::chrono::steady_clock::now();
+        } else if (std::chrono::steady_clock::now() - progress_at > std::chrono::milliseconds(delay_ms * 10 + 1000)) {
+            std::cerr << "FAILED: stalled at batch " << inferred << " of " << batches << " (delayed seq " << delay_seq
+                      << ")" << std::endl;
+            std::_Exit(1);
+        }
+    }
+    source.join();
+    for (std::thread &thread : preprocessors)
+        thread.join();
+    inferencer.join();
+    return inferred;
+}
+
+int main(int argc, char **argv) {
+    // naive 可以出现在任意位置，其余参数按顺序取数值
+    bool naive = false;
+    std::vector<int> values;
+    for (int i = 1; i < argc; i++) {
+        if (std::strcmp(argv[i], "naive") == 0) {
+            naive = true;
+            continue;
+        }
+        char *end = nullptr;
+        long value = std::strtol(argv[i], &end, 10);
+        if (end == argv[i] || *end != '\0') {
+            std::cerr << "invalid argument: " << argv[i] << std::endl;
+            return 2;
+        }
+        values.push_back(int(value));
+    }
+    auto arg = [&](size_t index, int fallback) { return index < values.size() ? values[index] : fallback; };
+    int batches = arg(0, 200);
+    int threads = arg(1, 2);
+    int depth = arg(2, 4);
+    int delay_seq = arg(3, 10);
+    int delay_ms = arg(4, 50);
+    int rounds = arg(5, 20);
+    if (batches < 1 || threads < 1 || depth < 1 || delay_seq < 0 || delay_ms < 0 || rounds < 1) {
+        std::cerr << "batches, preprocess_threads, queue_depth and rounds must be >= 1, delay_seq / delay_ms >= 0"
+                  << std::endl;
+        return 2;
+    }
+
+    std::cerr << batches << " batches, " << threads << " preprocess threads, depth " << depth << ", seq "
+              << delay_seq << " delayed " << delay_ms << " ms, " << rounds << " rounds"
+              << (naive ? " (naive order)" : "") << std::endl;
+    auto t_start = std::chrono::steady_clock::now();
+    for (int round = 0; round < rounds; round++) {
+        if (runRound(batches, threads, depth, (delay_seq + round) % batches, delay_ms, naive) != batches)
+            return 1;
+    }
+    float seconds = std::chrono::duration<float>(std::chrono::steady_clock::now() - t_start).count();
+    std::cerr << "OK: " << rounds << " rounds completed in " << seconds << " s" << std::endl;
+    return 0;
+}
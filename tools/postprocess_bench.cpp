@@ -0,0 +1,44 @@
+// 后处理解码的对拍 + 基准测试，用随机生成的网络输出，不需要 GPU / 模型
+// 用法: ./postprocess_bench [input_size] [category] [positive_ratio] [iterations]
+// positive_ratio 为 objectness 过阈值的格子比例；与旧版解码逐框比较，有差异时返回非 0
+#include <iostream>
+#include <random>
+#include "../postprocess.h"
+#include "bench_data.h"
+
+int main(int argc, char **argv) {
+    int size = argc > 1 ? atoi(argv[1]) : 1024;
+    int category = argc > 2 ? atoi(argv[2]) : 80;
+    float positive = argc > 3 ? atof(argv[3]) : 0.01f;
+    int iterations = argc > 4 ? atoi(argv[4]) : 50;
+    const float obj_threshold = 0.3f;
+    const std::vector<std::vector<int>> anchors = {{10, 13}, {16, 30}, {33, 23}, {30, 61}, {62, 45},
+                                                   {59, 119}, {116, 90}, {156, 198}, {373, 326}};
+    std::mt19937 rng(42);
+    std::vector<std::vector<int>> grids;
+    std::vector<float> output = syntheticOutput(rng, size, category, positive, grids);
+    int rows = int(output.size()) / (category + 5);
+
+    std::vector<V5lite::DecodeLevel> levels = buildDecodeLevels(grids, anchors);
+    float ratio = 1.5f;
+    std::vector<V5lite::DetectRes> expected, actual;
+    decodeOutputReference(output.data(), grids, anchors, category, size, size, obj_threshold, ratio, expected);
+    decodeOutput(output.data(), levels, category, size, size, obj_threshold, ratio, 0, actual);
+    bool same = sameBoxes(expected, actual);
+
+    float ref_ms = timeIt(iterations, [&] {
+        decodeOutputReference(output.data(), grids, anchors, category, size, size, obj_threshold, ratio, expected);
+    });
+    float new_ms = timeIt(iterations, [&] {
+        decodeOutput(output.data(), levels, category, size, size, obj_threshold, ratio, 0, actual);
+    });
+    float topk_ms = timeIt(iterations, [&] {
+        decodeOutput(output.data(), levels, category, size, size, obj_threshold, ratio, 300, actual);
+    });
+    std::cout << "cells: " << rows << ", category: " << category << ", boxes: " << expected.size() << std::endl;
+    std::cout << "reference:    " << ref_ms << " ms" << std::endl;
+    std::cout << "decode:       " << new_ms << " ms" << std::endl;
+    std::cout << "decode top300: " << topk_ms << " ms" << std::endl;
+    std::cout << (same ? "identical to reference" : "MISMATCH with reference") << std::endl;
+    return same ? 0 : 1;
+}
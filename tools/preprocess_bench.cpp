@@ -0,0 +1,79 @@
+// 前处理对拍 + 基准测试，只依赖 OpenCV，不需要 GPU / 模型
+// 用法: ./preprocess_bench [image_folder] [width] [height] [batch] [iterations]
+// 与旧版实现逐元素比较；FP16 输入须与 FP32 结果经 convertTo(CV_16F) 逐位相同，
+// uint8 输入乘以 1/255 后须与 FP32 结果相同，存在任何差异时返回非 0
+#include <cmath>
+#include <cstring>
+#include <iostream>
+#include "../preprocess.h"
+#include "utils.h"
+#include "bench_data.h"
+
+int main(int argc, char **argv) {
+    std::string folder = argc > 1 ? argv[1] : "../samples";
+    int width = argc > 2 ? atoi(argv[2]) : 1024;
+    int height = argc > 3 ? atoi(argv[3]) : 1024;
+    int batch = argc > 4 ? atoi(argv[4]) : 1;
+    int iterations = argc > 5 ? atoi(argv[5]) : 50;
+
+    std::vector<cv::Mat> images;
+    for (const std::string &name : readFolder(folder)) {
+        cv::Mat img = cv::imread(name);
+        if (img.data)
+            images.push_back(img);
+    }
+    if (images.empty()) {
+        std::cout << "no images in " << folder << std::endl;
+        return -1;
+    }
+
+    size_t length = size_t(batch) * 3 * width * height;
+    std::vector<float> expected(length), actual(length, -1.0f);
+    std::vector<uint16_t> half(length), expected_half(length);
+    std::vector<uint8_t> bytes(length);
+    std::vector<cv::Mat> resized;
+    float max_diff = 0;
+    size_t half_mismatch = 0, uint8_mismatch = 0;
+    float ref_ms = 0, fused_ms = 0, half_ms = 0, uint8_ms = 0;
+    for (size_t start = 0; start < images.size(); start += batch) {
+        std::vector<cv::Mat> vec_Mat(batch);
+        for (int b = 0; b < batch && start + b < images.size(); b++)
+            vec_Mat[b] = images[start + b];
+
+        std::fill(expected.begin(), expected.end(), 0.0f);
+        letterboxCHWReference(vec_Mat, expected.data(), width, height);
+        letterboxCHW(vec_Mat, actual.data(), width, height, resized);
+        for (size_t i = 0; i < length; i++)
+            max_diff = std::max(max_diff, std::fabs(expected[i] - actual[i]));
+
+        letterboxCHW(vec_Mat, half.data(), InputType::Float16, width, height, resized);
+        cv::Mat(1, int(length), CV_32F, expected.data()).convertTo(cv::Mat(1, int(length), CV_16F, expected_half.data()), CV_16F);
+        for (size_t i = 0; i < length; i++)
+            half_mismatch += half[i] != expected_half[i];
+
+        letterboxCHW(vec_Mat, bytes.data(), InputType::Uint8, width, height, resized);
+        for (size_t i = 0; i < length; i++)
+            uint8_mismatch += bytes[i] * (1.0f / 255) != expected[i];
+
+        ref_ms += timeIt(iterations, [&] { letterboxCHWReference(vec_Mat, expected.data(), width, height); });
+        fused_ms += timeIt(iterations, [&] { letterboxCHW(vec_Mat, actual.data(), width, height, resized); });
+        half_ms += timeIt(iterations, [&] {
+            letterboxCHW(vec_Mat, half.data(), InputType::Float16, width, height, resized);
+        });
+        uint8_ms += timeIt(iterations, [&] {
+            letterboxCHW(vec_Mat, bytes.data(), InputType::Uint8, width, height, resized);
+        });
+    }
+    int batches = (images.size() + batch - 1) / batch;
+    std::cout << "images: " << images.size() << ", input: " << width << "x" << height << ", batch: " << batch
+              << ", threads: " << cv::getNumThreads() << std::endl;
+    std::cout << "reference: " << ref_ms / batches << " ms/batch" << std::endl;
+    std::cout << "fused:     " << fused_ms / batches << " ms/batch" << std::endl;
+    std::cout << "fp16:      " << half_ms / batches << " ms/batch" << std::endl;
+    std::cout << "uint8:     " << uint8_ms / batches << " ms/batch" << std::endl;
+    std::cout << "input bytes/batch: fp32 " << length * 4 << ", fp16 " << length * 2 << ", uint8 " << length
+              << std::endl;
+    std::cout << "max abs diff: " << max_diff << ", fp16 mismatches: " << half_mismatch
+              << ", uint8 mismatches: " << uint8_mismatch << std::endl;
+    return max_diff == 0 && half_mismatch == 0 && uint8_mismatch == 0 ? 0 : 1;
+}
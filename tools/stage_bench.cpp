@@ -0,0 +1,136 @@
+// CPU 各阶段的微基准: 前处理 / 解码 / NMS / 后处理 / 画框，输入为固定种子生成的合成数据，不需要 GPU / 模型
+// 用法: ./stage_bench [iterations] [output.json] [input_size] [category]
+// 每个阶段先预热再逐次计时，结果 (p50/p95/p99/mean/min/max，单位 ms) 以 JSON 写入 output.json，
+// 不给出时打印到 stdout；可用 tools/bench_compare.py 与其他提交的结果比较
+#include <algorithm>
+#include <chrono>
+#include <fstream>
+#include <functional>
+#include <iostream>
+#include <random>
+#include <sstream>
+#include "../preprocess.h"
+#include "../postprocess.h"
+#include "bench_data.h"
+
+struct StageStats{
+    std::string name;
+    std::vector<float> samples;
+};
+
+// 线性插值的分位数，与 tools/load_bench.py 的算法一致
+static float percentile(const std::vector<float> &sorted, float q) {
+    if (sorted.empty())
+        return 0.f;
+    float pos = q * (sorted.size() - 1);
+    size_t lo = size_t(pos);
+    size_t hi = std::min(lo + 1, sorted.size() - 1);
+    return sorted[lo] + (sorted[hi] - sorted[lo]) * (pos - lo);
+}
+
+// setup 不计时 (例如复制输入)，f 为被测的一次调用
+static StageStats sampleIt(const std::string &name, int iterations, const std::function<void()> &setup,
+                           const std::function<void()> &f) {
+    StageStats stats{name, {}};
+    for (int i = 0; i < std::max(1, iterations / 10); i++) {
+        setup();
+        f();
+    }
+    for (int i = 0; i < iterations; i++) {
+        setup();
+        auto t_start = std::chrono::high_resolution_clock::now();
+        f();
+        auto t_end = std::chrono::high_resolution_clock::now();
+        stats.samples.push_back(std::chrono::duration<float, std::milli>(t_end - t_start).count());
+    }
+    return stats;
+}
+
+static void writeJson(std::ostream &out, const std::vector<StageStats> &stages, int iterations, int size,
+                      int category, const cv::Size &frame_size, size_t candidates, size_t kept) {
+    out << "{\"bench\":\"stage_bench\",\"params\":{\"iterations\":" << iterations << ",\"input_size\":" << size
+        << ",\"category\":" << category << ",\"frame\":[" << frame_size.width << "," << frame_size.height
+        << "],\"candidates\":" << candidates << ",\"detections\":" << kept << "},\"stages\":{";
+    for (size_t i = 0; i < stages.size(); i++) {
+        std::vector<float> sorted = stages[i].samples;
+        std::sort(sorted.begin(), sorted.end());
+        float sum = 0;
+        for (float v : sorted)
+            sum += v;
+        if (i > 0)
+            out << ",";
+        out << "\"" << stages[i].name << "\":{\"p50\":" << percentile(sorted, 0.5f)
+            << ",\"p95\":" << percentile(sorted, 0.95f) << ",\"p99\":" << percentile(sorted, 0.99f)
+            << ",\"mean\":" << (sorted.empty() ? 0.f : sum / sorted.size())
+            << ",\"min\":" << (sorted.empty() ? 0.f : sorted.front())
+            << ",\"max\":" << (sorted.empty() ? 0.f : sorted.back()) << ",\"iterations\":" << sorted.size() << "}";
+    }
+    out << "}}" << std::endl;
+}
+
+int main(int argc, char **argv) {
+    int iterations = argc > 1 ? atoi(argv[1]) : 200;
+    std::string output = argc > 2 ? argv[2] : "";
+    int size = argc > 3 ? atoi(argv[3]) : 1024;
+    int category = argc > 4 ? atoi(argv[4]) : 80;
+    const float obj_threshold = 0.3f;
+    const float nms_threshold = 0.2f;
+    const std::vector<std::vector<int>> anchors = {{10, 13}, {16, 30}, {33, 23}, {30, 61}, {62, 45},
+                                                   {59, 119}, {116, 90}, {156, 198}, {373, 326}};
+    std::mt19937 rng(42);
+    // 合成 1080p 帧和约 1% 格子过阈值的网络输出
+    cv::Mat frame = syntheticFrame(rng);
+    std::vector<std::vector<int>> grids;
+    std::vector<float> network_output = syntheticOutput(rng, size, category, 0.01f, grids);
+    std::vector<V5lite::DecodeLevel> levels = buildDecodeLevels(grids, anchors);
+    float ratio = std::max(float(frame.cols) / size, float(frame.rows) / size);
+
+    std::vector<V5lite::DetectRes> candidates, detections;
+    decodeOutput(network_output.data(), levels, category, size, size, obj_threshold, ratio, 0, candidates);
+    detections = candidates;
+    nmsBoxes(detections, nms_threshold, true);
+    std::map<int, std::string> labels;
+    for (int c = 0; c < category; c++)
+        labels[c] = "class" + std::to_string(c);
+    std::vector<cv::Scalar> colors(category, cv::Scalar(255, 0, 0));
+
+    std::vector<StageStats> stages;
+    std::vector<cv::Mat> images(1, frame), resized;
+    std::vector<float> input(size_t(3) * size * size);
+    stages.push_back(sampleIt("preprocess", iterations, [] {}, [&] {
+        letterboxCHW(images, input.data(), size, size, resized);
+    }));
+    std::vector<V5lite::DetectRes> work;
+    stages.push_back(sampleIt("decode", iterations, [&] { work.clear(); }, [&] {
+        decodeOutput(network_output.data(), levels, category, size, size, obj_threshold, ratio, 0, work);
+    }));
+    stages.push_back(sampleIt("nms", iterations, [&] { work = candidates; }, [&] {
+        nmsBoxes(work, nms_threshold, true);
+    }));
+    // 与 V5lite::postProcess 对单张图所做的相同: 解码 + NMS
+    stages.push_back(sampleIt("postprocess", iterations, [&] { work.clear(); }, [&] {
+        decodeOutput(network_output.data(), levels, category, size, size, obj_threshold, ratio, 0, work);
+        nmsBoxes(work, nms_threshold, true);
+    }));
+    cv::Mat canvas;
+    stages.push_back(sampleIt("draw", iterations, [&] { frame.copyTo(canvas); }, [&] {
+        drawDetections(canvas, detections, labels, colors);
+    }));
+
+    std::cerr << "stage\tp50\tp95\tp99 (ms), " << candidates.size() << " candidates, " << detections.size()
+              << " after NMS" << std::endl;
+    for (const StageStats &stage : stages) {
+        std::vector<float> sorted = stage.samples;
+        std::sort(sorted.begin(), sorted.end());
+        std::cerr << stage.name << "\t" << percentile(sorted, 0.5f) << "\t" << percentile(sorted, 0.95f) << "\t"
+                  << percentile(sorted, 0.99f) << std::endl;
+    }
+    if (output.empty()) {
+        writeJson(std::cout, stages, iterations, size, category, frame.size(), candidates.size(), detections.size());
+    } else {
+        std::ofstream out(output);
+        writeJson(out, stages, iterations, size, category, frame.size(), candidates.size(), detections.size());
+        std::cerr << "written to " << output << std::endl;
+    }
+    return 0;
+}
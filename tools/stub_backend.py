@@ -0,0 +1,244 @@
+#!/usr/bin/env python3
+"""
+webui 协议的桩后端，不依赖 GPU / TensorRT
+用法与 v5lite_trt 相同: ./tools/stub_backend.py config.yaml webui
+在 config.yaml 的 webui.exe_path 中指向本脚本即可在无 GPU 机器上跑通界面和推理池
+
+环境变量:
+    STUB_DELAY_MS   每个请求模拟的推理耗时 (默认 20)
+    STUB_NOISE      每个请求额外向 stdout 打印的干扰日志行数 (默认 0)
+    STUB_VIDEO_FRAMES  视频请求模拟的帧数 (默认 30)，每帧耗时 STUB_DELAY_MS
+    STUB_BATCH_ITEM_MS batch 请求中每多一张图增加的耗时 (默认 STUB_DELAY_MS 的 1/4)，模拟 batch 推理的收益
+"""
+import json
+import os
+import queue
+import sys
+import threading
+import time
+from multiprocessing import resource_tracker, shared_memory
+
+PROTOCOL_VERSION = 1
+
+
+def reply(record):
+    record.setdefault("v", PROTOCOL_VERSION)
+    sys.stdout.write(json.dumps(record, ensure_ascii=False) + "\n")
+    sys.stdout.flush()
+
+
+def write_output_shm(request):
+    """模拟后端把结果图写入 output_shm: 有 cv2 时解码输入图，否则写一张灰图"""
+    width, height = 64, 48
+    frame = bytes([128]) * (width * height * 3)
+    if request.get("shm"):
+        shm_in = shared_memory.SharedMemory(name=request["shm"].lstrip("/"))
+        resource_tracker.unregister(shm_in._name, "shared_memory")
+        data = bytes(shm_in.buf[:request.get("size", 0)])
+        shm_in.close()
+        try:
+            import cv2
+            import numpy as np
+            img = cv2.imdecode(np.frombuffer(data, np.uint8), cv2.IMREAD_COLOR)
+            if img is not None:
+                height, width = img.shape[:2]
+                frame = img.tobytes()
+        except ImportError:
+            pass
+    shm_out = shared_memory.SharedMemory(name=request["output_shm"].lstrip("/"), create=True, size=len(frame))
+    # 段由请求方 unlink，不交给本进程的 resource_tracker 回收
+    resource_tracker.unregister(shm_out._name, "shared_memory")
+    shm_out.buf[:len(frame)] = frame
+    shm_out.close()
+    return {"shm": request["output_shm"], "width": width, "height": height, "channels": 3}
+
+
+VIDEO_EXTS = (".mp4", ".avi", ".mkv", ".mov")
+
+
+def write_preview(width):
+    """模拟流式预览帧: 一张灰图写入新的共享内存段，由请求方 unlink"""
+    height = max(1, width * 3 // 4)
+    frame = bytes([96]) * (width * height * 3)
+    shm = shared_memory.SharedMemory(create=True, size=len(frame))
+    resource_tracker.unregister(shm._name, "shared_memory")
+    shm.buf[:len(frame)] = frame
+    shm.close()
+    return {"shm": "/" + shm.name, "width": width, "height": height, "channels": 3}
+
+
+class CancelTable:
+    """与 C++ 端相同: 只登记排队中或处理中的请求的 cancel，请求结束时一并删除"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._active = set()
+        self._cancelled = set()
+
+    def add(self, request_id):
+        with self._lock:
+            self._active.add(request_id)
+
+    def cancel(self, target):
+        with self._lock:
+            if target in self._active:
+                self._cancelled.add(target)
+
+    def __contains__(self, request_id):
+        with self._lock:
+            return request_id in self._cancelled
+
+    def finish(self, request_id):
+        with self._lock:
+            self._active.discard(request_id)
+            self._cancelled.discard(request_id)
+
+
+def read_requests(requests, cancelled):
+    """读请求线程: cancel 立即登记并应答，其余请求排队等主线程处理"""
+    for line in sys.stdin:
+        line = line.strip()
+        if not line:
+            continue
+        if line.startswith("{"):
+            try:
+                request = json.loads(line)
+            except ValueError as e:
+                reply({"id": "", "op": "", "ok": False, "error": f"malformed request: {e}"})
+                continue
+        else:
+            request = {"op": "exit" if line == "exit" else "infer", "path": line}
+        if request.get("op") == "cancel":
+            cancelled.cancel(str(request.get("target", "")))
+            reply({"id": str(request.get("id", "")), "op": "cancel", "ok": True})
+            continue
+        if request.get("id"):
+            cancelled.add(str(request["id"]))
+        requests.put(request)
+        if request.get("op") == "exit":
+            return
+    requests.put({"op": "exit"})
+
+
+def main():
+    if len(sys.argv) < 3 or sys.argv[2] != "webui":
+        print("Usage: stub_backend.py [config_path] webui", file=sys.stderr)
+        return -1
+    delay = float(os.environ.get("STUB_DELAY_MS", "20")) / 1000.0
+    noise = int(os.environ.get("STUB_NOISE", "0"))
+    video_frames = int(os.environ.get("STUB_VIDEO_FRAMES", "30"))
+    batch_item = float(os.environ.get("STUB_BATCH_ITEM_MS", delay * 250.0)) / 1000.0
+
+    print(f"stub backend pid={os.getpid()} loading", file=sys.stderr, flush=True)
+    reply({"id": "", "op": "ready", "ok": True})
+
+    requests = queue.Queue()
+    cancelled = CancelTable()
+    threading.Thread(target=read_requests, args=(requests, cancelled), daemon=True).start()
+    while True:
+        request = requests.get()
+        request_id = str(request.get("id", ""))
+        op = request.get("op", "infer")
+        if op == "exit":
+            break
+        try:
+            if op == "reload":
+                reply({"id": request_id, "op": op, "ok": True, "engine_reloaded": False})
+                continue
+            if op == "batch":
+                items = request.get("items") or []
+                start = time.perf_counter()
+                time.sleep(delay + batch_item * max(0, len(items) - 1))
+                elapsed = round((time.perf_counter() - start) * 1000.0, 3)
+                results = []
+                for i, item in enumerate(items):
+                    result = {"v": PROTOCOL_VERSION, "id": str(item.get("id", f"{request_id}.{i}")), "op": "infer",
+                              "ok": True, "frames": 1, "batch": len(items),
+                              "timings": {"preprocess": 0.0, "execute": elapsed, "postprocess": 0.0, "total": elapsed},
+                              "detections": [{"class": 0, "label": "stub", "score": 0.9,
+                                              "bbox": [10.0, 10.0, 32.0, 32.0]}]}
+                    if item.get("output_shm"):
+                        result["image"] = write_output_shm(item)
+                    results.append(result)
+                reply({"id": request_id, "op": op, "ok": True, "results": results})
+                continue
+            if op != "infer":
+                reply({"id": request_id, "op": op, "ok": False, "error": f"unknown op: {op}"})
+                continue
+            if request_id in cancelled:
+                reply({"id": request_id, "op": op, "ok": False, "error": "cancelled"})
+                continue
+
+            for i in range(noise):
+                print(f"prepare image take: {i} ms.", flush=True)
+            start = time.perf_counter()
+            path = request.get("path", "")
+            root, ext = os.path.splitext(path)
+            render = request.get("render", True)
+            detections = [{"class": 0, "label": "stub", "score": 0.9, "bbox": [10.0, 10.0, 32.0, 32.0]}]
+            extra = {}
+            frames = 1
+            output = root + "_" + ext if path and render else ""
+            if os.path.isdir(path):
+                # 文件夹: 每张图耗时 delay，不读图、不写结果图，只模拟进度和响应字段 (不记检查点)
+                every = int(request.get("stream", 0))
+                names = [name for _, _, files in os.walk(path) for name in files
+                         if os.path.splitext(name)[1].lower() in (".jpg", ".jpeg", ".png", ".bmp", ".tif", ".tiff")]
+                frames = 0
+                for index in range(len(names)):
+                    if request_id in cancelled:
+                        extra["cancelled"] = True
+                        break
+                    time.sleep(delay)
+                    frames += 1
+                    if every > 0 and index % every == 0:
+                        progress = {"id": request_id, "op": "progress", "ok": True, "frame": index, "frames_total": 0,
+                                    "fps": round(frames / (time.perf_counter() - start), 2), "detections": detections}
+                        if render:
+                            progress["preview"] = write_preview(int(request.get("preview_width", 0)) or 64)
+                        reply(progress)
+                output = request.get("output_dir") or path.rstrip("/") + "_out"
+                extra.update({"sidecar": os.path.join(output, "detections.jsonl"), "resumed": 0, "unreadable": 0})
+                detections = []
+            elif ext.lower() in VIDEO_EXTS:
+                # 视频: 每帧耗时 delay，stream 时按间隔回传 progress
+                every = int(request.get("stream", 0))
+                frames = 0
+                for frame in range(video_frames):
+                    if request_id in cancelled:
+                        extra["cancelled"] = True
+                        break
+                    time.sleep(delay)
+                    frames += 1
+                    if every > 0 and frame % every == 0:
+                        progress = {"id": request_id, "op": "progress", "ok": True, "frame": frame,
+                                    "frames_total": video_frames,
+                                    "fps": round(frames / (time.perf_counter() - start), 2), "detections": detections}
+                        if render:
+                            progress["preview"] = write_preview(int(request.get("preview_width", 0)) or 64)
+                        reply(progress)
+                if render and frames:
+                    # 模拟 ffmpeg 编码的结果视频: 25 fps，每帧约 4 KB
+                    seconds = frames / 25.0
+                    extra.update({"output_bytes": frames * 4096, "output_seconds": round(seconds, 2),
+                                  "bytes_per_minute": int(frames * 4096 * 60 / seconds), "playable_ms": 50.0})
+                    output = root + "_.mp4"
+            else:
+                time.sleep(delay)
+            elapsed = (time.perf_counter() - start) * 1000.0
+            if request.get("output_shm"):
+                extra["image"] = write_output_shm(request)
+            reply({
+                "id": request_id, "op": op, "ok": True, **extra,
+                "output": output, "frames": frames,
+                "timings": {"preprocess": 0.0, "execute": round(elapsed / frames if frames else 0.0, 3),
+                            "postprocess": 0.0, "total": round(elapsed, 3)},
+                "detections": detections,
+            })
+        finally:
+            cancelled.finish(request_id)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
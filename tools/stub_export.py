@@ -0,0 +1,35 @@
+#!/usr/bin/env python3
+"""
+export.py 的桩脚本，不依赖 PyTorch: 在权重文件旁边写出同名 .onnx
+用法与 YOLOv5 export.py 相同，在 config.yaml 的 convert.export_script 中指向本脚本即可测试转换流程
+
+环境变量:
+    STUB_EXPORT_MS  模拟的导出耗时 (默认 200)
+"""
+import argparse
+import hashlib
+import os
+import sys
+import time
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--weights", required=True)
+    parser.add_argument("--img-size", type=int, default=640)
+    parser.add_argument("--batch-size", type=int, default=1)
+    parser.add_argument("--device", default="0")
+    args, _ = parser.parse_known_args()
+
+    with open(args.weights, "rb") as f:
+        digest = hashlib.sha256(f.read()).hexdigest()
+    time.sleep(float(os.environ.get("STUB_EXPORT_MS", "200")) / 1000.0)
+    onnx_path = os.path.splitext(args.weights)[0] + ".onnx"
+    with open(onnx_path, "w") as f:
+        f.write(f"stub-onnx weights={digest} imgsz={args.img_size} batch={args.batch_size}\n")
+    print(f"ONNX export success, saved as {onnx_path}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
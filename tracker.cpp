@@ -0,0 +1,148 @@
+#include "tracker.h"
+#include <algorithm>
+#include <tuple>
+#include "postprocess.h"
+
+Tracker::Tracker(float iou_threshold, int max_age, int min_hits)
+        : iou_threshold(iou_threshold), max_age(max_age), min_hits(std::max(1, min_hits)) {}
+
+static void initFilter(cv::KalmanFilter &filter, const V5lite::DetectRes &det) {
+    // 状态 [cx, cy, w, h, vx, vy, vw, vh]，观测 [cx, cy, w, h]，一帧为一个时间步
+    filter.init(8, 4, 0, CV_32F);
+    cv::setIdentity(filter.transitionMatrix);
+    for (int i = 0; i < 4; i++)
+        filter.transitionMatrix.at<float>(i, i + 4) = 1.f;
+    cv::setIdentity(filter.measurementMatrix);
+    // 噪声取值参照 SORT: 位置可信、速度初值未知，框的尺寸观测噪声大于中心点
+    cv::setIdentity(filter.processNoiseCov, cv::Scalar::all(1.f));
+    for (int i = 4; i < 8; i++)
+        filter.processNoiseCov.at<float>(i, i) = 0.01f;
+    cv::setIdentity(filter.measurementNoiseCov, cv::Scalar::all(1.f));
+    filter.measurementNoiseCov.at<float>(2, 2) = 10.f;
+    filter.measurementNoiseCov.at<float>(3, 3) = 10.f;
+    cv::setIdentity(filter.errorCovPost, cv::Scalar::all(10.f));
+    for (int i = 4; i < 8; i++)
+        filter.errorCovPost.at<float>(i, i) = 1000.f;
+    filter.statePost.at<float>(0) = det.x;
+    filter.statePost.at<float>(1) = det.y;
+    filter.statePost.at<float>(2) = det.w;
+    filter.statePost.at<float>(3) = det.h;
+}
+
+void Tracker::advance(int frame) {
+    int steps = current_frame < 0 ? 0 : frame - current_frame;
+    for (Track &track : tracks)
+        for (int s = 0; s < steps; s++)
+            track.filter.predict();
+    current_frame = frame;
+}
+
+V5lite::DetectRes Tracker::box(const Track &track) const {
+    const cv::Mat &state = track.filter.statePost;
+    V5lite::DetectRes det;
+    det.classes = track.classes;
+    det.x = state.at<float>(0);
+    det.y = state.at<float>(1);
+    det.w = std::max(0.f, state.at<float>(2));
+    det.h = std::max(0.f, state.at<float>(3));
+    det.prob = track.prob;
+    det.track_id = track.id;
+    return det;
+}
+
+void Tracker::finish(const Track &track) {
+    if (track.hits >= min_hits)
+        finished.push_back(track.summary);
+}
+
+std::vector<V5lite::DetectRes> Tracker::Update(const std::vector<V5lite::DetectRes> &detections, int frame) {
+    advance(frame);
+    // 同类别的 (轨迹, 检测) 按 IoU 从大到小贪心匹配，每条轨迹和每个检测框最多用一次
+    std::vector<std::tuple<float, int, int>> pairs;
+    for (int t = 0; t < (int)tracks.size(); t++) {
+        V5lite::DetectRes predicted = box(tracks[t]);
+        for (int d = 0; d < (int)detections.size(); d++) {
+            if (detections[d].classes != tracks[t].classes)
+                continue;
+            float iou = boxIoU(predicted, detections[d], false);
+            if (iou >= iou_threshold)
+                pairs.emplace_back(iou, t, d);
+        }
+    }
+    std::sort(pairs.begin(), pairs.end(), [](const std::tuple<float, int, int> &left,
+                                             const std::tuple<float, int, int> &right) {
+        return std::get<0>(left) > std::get<0>(right);
+    });
+    std::vector<char> track_matched(tracks.size(), 0);
+    std::vector<char> det_matched(detections.size(), 0);
+    cv::Mat measurement(4, 1, CV_32F);
+    for (const auto &pair : pairs) {
+        int t = std::get<1>(pair);
+        int d = std::get<2>(pair);
+        if (track_matched[t] || det_matched[d])
+            continue;
+        track_matched[t] = det_matched[d] = 1;
+        const V5lite::DetectRes &det = detections[d];
+        Track &track = tracks[t];
+        measurement.at<float>(0) = det.x;
+        measurement.at<float>(1) = det.y;
+        measurement.at<float>(2) = det.w;
+        measurement.at<float>(3) = det.h;
+        track.filter.correct(measurement);
+        track.prob = det.prob;
+        track.hits++;
+        track.misses = 0;
+        track.summary.last_frame = frame;
+        track.summary.hits = track.hits;
+        track.summary.max_score = std::max(track.summary.max_score, det.prob);
+        track.summary.mean_score += (det.prob - track.summary.mean_score) / track.hits;
+    }
+    for (size_t t = 0; t < track_matched.size(); t++)
+        if (!track_matched[t])
+            tracks[t].misses++;
+
+    // 过期的轨迹结束并计入汇总
+    auto expired = std::stable_partition(tracks.begin(), tracks.end(), [this](const Track &track) {
+        return track.misses <= max_age;
+    });
+    for (auto it = expired; it != tracks.end(); ++it)
+        finish(*it);
+    tracks.erase(expired, tracks.end());
+
+    // 未匹配的检测框开始新轨迹
+    for (size_t d = 0; d < detections.size(); d++) {
+        if (det_matched[d])
+            continue;
+        const V5lite::DetectRes &det = detections[d];
+        Track track;
+        track.id = next_id++;
+        track.classes = det.classes;
+        track.prob = det.prob;
+        initFilter(track.filter, det);
+        track.hits = 1;
+        track.summary = {track.id, det.classes, frame, frame, 1, det.prob, det.prob};
+        tracks.push_back(track);
+    }
+    return Predict(frame);
+}
+
+std::vector<V5lite::DetectRes> Tracker::Predict(int frame) {
+    advance(frame);
+    std::vector<V5lite::DetectRes> boxes;
+    for (const Track &track : tracks)
+        if (track.misses == 0 && track.hits >= min_hits)
+            boxes.push_back(box(track));
+    return boxes;
+}
+
+std::vector<V5lite::TrackSummary> Tracker::Summaries() const {
+    std::vector<V5lite::TrackSummary> summaries = finished;
+    for (const Track &track : tracks)
+        if (track.hits >= min_hits)
+            summaries.push_back(track.summary);
+    std::sort(summaries.begin(), summaries.end(), [](const V5lite::TrackSummary &left,
+                                                     const V5lite::TrackSummary &right) {
+        return left.id < right.id;
+    });
+    return summaries;
+}
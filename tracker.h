@@ -0,0 +1,47 @@
+#ifndef V5lite_TRT_TRACKER_H
+#define V5lite_TRT_TRACKER_H
+
+#include <vector>
+#include <opencv2/opencv.hpp>
+#include "v5lite.h"
+
+// 视频隔帧检测时的轻量跟踪 (SORT 式): 每条轨迹一个匀速卡尔曼滤波 (cx, cy, w, h 及其速度)
+// 检测帧上按 IoU 贪心匹配同类别的检测框并修正，非检测帧只按运动模型外推
+// 输出的框带 track_id，同一目标跨帧保持不变
+class Tracker
+{
+public:
+    // iou_threshold: 检测框与轨迹预测框匹配的最小 IoU
+    // max_age: 轨迹连续多少次检测未匹配后结束；min_hits: 至少匹配多少次检测才输出 / 计入统计
+    Tracker(float iou_threshold, int max_age, int min_hits);
+    // 检测帧: 先把轨迹外推到 frame，再用 detections 更新，返回当前帧的跟踪框
+    std::vector<V5lite::DetectRes> Update(const std::vector<V5lite::DetectRes> &detections, int frame);
+    // 非检测帧: 外推到 frame，返回上一次检测时仍被匹配的轨迹的预测框
+    std::vector<V5lite::DetectRes> Predict(int frame);
+    // 全部确认过的轨迹 (含已结束的)，按 id 排序
+    std::vector<V5lite::TrackSummary> Summaries() const;
+
+private:
+    struct Track{
+        int id;
+        int classes;
+        float prob;
+        cv::KalmanFilter filter;
+        int hits = 0;
+        int misses = 0;  // 连续未匹配的检测次数
+        V5lite::TrackSummary summary;
+    };
+    void advance(int frame);
+    V5lite::DetectRes box(const Track &track) const;
+    void finish(const Track &track);
+
+    float iou_threshold;
+    int max_age;
+    int min_hits;
+    int next_id = 1;
+    int current_frame = -1;
+    std::vector<Track> tracks;
+    std::vector<V5lite::TrackSummary> finished;
+};
+
+#endif //V5lite_TRT_TRACKER_H
@@ -0,0 +1,102 @@
+#include "infer_backend.h"
+#include "common.hpp"
+
+TrtBackend::TrtBackend(const std::string &engine_file) : engine_file(engine_file) {}
+
+TrtBackend::~TrtBackend() {
+    if (stream)
+        cudaStreamDestroy(stream);
+    for (cudaEvent_t event : events)
+        if (event)
+            cudaEventDestroy(event);
+    cudaFree(buffers[0]);
+    cudaFree(buffers[1]);
+    cudaFreeHost(host_input);
+    delete context;
+    delete engine;
+}
+
+bool TrtBackend::Load() {
+    // create and load engine
+    readTrtFile(engine_file, engine);
+    if (engine == nullptr)
+        return false;
+    context = engine->createExecutionContext();
+    if (context == nullptr)
+        return false;
+
+    //get buffers
+    assert(engine->getNbIOTensors() == 2);
+    int64_t bufferSize[2];
+    for (int i = 0; i < 2; ++i) {
+        const char* tensorName = engine->getIOTensorName(i);
+        nvinfer1::Dims dims = engine->getTensorShape(tensorName);
+        nvinfer1::DataType dtype = engine->getTensorDataType(tensorName);
+        int64_t totalSize = volume(dims) * 1 * getElementSize(dtype);
+        bufferSize[i] = totalSize;
+        std::cout << "binding" << i << ": " << totalSize << std::endl;
+        cudaMalloc(&buffers[i], totalSize);
+    }
+    input_bytes = bufferSize[0];
+    output_bytes = bufferSize[1];
+    // 前处理按输入绑定的类型直接写出，FP16 / UINT8 的 host 内存和 H2D 拷贝量为 FP32 的 1/2、1/4
+    switch (engine->getTensorDataType(engine->getIOTensorName(0))) {
+        case nvinfer1::DataType::kFLOAT:
+            input_type = InputType::Float32;
+            break;
+        case nvinfer1::DataType::kHALF:
+            input_type = InputType::Float16;
+            break;
+        case nvinfer1::DataType::kUINT8:
+            input_type = InputType::Uint8;
+            break;
+        default:
+            std::cout << "unsupported input binding type, expected fp32 / fp16 / uint8" << std::endl;
+            return false;
+    }
+    if (engine->getTensorDataType(engine->getIOTensorName(1)) != nvinfer1::DataType::kFLOAT) {
+        std::cout << "unsupported output binding type, expected fp32" << std::endl;
+        return false;
+    }
+    std::cout << "input type: " << inputTypeName(input_type) << std::endl;
+    cudaMallocHost(&host_input, input_bytes);
+    // enqueueV3 按张量名取地址，绑定一次即可
+    for (int i = 0; i < 2; ++i) {
+        if (!context->setTensorAddress(engine->getIOTensorName(i), buffers[i])) {
+            std::cout << "failed to bind tensor " << engine->getIOTensorName(i) << std::endl;
+            return false;
+        }
+    }
+
+    //get stream
+    cudaStreamCreate(&stream);
+    for (cudaEvent_t &event : events)
+        cudaEventCreate(&event);
+    return true;
+}
+
+bool TrtBackend::Infer(const void *input, float *output) {
+    // DMA the input to the GPU,  execute the batch, and DMA it back:
+    // 拷贝、推理和事件都排在同一个 stream 上: host_input 为锁页内存，H2D 拷贝是真正异步的，
+    // 推理必须在该 stream 上排在拷贝之后；事件之间的间隔才分别是 h2d / compute / d2h 的 GPU 时间
+    cudaEventRecord(events[0], stream);
+    cudaMemcpyAsync(buffers[0], input, input_bytes, cudaMemcpyHostToDevice, stream);
+    cudaEventRecord(events[1], stream);
+    bool ok = context->enqueueV3(stream);
+    cudaEventRecord(events[2], stream);
+    cudaMemcpyAsync(output, buffers[1], output_bytes, cudaMemcpyDeviceToHost, stream);
+    cudaEventRecord(events[3], stream);
+    cudaStreamSynchronize(stream);
+    for (int i = 0; i < 3; i++)
+        cudaEventElapsedTime(&last_timings[i], events[i], events[i + 1]);
+    return ok;
+}
+
+void TrtBackend::AddTimings(std::vector<std::pair<std::string, float>> &parts) const {
+    static const char *names[3] = {"h2d", "compute", "d2h"};
+    parts.resize(3);
+    for (int i = 0; i < 3; i++) {
+        parts[i].first = names[i];
+        parts[i].second += last_timings[i];
+    }
+}
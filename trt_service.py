@@ -0,0 +1,1026 @@
+import subprocess
+import threading
+import itertools
+import collections
+import queue
+import json
+import os
+import uuid
+import hashlib
+import shutil
+import time
+from concurrent.futures import Future
+from multiprocessing import shared_memory
+
+import cv2
+import numpy as np
+import yaml
+
+from metrics import ServiceMetrics, Tracer
+
+# webui 协议版本，需与 protocol.h 中的 PROTOCOL_VERSION 保持一致
+PROTOCOL_VERSION = 1
+
+# === 配置 ===
+# C++ 编译好的可执行文件路径
+EXE_PATH = "./build/v5lite_trt"  # 请根据实际编译输出路径修改
+CONFIG_PATH = "./config.yaml"   # 配置文件路径
+MODE_FLAG = "webui"              # 触发 C++ 进入循环模式的标志
+
+# config.yaml 中 webui 段的默认值
+WEBUI_DEFAULTS = {
+    "exe_path": EXE_PATH,
+    "pool_size": 1,        # 后端进程数，每个进程各自加载一份引擎
+    "queue_depth": 16,     # 等待派发的请求上限，超出后直接拒绝
+    "max_inflight": 2,     # 单个后端同时在管道中排队的请求数
+    "queue_timeout": 0.0,  # 队列满时最多等待的秒数，0 表示立即拒绝
+    "transport": "shm",    # 图片传输方式: shm (共享内存，不落盘) / file (临时文件)
+    "render": "backend",   # 结果图在哪里画框: backend (C++ 端) / ui (后端只回传检测结果，Python 端画框)
+    "cache_entries": 256,  # 结果缓存的条目上限，0 表示不缓存
+    "cache_mb": 256,       # 结果缓存占用内存上限 (MB)
+    "cache_dir": "",       # 结果缓存的落盘目录，空表示只缓存在内存
+    "warmup": 2,           # 后端就绪后每个进程先跑几次空推理，首个用户请求不再承担首次推理的开销
+    "metrics_port": 9108,  # /metrics (Prometheus 格式) 的端口，0 表示不开启
+    "trace_file": "",      # 按请求记录 span 的 JSON Lines 文件，空表示不记录
+    "trace_sample": 1.0,   # 记录追踪的请求比例
+    "max_batch": 0,        # 多个用户的图片请求合并为一次 batch 推理的上限，0 表示取引擎的 BATCH_SIZE，1 表示不合并
+    "batch_wait_ms": 5,    # 凑 batch 时首个请求最多多等的毫秒数
+}
+
+
+VIDEO_EXTS = (".mp4", ".avi", ".mkv", ".mov")
+# 池中的后端重启失败后，至少隔这么多秒再重试
+RESTART_BACKOFF = 5.0
+
+
+def file_request(image_path):
+    """按文件路径推理的请求"""
+    return {"op": "infer", "path": os.path.abspath(image_path)}
+
+
+def encode_request(request_id, request):
+    """构造一行 JSON 请求，request 为不含 v/id 的请求字段"""
+    record = {"v": PROTOCOL_VERSION, "id": str(request_id), "op": "infer"}
+    record.update(request)
+    return json.dumps(record, ensure_ascii=False) + "\n"
+
+
+def decode_response(line):
+    """解析一行 JSON 响应，非协议行返回 None"""
+    line = line.strip()
+    if not line.startswith("{"):
+        return None
+    try:
+        record = json.loads(line)
+    except ValueError:
+        return None
+    if not isinstance(record, dict) or "v" not in record:
+        return None
+    return record
+
+
+def error_response(request_id, message):
+    return {"v": PROTOCOL_VERSION, "id": str(request_id), "ok": False, "error": message,
+            "timings": {}, "detections": []}
+
+
+def load_webui_config(config_path=CONFIG_PATH):
+    """读取 config.yaml 中的 webui 段，缺省项使用默认值"""
+    settings = dict(WEBUI_DEFAULTS)
+    try:
+        with open(config_path, "r", encoding="utf-8") as f:
+            root = yaml.safe_load(f) or {}
+        settings.update(root.get("webui") or {})
+    except (OSError, yaml.YAMLError) as e:
+        print(f"读取 webui 配置失败，使用默认值: {e}")
+    return settings
+
+
+def engine_batch_size(config_path=CONFIG_PATH):
+    """config.yaml 顶层的 BATCH_SIZE (构建引擎时的 batch)，读取失败时为 1"""
+    try:
+        with open(config_path, "r", encoding="utf-8") as f:
+            root = yaml.safe_load(f) or {}
+        return max(1, int(root.get("BATCH_SIZE", 1)))
+    except (OSError, yaml.YAMLError, TypeError, ValueError):
+        return 1
+
+
+def _resolved(response):
+    future = Future()
+    future.set_result(response)
+    return future
+
+
+class ResultCache:
+    """
+    按内容寻址的推理结果缓存 (LRU)，键为 输入字节 + 生效配置 + render 的哈希
+    - 条目数和字节数两个上限，超出时淘汰最久未用的条目
+    - 生效配置为 config.yaml 中除 webui 段外的全部内容加上模型文件的修改时间，
+      任一变化时缓存整体失效
+    - cache_dir 非空时结果同时落盘 (每个配置一个子目录)，重启后仍可命中
+    - 磁盘上的 config.yaml 先于后端生效: 保存配置到后端 reload 完成之间，按新指纹算的键可能拿到旧配置的结果。
+      BackendPool.reload 前后各调用一次 invalidate，清空当前条目并递增 generation；
+      put 时 generation 已变化 (请求跨过了 reload) 的结果不缓存
+    """
+
+    def __init__(self, config_path=CONFIG_PATH, max_entries=256, max_bytes=256 << 20, cache_dir=""):
+        self.config_path = config_path
+        self.max_entries = max(0, int(max_entries))
+        self.max_bytes = max(0, int(max_bytes))
+        self.cache_dir = cache_dir
+        self._lock = threading.Lock()
+        self._entries = collections.OrderedDict()  # key -> (response, image, nbytes)
+        self._bytes = 0
+        self._stamp = None
+        self._fingerprint = ""
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+        self.generation = 0
+
+    @property
+    def enabled(self):
+        return self.max_entries > 0 and self.max_bytes > 0
+
+    def _config_stamp(self):
+        """config.yaml 和模型文件的 (路径, 修改时间, 大小)，用于快速判断配置是否变化"""
+        stamp = []
+        try:
+            with open(self.config_path, "r", encoding="utf-8") as f:
+                root = yaml.safe_load(f) or {}
+        except (OSError, yaml.YAMLError):
+            root = {}
+        root.pop("webui", None)
+        for path in [self.config_path, root.get("engine_file"), root.get("onnx_file")]:
+            try:
+                st = os.stat(path)
+                stamp.append((path, st.st_mtime_ns, st.st_size))
+            except (OSError, TypeError):
+                stamp.append((path, 0, 0))
+        return tuple(stamp), root
+
+    def _refresh(self):
+        """配置变化时重新计算指纹并清空内存中的条目 (调用方持锁)"""
+        try:
+            st = os.stat(self.config_path)
+            quick = (st.st_mtime_ns, st.st_size)
+        except OSError:
+            quick = None
+        if self._stamp is not None and self._stamp[0] == quick:
+            # config.yaml 未变时只需再确认模型文件
+            if all(self._file_unchanged(entry) for entry in self._stamp[1][1:]):
+                return
+        stamp, root = self._config_stamp()
+        fingerprint = hashlib.sha256(json.dumps([root, stamp[1:]], sort_keys=True, default=str)
+                                     .encode("utf-8")).hexdigest()[:16]
+        self._stamp = (quick, stamp)
+        if fingerprint == self._fingerprint:
+            return
+        if self._fingerprint:
+            self.invalidations += 1
+            print("配置或模型已变化，清空推理结果缓存")
+        self._fingerprint = fingerprint
+        self._entries.clear()
+        self._bytes = 0
+        if self.cache_dir and os.path.isdir(self.cache_dir):
+            # 旧配置的落盘结果不会再命中，一并删除
+            for name in os.listdir(self.cache_dir):
+                if name != fingerprint:
+                    shutil.rmtree(os.path.join(self.cache_dir, name), ignore_errors=True)
+
+    @staticmethod
+    def _file_unchanged(entry):
+        path, mtime, size = entry
+        try:
+            st = os.stat(path)
+        except (OSError, TypeError):
+            return mtime == 0
+        return (st.st_mtime_ns, st.st_size) == (mtime, size)
+
+    def key(self, data, render=True):
+        """缓存键: 输入字节、render 和当前配置指纹的 SHA-256"""
+        with self._lock:
+            self._refresh()
+            fingerprint = self._fingerprint
+        digest = hashlib.sha256(data)
+        digest.update(b"render" if render else b"norender")
+        digest.update(fingerprint.encode("ascii"))
+        return digest.hexdigest()
+
+    def _disk_path(self, key):
+        return os.path.join(self.cache_dir, self._fingerprint, key[:2], key)
+
+    def get(self, key):
+        """返回 (响应字典, BGR 结果图或 None)，未命中返回 None；命中的响应带 cached"""
+        if not self.enabled:
+            return None
+        with self._lock:
+            self._refresh()
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return dict(entry[0], cached=True), entry[1]
+            entry = self._load(key) if self.cache_dir else None
+            if entry is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self._insert(key, *entry)
+            return dict(entry[0], cached=True), entry[1]
+
+    def put(self, key, response, image=None, generation=None):
+        """
+        缓存一次成功的推理结果 (图片被设为只读，调用方不要原地修改)
+        generation 为算键之前读取的 self.generation，此后发生过 invalidate 时不缓存
+        """
+        if not self.enabled or not response.get("ok"):
+            return
+        response = {k: v for k, v in response.items() if k not in ("id", "image")}
+        if image is not None:
+            image.setflags(write=False)
+        with self._lock:
+            if generation is not None and generation != self.generation:
+                return
+            self._refresh()
+            self._insert(key, response, image)
+            if self.cache_dir:
+                self._store(key, response, image)
+
+    def _insert(self, key, response, image):
+        nbytes = len(json.dumps(response)) + (image.nbytes if image is not None else 0)
+        if nbytes > self.max_bytes:
+            return
+        old = self._entries.pop(key, None)
+        if old is not None:
+            self._bytes -= old[2]
+        self._entries[key] = (response, image, nbytes)
+        self._bytes += nbytes
+        while len(self._entries) > self.max_entries or self._bytes > self.max_bytes:
+            _, evicted = self._entries.popitem(last=False)
+            self._bytes -= evicted[2]
+            self.evictions += 1
+
+    def _store(self, key, response, image):
+        path = self._disk_path(key)
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            if image is not None:
+                cv2.imwrite(path + ".png", image)
+            # json 最后写入，作为条目完整的标志
+            with open(path + ".json.tmp", "w", encoding="utf-8") as f:
+                json.dump({"response": response, "image": image is not None}, f, ensure_ascii=False)
+            os.replace(path + ".json.tmp", path + ".json")
+        except OSError as e:
+            print(f"写入结果缓存失败: {e}")
+
+    def _load(self, key):
+        path = self._disk_path(key)
+        try:
+            with open(path + ".json", "r", encoding="utf-8") as f:
+                record = json.load(f)
+        except (OSError, ValueError):
+            return None
+        image = None
+        if record.get("image"):
+            image = cv2.imread(path + ".png", cv2.IMREAD_COLOR)
+            if image is None:
+                return None
+            image.setflags(write=False)
+        return record["response"], image
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def invalidate(self):
+        """后端配置变化 (reload) 时丢弃全部条目 (含当前配置的落盘结果)，进行中的请求的结果也不再缓存"""
+        with self._lock:
+            self.generation += 1
+            self.invalidations += 1
+            self._entries.clear()
+            self._bytes = 0
+            if self.cache_dir and self._fingerprint:
+                shutil.rmtree(os.path.join(self.cache_dir, self._fingerprint), ignore_errors=True)
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "evictions": self.evictions,
+                "invalidations": self.invalidations,
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+            }
+
+
+class CPPInferenceService:
+    """单个 C++ 后端进程，支持多个请求在管道中排队 (按 id 匹配响应)"""
+
+    def __init__(self, exe_path=EXE_PATH, config_path=CONFIG_PATH, log_lines=200, autostart=True):
+        self.exe_path = exe_path
+        self.config_path = config_path
+        self.process = None
+        # C++ 日志走 stderr，由后台线程持续读取，避免管道写满阻塞后端
+        self.logs = collections.deque(maxlen=log_lines)
+        self.restarts = 0
+        # 最近一次启动 (进程启动 + 引擎加载) 的耗时 (秒)
+        self.start_seconds = 0.0
+        self._started = False
+        self._ids = itertools.count(1)
+        self._lock = threading.Lock()
+        # 重启 (进程启动 + 引擎加载，可能几十秒) 单独加锁，不阻塞持 _lock 的读响应线程
+        self._restart_lock = threading.Lock()
+        # 池中的后端: 正在后台重启，以及重启失败后下次允许重试的时刻
+        self.restarting = False
+        self.next_restart = 0.0
+        self._pending = {}
+        # 流式请求的中间记录 (op 为 progress) 交给这里登记的回调
+        self._progress = {}
+        if autostart:
+            self.start_service()
+
+    @property
+    def in_flight(self):
+        return len(self._pending)
+
+    def alive(self):
+        return self.process is not None and self.process.poll() is None
+
+    def start_service(self):
+        """启动 C++ 子进程"""
+        print("正在启动 C++ 推理后端...")
+        start = time.time()
+        if self._started:
+            self.restarts += 1
+        self._started = True
+        try:
+            # 相当于执行: ./v5lite_trt ../config.yaml webui
+            process = subprocess.Popen(
+                [self.exe_path, self.config_path, MODE_FLAG],
+                stdin=subprocess.PIPE,
+                stdout=subprocess.PIPE,
+                stderr=subprocess.PIPE,
+                text=True,  # 以文本模式通信
+                bufsize=1   # 行缓冲
+            )
+            threading.Thread(target=self._drain_logs, args=(process,), daemon=True).start()
+
+            # 等待 C++ 输出 ready 记录
+            while True:
+                line = process.stdout.readline()
+                record = decode_response(line)
+                if record is not None and record.get("op") == "ready":
+                    self.start_seconds = time.time() - start
+                    print(f"C++ 后端已就绪！({self.start_seconds:.1f} s)")
+                    break
+                if line == "" and process.poll() is not None:
+                    print("C++ 后端启动失败，请检查路径或日志。")
+                    print("\n".join(self.logs))
+                    self.process = None
+                    return
+            # 每个进程一张独立的在途表，旧进程的读线程收尾时不会误伤新请求
+            with self._lock:
+                self._pending = {}
+                self.process = process
+            threading.Thread(target=self._read_responses, args=(process, self._pending), daemon=True).start()
+        except Exception as e:
+            print(f"启动失败: {e}")
+            self.process = None
+
+    def _drain_logs(self, process):
+        for line in process.stderr:
+            self.logs.append(line.rstrip("\n"))
+
+    def _read_responses(self, process, pending):
+        # 每个请求恰好对应一行响应，跳过非协议行
+        for line in process.stdout:
+            record = decode_response(line)
+            if record is None:
+                continue
+            if record.get("op") == "progress":
+                callback = self._progress.get(record.get("id"))
+                if callback is not None:
+                    try:
+                        callback(record)
+                    except Exception as e:
+                        print(f"进度回调出错: {e}")
+                elif "preview" in record:
+                    release_shared_image(record["preview"])
+                continue
+            with self._lock:
+                future = pending.pop(record.get("id"), None)
+                self._progress.pop(record.get("id"), None)
+            if future is None:
+                continue
+            record.setdefault("timings", {})
+            record.setdefault("detections", [])
+            if not record.get("ok"):
+                print(f"推理错误: {record.get('error')}")
+            future.set_result(record)
+        # 进程退出：所有未完成的请求直接返回错误
+        with self._lock:
+            leftover = list(pending.items())
+            pending.clear()
+        for request_id, future in leftover:
+            future.set_result(error_response(request_id, "后端意外退出"))
+
+    def submit(self, request, on_progress=None, restart=True):
+        """
+        异步发送一条推理请求 (文件路径或请求字段字典)，返回 Future，结果为响应字典
+        on_progress 接收流式请求的每条 progress 记录 (在读响应线程中调用)
+        返回的 Future 带 request_id 属性，可用于 cancel
+        后端未运行时 restart 为 True 则先同步重启 (不持 _lock)，否则直接返回错误 (BackendPool 在后台重启)
+        """
+        if isinstance(request, str):
+            request = file_request(request)
+        if restart and not self.alive():
+            with self._restart_lock:
+                if not self.alive():
+                    print("后端未运行，尝试重启...")
+                    self.start_service()
+        with self._lock:
+            if not self.alive():
+                return _resolved(error_response("", "后端未运行"))
+
+            request_id = str(next(self._ids))
+            future = Future()
+            future.request_id = request_id
+            self._pending[request_id] = future
+            if on_progress is not None:
+                self._progress[request_id] = on_progress
+            try:
+                self.process.stdin.write(encode_request(request_id, request))
+                self.process.stdin.flush()
+            except Exception as e:
+                print(f"通信错误: {e}")
+                self._pending.pop(request_id, None)
+                self._progress.pop(request_id, None)
+                return _resolved(error_response(request_id, str(e)))
+        return future
+
+    def cancel(self, future):
+        """让后端提前结束 (或跳过) submit 返回的请求，其响应带 cancelled"""
+        request_id = getattr(future, "request_id", None)
+        if request_id is None or future.done():
+            return
+        self.submit({"op": "cancel", "target": request_id}, restart=False)
+
+    def infer(self, request, timeout=None):
+        """发送一条推理请求，返回响应字典 (ok/output/timings/detections)"""
+        return self.submit(request).result(timeout)
+
+    def reload(self, config_path=None, timeout=None):
+        """让后端重新读取配置 (排在已发送的请求之后执行)，返回响应字典，含 engine_reloaded"""
+        request = {"op": "reload"}
+        if config_path:
+            request["path"] = os.path.abspath(config_path)
+        return self.submit(request).result(timeout)
+
+    def recent_logs(self, n=20):
+        return "\n".join(list(self.logs)[-n:])
+
+    def close(self):
+        if self.process:
+            try:
+                self.process.stdin.write(json.dumps({"v": PROTOCOL_VERSION, "op": "exit"}) + "\n")
+                self.process.stdin.flush()
+            except Exception:
+                pass
+            self.process.terminate()
+
+
+class BackendPool:
+    """
+    多个 C++ 后端进程组成的推理池
+    - 请求先进入有界队列，队列满时直接拒绝 (背压)
+    - 调度线程把请求派发给在途请求最少的后端，每个后端最多 max_inflight 个在途请求
+    - metrics 记录请求数、延迟、排队时间和后端各阶段耗时，trace_file 非空时逐请求记录 span
+    - max_batch > 1 时，并发的单图请求在首个请求之后最多再等 batch_wait_ms，合并成一条 batch 请求一起推理，
+      结果按顺序分发回各自的 Future
+    """
+
+    def __init__(self, pool_size=1, queue_depth=16, max_inflight=2, queue_timeout=0.0,
+                 exe_path=EXE_PATH, config_path=CONFIG_PATH, transport="shm", render="backend",
+                 cache_entries=0, cache_mb=256, cache_dir="", warmup=0, trace_file="", trace_sample=1.0,
+                 max_batch=1, batch_wait_ms=5):
+        self.max_inflight = max(1, int(max_inflight))
+        self.max_batch = max(1, int(max_batch))
+        self.batch_wait = max(0.0, float(batch_wait_ms)) / 1000.0
+        self.transport = transport
+        self.render = render
+        # 图片推理结果缓存，见 infer_image_bytes
+        self.cache = ResultCache(config_path, cache_entries, float(cache_mb) * (1 << 20), cache_dir)
+        self.queue_timeout = queue_timeout
+        self.workers = [CPPInferenceService(exe_path, config_path, autostart=False)
+                        for _ in range(max(1, int(pool_size)))]
+        # 启动状态: starting (加载引擎) -> warming (预热) -> ready / failed，各阶段耗时 (秒) 见 startup_times
+        self.state = "starting"
+        self.startup_times = {}
+        self._ready = threading.Event()
+
+        self._queue = queue.Queue(maxsize=max(1, int(queue_depth)))
+        # 凑 batch 时取出但不能合并的请求，下一轮优先派发
+        self._held = collections.deque()
+        self.metrics = ServiceMetrics()
+        self.metrics.registry.add_collector(self._collect_metrics)
+        self.tracer = Tracer(trace_file, trace_sample) if trace_file else None
+        self._cond = threading.Condition()
+        self._closed = False
+        self._dispatcher = threading.Thread(target=self._dispatch, daemon=True)
+        self._dispatcher.start()
+        # 引擎加载和预热放在后台，构造立即返回；就绪前提交的请求在队列中等待
+        threading.Thread(target=self._startup, args=(int(warmup),), daemon=True).start()
+
+    def _startup(self, warmup):
+        start = time.time()
+        # 各后端并行加载引擎
+        starters = [threading.Thread(target=w.start_service) for w in self.workers]
+        for t in starters:
+            t.start()
+        for t in starters:
+            t.join()
+        self.startup_times["backend"] = time.time() - start
+        alive = [w for w in self.workers if w.alive()]
+        if alive and warmup > 0:
+            self.state = "warming"
+            warm_start = time.time()
+            warmers = [threading.Thread(target=self._warmup, args=(w, warmup)) for w in alive]
+            for t in warmers:
+                t.start()
+            for t in warmers:
+                t.join()
+            self.startup_times["warmup"] = time.time() - warm_start
+        self.startup_times["total"] = time.time() - start
+        self.state = "ready" if alive else "failed"
+        self._ready.set()
+        print(self.describe_status())
+
+    @staticmethod
+    def _warmup(worker, count):
+        """用一张空白图跑 count 次推理 (不画框)，触发后端首次推理时的延迟初始化"""
+        data = cv2.imencode(".jpg", np.zeros((480, 640, 3), np.uint8))[1].tobytes()
+        for _ in range(count):
+            response, _ = infer_image_bytes(worker, data, render=False)
+            if not response.get("ok"):
+                print(f"预热失败: {response.get('error')}")
+                return
+
+    def wait_ready(self, timeout=None):
+        """等待后台启动结束，返回是否有可用的后端"""
+        self._ready.wait(timeout)
+        return self.state == "ready"
+
+    def describe_status(self):
+        """启动状态和各阶段耗时的一行说明"""
+        names = {"starting": "正在加载引擎", "warming": "正在预热", "ready": "就绪", "failed": "启动失败"}
+        text = f"后端状态: {names.get(self.state, self.state)}"
+        times = self.startup_times
+        if "total" in times:
+            text += f" | 启动耗时 {times['total']:.1f} s (引擎加载 {times['backend']:.1f} s"
+            if "warmup" in times:
+                text += f", 预热 {times['warmup']:.1f} s"
+            text += ")"
+        if self.state == "failed":
+            text += " | 请检查 exe_path 和 C++ 日志"
+        return text
+
+    @classmethod
+    def from_config(cls, config_path=CONFIG_PATH):
+        settings = load_webui_config(config_path)
+        max_batch = int(settings["max_batch"]) or engine_batch_size(config_path)
+        return cls(pool_size=settings["pool_size"], queue_depth=settings["queue_depth"],
+                   max_inflight=settings["max_inflight"], queue_timeout=settings["queue_timeout"],
+                   exe_path=settings["exe_path"], config_path=config_path,
+                   transport=settings["transport"], render=settings["render"],
+                   cache_entries=settings["cache_entries"], cache_mb=settings["cache_mb"],
+                   cache_dir=settings["cache_dir"], warmup=settings["warmup"],
+                   trace_file=settings["trace_file"], trace_sample=settings["trace_sample"],
+                   max_batch=max_batch, batch_wait_ms=settings["batch_wait_ms"])
+
+    @property
+    def capacity(self):
+        """池子最多同时接纳的请求数 (在途 + 排队)"""
+        return len(self.workers) * self.max_inflight + self._queue.maxsize
+
+    def submit(self, request, on_progress=None):
+        future = Future()
+        future.cancel_requested = False
+        future.inner = None
+        # 提交 / 派发时刻，用于排队时间和端到端延迟
+        future.submitted = (time.time(), time.perf_counter())
+        future.dispatched = None
+        try:
+            if self.queue_timeout:
+                self._queue.put((request, future, on_progress), timeout=self.queue_timeout)
+            else:
+                self._queue.put_nowait((request, future, on_progress))
+        except queue.Full:
+            self.metrics.rejected(_op_name(request))
+            future.set_result(error_response("", "推理队列已满，请稍后重试"))
+        return future
+
+    def infer(self, request, timeout=None):
+        return self.submit(request).result(timeout)
+
+    def cancel(self, future):
+        """取消 submit 返回的请求: 尚在队列中的直接丢弃，已派发的通知对应后端提前结束"""
+        with self._cond:
+            future.cancel_requested = True
+            inner = future.inner
+        if inner is not None:
+            inner.worker.cancel(inner)
+
+    def reload(self, config_path=None, timeout=None):
+        """
+        让池中每个后端重新读取配置，返回各后端的响应列表
+        阈值等就地生效；engine_file / 输入尺寸变化时后端会加载新引擎，期间排队的请求等待
+        reload 前后各作废一次结果缓存: 配置文件已写入而后端尚未生效期间的结果不会留在缓存中
+        """
+        self._ready.wait(timeout)
+        self.cache.invalidate()
+        futures = []
+        for w in self.workers:
+            request = {"op": "reload"}
+            if config_path:
+                request["path"] = os.path.abspath(config_path)
+            futures.append(w.submit(request, restart=False))
+        try:
+            return [f.result(timeout) for f in futures]
+        finally:
+            self.cache.invalidate()
+
+    def _pick_worker(self):
+        """在途请求最少的存活后端 (调用方持 _cond)；退出的后端在后台重启，不参与派发"""
+        now = time.time()
+        for w in self.workers:
+            if not w.alive() and not w.restarting and now >= w.next_restart:
+                self._restart_worker(w)
+        available = [w for w in self.workers if w.alive() and not w.restarting and w.in_flight < self.max_inflight]
+        if not available:
+            return None
+        return min(available, key=lambda w: w.in_flight)
+
+    def _restart_worker(self, worker):
+        """在单独的线程中重启后端 (调用方持 _cond)，结束后唤醒调度线程；失败时 RESTART_BACKOFF 秒内不再重试"""
+        worker.restarting = True
+
+        def run():
+            print(f"后端 {self.workers.index(worker)} 已退出，后台重启...")
+            worker.start_service()
+            with self._cond:
+                worker.restarting = False
+                if not worker.alive():
+                    worker.next_restart = time.time() + RESTART_BACKOFF
+                self._cond.notify_all()
+
+        threading.Thread(target=run, daemon=True).start()
+
+    def _serviceable(self):
+        """是否有后端存活或正在重启 (调用方持 _cond)，没有时请求直接失败而不是一直等待"""
+        return any(w.alive() or w.restarting for w in self.workers)
+
+    def _on_done(self, request, outer, inner):
+        response = inner.result() if inner is not None else error_response("", "cancelled")
+        self._observe(request, outer, response, inner)
+        outer.set_result(response)
+        with self._cond:
+            self._cond.notify()
+
+    def _on_batch_done(self, batch, inner):
+        """batch 响应按顺序拆回各请求；整条失败时每个请求都得到同一个错误"""
+        response = inner.result()
+        results = response.get("results") or []
+        for i, (request, future, _) in enumerate(batch):
+            if i < len(results):
+                item = results[i]
+                item.setdefault("timings", {})
+                item.setdefault("detections", [])
+            else:
+                item = error_response(response.get("id", ""), response.get("error") or "batch 响应缺少结果")
+            self._observe(request, future, item, inner)
+            future.set_result(item)
+        with self._cond:
+            self._cond.notify()
+
+    def _observe(self, request, future, response, inner):
+        """请求结束时更新指标，并按采样比例写追踪记录"""
+        op = _op_name(request)
+        done = time.perf_counter()
+        submit_wall, submit_perf = future.submitted
+        queue_wait = future.dispatched - submit_perf if future.dispatched is not None else None
+        self.metrics.observe_request(op, response, queue_wait, done - submit_perf)
+        if self.tracer is not None and self.tracer.sampled():
+            dispatched = submit_wall + queue_wait if queue_wait is not None else None
+            backend = self.workers.index(inner.worker) if inner is not None else None
+            trace_id = response.get("id") or getattr(inner, "request_id", "") or uuid.uuid4().hex[:8]
+            self.tracer.record(trace_id, op, response, submit_wall, dispatched,
+                               submit_wall + (done - submit_perf), backend)
+
+    def _next_item(self, timeout=None):
+        """先取凑 batch 时留下的请求，再取队列；超时返回 False"""
+        if self._held:
+            return self._held.popleft()
+        try:
+            return self._queue.get(timeout=timeout) if timeout is None or timeout > 0 else self._queue.get_nowait()
+        except queue.Empty:
+            return False
+
+    def _collect_batch(self, first):
+        """
+        以 first 开头凑一批可合并的请求: 凑满 max_batch 或距 first 提交超过 batch_wait 即停止
+        不能合并的请求放回 _held，保持原有顺序优先派发
+        """
+        batch = [first]
+        deadline = first[1].submitted[1] + self.batch_wait
+        skipped = []
+        while len(batch) < self.max_batch:
+            item = self._next_item(deadline - time.perf_counter())
+            if item is False:
+                break
+            if item is None or not _batchable(item[0]) or item[1].cancel_requested:
+                skipped.append(item)
+                if item is None:
+                    break
+                continue
+            batch.append(item)
+        self._held.extendleft(reversed(skipped))
+        return batch
+
+    def _dispatch(self):
+        self._ready.wait()
+        while True:
+            item = self._next_item()
+            if item is None:
+                break
+            request, future, on_progress = item
+            with self._cond:
+                if future.cancel_requested:
+                    self._on_done(request, future, None)
+                    continue
+                worker = self._pick_worker()
+                while worker is None and self._serviceable():
+                    self._cond.wait()
+                    worker = self._pick_worker()
+                if worker is None:
+                    self._observe(request, future, error_response("", "后端未运行"), None)
+                    future.set_result(error_response("", "后端未运行"))
+                    continue
+            # 有空闲后端后再凑 batch: 后端都忙时排队的请求本来就要等，不额外增加延迟
+            batch = self._collect_batch(item) if self.max_batch > 1 and _batchable(request) else [item]
+            with self._cond:
+                dispatched = time.perf_counter()
+                for _, f, _ in batch:
+                    f.dispatched = dispatched
+                if len(batch) == 1:
+                    inner = worker.submit(request, on_progress, restart=False)
+                    inner.worker = worker
+                    future.inner = inner
+                else:
+                    # batch 中的请求不设置 inner: 已派发后单个取消不生效，随整批返回
+                    items = [dict(r, id=str(i)) for i, (r, _, _) in enumerate(batch)]
+                    inner = worker.submit({"op": "batch", "items": items}, restart=False)
+                    inner.worker = worker
+            if len(batch) == 1:
+                inner.add_done_callback(lambda f, outer=future, request=request: self._on_done(request, outer, f))
+            else:
+                self.metrics.batch_size.observe(len(batch))
+                inner.add_done_callback(lambda f, batch=batch: self._on_batch_done(batch, f))
+
+    def _collect_metrics(self):
+        """导出 /metrics 前刷新队列、后端和缓存的瞬时值"""
+        m = self.metrics
+        m.queue_depth.set(self._queue.qsize())
+        m.queue_capacity.set(self._queue.maxsize)
+        m.ready.set(1 if self.state == "ready" else 0)
+        for phase, seconds in self.startup_times.items():
+            m.startup.set(round(seconds, 3), phase=phase)
+        for i, w in enumerate(self.workers):
+            m.in_flight.set(w.in_flight, backend=i)
+            m.backend_up.set(1 if w.alive() else 0, backend=i)
+            m.restarts.set_total(max(0, w.restarts), backend=i)
+        cache = self.cache.stats()
+        for event in ("hits", "misses", "evictions", "invalidations"):
+            m.cache.set_total(cache[event], event=event)
+        m.cache_entries.set(cache["entries"])
+        m.cache_bytes.set(cache["bytes"])
+
+    def stats(self):
+        return {
+            "state": self.state,
+            "startup": dict(self.startup_times),
+            "queue_depth": self._queue.qsize(),
+            "in_flight": [w.in_flight for w in self.workers],
+            "restarts": sum(max(0, w.restarts) for w in self.workers),
+            "cache": self.cache.stats(),
+        }
+
+    def recent_logs(self, n=20):
+        return "\n".join(w.recent_logs(n) for w in self.workers)
+
+    def close(self):
+        if not self._closed:
+            self._closed = True
+            self._queue.put(None)
+        for w in self.workers:
+            w.close()
+
+
+def _op_name(request):
+    return "infer" if isinstance(request, str) else request.get("op", "infer")
+
+
+def _batchable(request):
+    """单张图片的推理请求可以合并进 batch；视频、文件夹、流式请求和其他 op 单独派发"""
+    if not isinstance(request, dict) or request.get("op", "infer") != "infer" or request.get("stream"):
+        return False
+    if request.get("shm"):
+        return True
+    if os.path.isdir(request.get("path", "")):
+        return False
+    return os.path.splitext(request.get("path", ""))[1].lower() not in VIDEO_EXTS
+
+
+def release_shared_image(image):
+    """不读取，直接释放后端写入的共享内存段"""
+    try:
+        shm = shared_memory.SharedMemory(name=image["shm"].lstrip("/"))
+    except FileNotFoundError:
+        return
+    shm.close()
+    shm.unlink()
+
+
+def read_shared_image(image):
+    """取出后端写入共享内存的 BGR 结果图，并释放该段"""
+    shm = shared_memory.SharedMemory(name=image["shm"].lstrip("/"))
+    try:
+        shape = (image["height"], image["width"], image.get("channels", 3))
+        return np.ndarray(shape, dtype=np.uint8, buffer=shm.buf).copy()
+    finally:
+        shm.close()
+        shm.unlink()
+
+
+def infer_image_bytes(service, data, render=True):
+    """
+    经共享内存把编码后的图片字节交给后端，结果图也经共享内存取回，全程不落盘
+    render 为 False 时后端只回传检测结果，结果图在本地解码后用 draw_detections 画框
+    service 带 cache (ResultCache) 时相同输入直接返回缓存结果，响应带 cached，结果图只读
+    返回 (响应字典, BGR 结果图或 None)
+    """
+    cache = getattr(service, "cache", None)
+    key = None
+    generation = None
+    if cache is not None and cache.enabled:
+        # 先读 generation 再算键: 请求进行中发生 reload 时结果不缓存
+        generation = cache.generation
+        key = cache.key(data, render)
+        hit = cache.get(key)
+        if hit is not None:
+            return hit
+    shm_in = shared_memory.SharedMemory(create=True, size=max(1, len(data)))
+    try:
+        shm_in.buf[:len(data)] = data
+        request = {"op": "infer", "shm": "/" + shm_in.name, "size": len(data), "render": render}
+        if render:
+            request["output_shm"] = f"/v5l_out_{uuid.uuid4().hex[:16]}"
+        response = service.infer(request)
+    finally:
+        shm_in.close()
+        shm_in.unlink()
+    image = None
+    if response.get("ok"):
+        if "image" in response:
+            image = read_shared_image(response["image"])
+        elif not render:
+            image = cv2.imdecode(np.frombuffer(data, np.uint8), cv2.IMREAD_COLOR)
+            draw_detections(image, response["detections"])
+        if key is not None:
+            cache.put(key, response, image, generation)
+    return response, image
+
+
+def stream_video(service, video_path, every=5, preview_width=640, render=True, poll=0.1, on_submit=None,
+                 **fields):
+    """
+    流式视频推理的生成器，逐步产出 (记录, 预览图)
+    - 中间记录 op 为 progress，含 frame/frames_total/fps/detections，预览图为 BGR (render 为 False 时为 None)
+    - 最后产出最终响应 (op 为 infer)，预览图为 None
+    UI 来不及显示时只保留最新的一帧；生成器被提前关闭 (如关闭页面) 时通知后端停止
+    on_submit 在提交后以 future 调用: 经 cancel_streams 取消时生成器照常结束，最终响应带 cancelled 和已写出的部分结果
+    fields 为附加的请求字段 (如文件夹的 output_dir / restart)
+    """
+    updates = queue.Queue()
+
+    def on_progress(record):
+        # 在读响应线程中立即取出并释放共享内存，生成器提前退出也不会遗留
+        image = read_shared_image(record["preview"]) if "preview" in record else None
+        updates.put((record, image))
+
+    request = {"op": "infer", "path": os.path.abspath(video_path), "render": render,
+               "stream": max(1, int(every)), "preview_width": int(preview_width), **fields}
+    future = service.submit(request, on_progress=on_progress)
+    if on_submit is not None:
+        on_submit(future)
+    try:
+        while not future.done() or not updates.empty():
+            latest = None
+            try:
+                latest = updates.get(timeout=poll)
+                while True:
+                    latest = updates.get_nowait()
+            except queue.Empty:
+                pass
+            if latest is not None:
+                yield latest
+        yield future.result(), None
+    finally:
+        if not future.done():
+            service.cancel(future)
+
+
+def stream_folder(service, folder, output_dir="", restart=False, every=20, preview_width=640, render=True,
+                  on_submit=None):
+    """
+    流式文件夹推理，产出与 stream_video 相同 (frames_total 为 0)
+    结果写到 output_dir (为空时由后端按 config.yaml 决定)，中断后再次调用从检查点继续，restart 为 True 时从头开始
+    """
+    fields = {"restart": bool(restart)}
+    if output_dir:
+        fields["output_dir"] = os.path.abspath(output_dir)
+    return stream_video(service, folder, every, preview_width, render, on_submit=on_submit, **fields)
+
+
+def cancel_streams(service, futures):
+    """界面的停止按钮: 取消 futures (stream_video 的 on_submit 收集) 中尚未结束的请求，已结束的从列表中移除"""
+    futures[:] = [f for f in futures if not f.done()]
+    for future in futures:
+        service.cancel(future)
+
+
+def draw_detections(image, detections, color=(255, 0, 0)):
+    """在 BGR 图像上原地画出检测框，样式与 C++ 端 V5lite::DrawDetections 一致"""
+    for det in detections:
+        x, y, w, h = (int(v) for v in det["bbox"])
+        name = f"{det['label']}-{det['score']:.2f}"
+        cv2.putText(image, name, (x, y - 5), cv2.FONT_HERSHEY_COMPLEX, 0.7, color, 2)
+        cv2.rectangle(image, (x, y), (x + w, y + h), color, 2, cv2.LINE_8, 0)
+    return image
+
+
+def describe_reload(responses):
+    """把 reload 的响应整理成一行说明"""
+    failed = [r.get("error", "") for r in responses if not r.get("ok")]
+    if failed:
+        return "后端重新加载配置失败，仍使用原配置: " + "; ".join(failed)
+    if any(r.get("engine_reloaded") for r in responses):
+        return "后端已重新加载配置并切换到新引擎。"
+    return "后端已重新加载配置 (引擎未变化)。"
+
+
+def describe_response(response):
+    """把响应中的检测结果整理成可读文本"""
+    lines = []
+    detections = response.get("detections", [])
+    if response.get("cached"):
+        lines.append("结果来自缓存 (输入与配置均未变化)")
+    if response.get("frames", 0) > 1:
+        lines.append(f"帧数: {response['frames']}")
+    if response.get("tiles"):
+        lines.append(f"切片推理: {response['tiles']} 个 tile")
+    if response.get("detected_frames"):
+        lines.append(f"隔帧检测: {response['detected_frames']} / {response['frames']} 帧运行了检测，其余由跟踪外推")
+    if response.get("counts"):
+        counts = ", ".join(f"{label} {n}" for label, n in response["counts"].items())
+        lines.append(f"目标计数 (按轨迹): {counts}，共 {len(response.get('tracks', []))} 条轨迹")
+    if response.get("wall"):
+        lines.append(f"单帧耗时: {response['wall']:.1f} ms ({1000.0 / response['wall']:.1f} FPS)")
+    if response.get("queues"):
+        queues = ", ".join(f"{name} {value:.1f}" for name, value in response["queues"].items())
+        lines.append(f"队列平均占用: {queues}")
+    if response.get("output_bytes"):
+        lines.append(f"结果视频: {response['output_bytes'] / 2 ** 20:.1f} MB "
+                     f"({response.get('bytes_per_minute', 0) / 2 ** 20:.1f} MB/分钟)，"
+                     f"开始编码 {response.get('playable_ms', 0.0) / 1000.0:.1f} s 后可播放")
+    if response.get("sidecar"):
+        line = f"文件夹: 本次处理 {response.get('frames', 0)} 张图片，结果写到 {response.get('output', '')}"
+        if response.get("resumed"):
+            line += f"，从检查点继续 (跳过 {response['resumed']} 个已处理的文件)"
+        if response.get("unreadable"):
+            line += f"，{response['unreadable']} 个文件无法读取"
+        lines.append(line)
+        lines.append(f"逐图检测结果: {response['sidecar']}")
+    lines.append(f"检测目标数: {len(detections)}")
+    for det in detections:
+        x, y, w, h = det["bbox"]
+        lines.append(f"  {det['label']} {det['score']:.2f} @ [{x:.0f}, {y:.0f}, {w:.0f}, {h:.0f}]")
+    if not response.get("ok"):
+        lines.append(f"错误: {response.get('error', '')}")
+    return "\n".join(lines)
@@ -1,15 +1,13 @@
 import gradio as gr
-import subprocess
 import os
 import time
 import base64
+import functools
 
-# === 配置 ===
-# C++ 编译好的可执行文件路径
-EXE_PATH = "./build/v5lite_trt"  # 请根据实际编译输出路径修改
-CONFIG_PATH = "./config.yaml"   # 配置文件路径
-MODE_FLAG = "webui"              # 触发 C++ 进入循环模式的标志
+from metrics import start_metrics_server
+from trt_service import BackendPool, describe_response, infer_image_bytes, stream_video, cancel_streams, load_webui_config, CONFIG_PATH
 
+@functools.lru_cache(maxsize=8)
 def encode_image(image_path):
     if not os.path.exists(image_path):
         print(f"⚠️ 警告: 图片未找到 - {image_path}")
@@ -48,117 +46,49 @@ def get_bg_css(image_path):
         }}
         """
 
-class CPPInferenceService:
-    def __init__(self):
-        self.process = None
-        self.start_service()
+# 初始化服务 (后端进程池，大小与队列深度见 config.yaml 的 webui 段)
+service = BackendPool.from_config(CONFIG_PATH)
 
-    def start_service(self):
-        """启动 C++ 子进程"""
-        print("正在启动 C++ 推理后端...")
-        try:
-            # 相当于执行: ./v5lite_trt ../config.yaml webui
-            self.process = subprocess.Popen(
-                [EXE_PATH, CONFIG_PATH, MODE_FLAG],
-                stdin=subprocess.PIPE,
-                stdout=subprocess.PIPE,
-                stderr=subprocess.PIPE,
-                text=True,  # 以文本模式通信
-                bufsize=1   # 行缓冲
-            )
-            
-            # 等待 C++ 输出 "READY"
-            while True:
-                line = self.process.stdout.readline()
-                if "READY" in line:
-                    print("C++ 后端已就绪！")
-                    break
-                if line == "" and self.process.poll() is not None:
-                    print("C++ 后端启动失败，请检查路径或日志。")
-                    print(self.process.stderr.read())
-                    break
-        except Exception as e:
-            print(f"启动失败: {e}")
-
-    def infer(self, image_path):
-        """发送图片路径给 C++ 并获取结果"""
-        if self.process is None or self.process.poll() is not None:
-            print("后端未运行，尝试重启...")
-            self.start_service()
-            if self.process is None:
-                return None, "", 0, 0, 0
-
-        # 1. 发送路径 (加上换行符)
-        try:
-            self.process.stdin.write(os.path.abspath(image_path) + "\n")
-            self.process.stdin.flush()
-            
-            # 2. 读取详细输出信息
-            output_lines = []
-            result_path = ""
-            prep_time = 0.0
-            inf_time = 0.0
-            post_time = 0.0
-            
-            # 读取所有输出行，直到获取结果路径
-            while True:
-                line = self.process.stdout.readline()
-                if not line:
-                    break
-                
-                line = line.strip()
-                output_lines.append(line)
-                
-                # 提取推理时间信息
-                if "prepare image take:" in line:
-                    prep_time = float(line.split(":")[1].strip().split(" ")[0])
-                elif "Inference take:" in line:
-                    inf_time = float(line.split(":")[1].strip().split(" ")[0])
-                elif "Post process take:" in line:
-                    post_time = float(line.split(":")[1].strip().split(" ")[0])
-                # 检查是否为结果路径
-                elif os.path.exists(line):
-                    result_path = line
-                    break
-            
-            if "ERROR" in result_path or not os.path.exists(result_path):
-                print(f"推理错误: {result_path}")
-                return None, "\n".join(output_lines), prep_time, inf_time, post_time
-                
-            return result_path, "\n".join(output_lines), prep_time, inf_time, post_time
-        except Exception as e:
-            print(f"通信错误: {e}")
-            return None, str(e), 0, 0, 0
-
-    def close(self):
-        if self.process:
-            self.process.terminate()
-
-# 初始化服务
-service = CPPInferenceService()
-
-def run_inference(file):
+def run_inference(file, running):
+    """生成器: 图片产出一次结果；视频先逐步产出预览帧和进度，结束后产出结果视频 (停止时为已处理的部分)"""
     if file is None:
-        return None, None, "", 0, 0, 0
+        yield None, None, "", 0, 0, 0
+        return
     
-    # # Gradio 传入的是 numpy array，我们需要先存为临时文件供 C++ 读取
-    # temp_input = "temp_query.jpg"
-    # 注意：使用 OpenCV 保存，确保格式正确
     import cv2
-    # image 是 RGB (Gradio 默认)，OpenCV 需要 BGR
-    # cv2.imwrite(temp_input, cv2.cvtColor(image, cv2.COLOR_RGB2BGR))
     file_path = file.name
     file_ext = os.path.splitext(file_path)[1].lower()
-    
-    # 复制到临时文件
-    temp_input = f"temp_query{file_ext}"
-    import shutil
-    shutil.copy(file_path, temp_input)
-    
+    is_image = file_ext in ['.jpg', '.jpeg', '.png', '.bmp']
+
     # 调用 C++
-    output_path, output_info, prep_time, inf_time, post_time = service.infer(temp_input)
+    # 图片默认经共享内存传给后端并取回结果图，不落盘；视频及 file 模式直接传上传文件的路径
+    # (Gradio 的上传文件各自独立，不再复制到当前目录的 temp_query 文件)
+    res_img = None
+    if is_image and service.transport == "shm":
+        with open(file_path, "rb") as f:
+            response, res_img = infer_image_bytes(service, f.read(), render=service.render == "backend")
+    elif file_ext in ['.mp4', '.avi', '.mkv', '.mov']:
+        # 视频按进度回传预览帧；点击停止时后端提前结束并写完已处理的部分，关闭页面时生成器被关闭
+        for record, preview in stream_video(service, file_path, on_submit=running.append):
+            if record.get("op") != "progress":
+                response = record
+                break
+            frames_total = record.get("frames_total", 0)
+            progress = f"处理中: 帧 {record['frame'] + 1}/{frames_total if frames_total > 0 else '?'}\n"
+            progress += f"FPS: {record.get('fps', 0.0):.1f}\n"
+            progress += f"当前帧检测目标数: {len(record.get('detections', []))}"
+            frame = cv2.cvtColor(preview, cv2.COLOR_BGR2RGB) if preview is not None else None
+            yield frame, None, progress, 0, 0, record.get("fps", 0.0)
+    else:
+        response = service.infer(file_path)
+    timings = response["timings"]
+    prep_time = timings.get("preprocess", 0.0)
+    inf_time = timings.get("execute", 0.0)
+    post_time = timings.get("postprocess", 0.0)
+    output_path = response.get("output")
+    output_info = describe_response(response)
     
-    if output_path:
+    if response.get("ok"):
         # 读取结果并转回 RGB 供 Gradio 显示
         #res_img = cv2.imread(output_path)
         total_time = prep_time + inf_time + post_time
@@ -168,40 +98,39 @@ def run_inference(file):
         details += f"推理时间: {inf_time:.2f} ms\n"
         details += f"后处理时间: {post_time:.2f} ms\n"
         details += f"总时间: {total_time:.2f} ms\n\n"
-        details += f"C++ 输出信息:\n{output_info}"
+        details += f"检测结果:\n{output_info}"
         
         # 计算 FPS
         fps = 1000 / total_time if total_time > 0 else 0
         
         
         # 根据文件类型返回不同结果
-        if file_ext in ['.jpg', '.jpeg', '.png', '.bmp']:
+        if is_image:
             # 读取结果并转回 RGB 供 Gradio 显示
-            res_img = cv2.imread(output_path)
-            return cv2.cvtColor(res_img, cv2.COLOR_BGR2RGB), None, details, prep_time, inf_time, fps
+            if res_img is None:
+                res_img = cv2.imread(output_path)
+            yield cv2.cvtColor(res_img, cv2.COLOR_BGR2RGB), None, details, prep_time, inf_time, fps
         elif file_ext in ['.mp4', '.avi', '.mkv', '.mov']:
             # 对于视频，返回视频路径
-            return None, output_path, details, prep_time, inf_time, fps
+            if response.get("cancelled"):
+                details = f"已停止，输出为前 {response.get('frames', 0)} 帧\n\n" + details
+            yield None, output_path, details, prep_time, inf_time, fps
         else:
-            return None, None, f"不支持的文件类型: {file_ext}", 0, 0, 0
+            yield None, None, f"不支持的文件类型: {file_ext}", 0, 0, 0
     else:
-        return None, None, f"推理失败\n\n{output_info}", 0, 0, 0
+        yield None, None, f"推理失败\n\n{output_info}\n\nC++ 日志:\n{service.recent_logs()}", 0, 0, 0
 
-# 定义界面
-# 生成 CSS 字符串
-my_css = get_bg_css("/media/F/hbf/YOLOv5-Lite-master/cpp_demo/tensorrt/tree/background.png")
-with gr.Blocks(css=my_css, title="C++ Backend Inference") as demo:
-    # 添加CSS样式，设置背景图
-    
+def stop_inference(running):
+    """停止按钮: 经进程池取消本页面正在处理的视频，run_inference 随后产出带 cancelled 的最终响应"""
+    cancel_streams(service, running)
 
-    logo_path = "/media/F/hbf/YOLOv5-Lite-master/cpp_demo/tensorrt/samples/xidian.jpg"
-    logo_src = encode_image(logo_path)
+# 定义界面
+LOGO_PATH = "/media/F/hbf/YOLOv5-Lite-master/cpp_demo/tensorrt/samples/xidian.jpg"
 
-    # 添加logo
-    with gr.Row():
-        # === 替换开始 ===
-        
-        gr.HTML(f"""
+def header_html():
+    """标题栏，logo 在页面加载时才读取编码，不拖慢启动"""
+    logo_src = encode_image(LOGO_PATH)
+    return f"""
         <div style="display: flex; align-items: center; gap: 30px; padding: 10px 0;">
             <!-- 左侧 Logo -->
             <div style="width: 100px; height: 100px; flex-shrink: 0; display: flex; align-items: center; justify-content: center;">
@@ -228,16 +157,41 @@ with gr.Blocks(css=my_css, title="C++ Backend Inference") as demo:
             </h1>
         </div>
         </div>
-        """)
+        """
+
+def poll_backend_status():
+    """状态栏定时刷新，后端就绪 (或启动失败) 后停止刷新"""
+    return service.describe_status(), gr.Timer(active=service.state in ("starting", "warming"))
+
+# 背景样式需在构建界面时给出，图片只编码一次
+ui_start = time.time()
+my_css = get_bg_css("/media/F/hbf/YOLOv5-Lite-master/cpp_demo/tensorrt/tree/background.png")
+css_seconds = time.time() - ui_start
+with gr.Blocks(css=my_css, title="C++ Backend Inference") as demo:
+    # 添加CSS样式，设置背景图
+    
+
+    # 添加logo
+    with gr.Row():
+        # === 替换开始 ===
+        
+        gr.HTML(header_html)
         # === 替换结束 ===
 
+    # 后端在后台加载引擎和预热，状态栏每秒刷新直到就绪；就绪前提交的请求排队等待
+    status_md = gr.Markdown(service.describe_status)
+    status_timer = gr.Timer(1.0)
+    status_timer.tick(poll_backend_status, outputs=[status_md, status_timer])
+
     
     with gr.Row():
         inp = gr.File(label="上传图片或视频", file_types=["image", "video"], height=500)
         with gr.Column():
             img_out = gr.Image(label="推理结果", height=240)
             vid_out = gr.Video(label="推理结果", height=240)
-    btn = gr.Button("开始推理", variant="primary")
+    with gr.Row():
+        btn = gr.Button("开始推理", variant="primary")
+        stop_btn = gr.Button("停止")
     with gr.Row():
         details = gr.Textbox(label="推理详细信息", lines=10, interactive=False)
         
@@ -247,10 +201,20 @@ with gr.Blocks(css=my_css, title="C++ Backend Inference") as demo:
         fps = gr.Number(label="FPS", interactive=False)
         
     
-    btn.click(run_inference, inputs=inp, outputs=[img_out, vid_out, details, prep_time, inf_time, fps])
+    # 本页面已提交的视频请求，停止按钮经进程池取消，run_inference 照常产出已写出的部分视频
+    running = gr.State([])
+    btn.click(run_inference, inputs=[inp, running], outputs=[img_out, vid_out, details, prep_time, inf_time, fps],
+              concurrency_limit=service.capacity)
+    stop_btn.click(stop_inference, inputs=[running])
 
 if __name__ == "__main__":
+    print(f"界面就绪: 背景样式 {css_seconds:.2f} s, 界面构建 {time.time() - ui_start - css_seconds:.2f} s; "
+          f"{service.describe_status()}")
+    metrics_port = load_webui_config(CONFIG_PATH)["metrics_port"]
+    metrics_server = start_metrics_server(service.metrics.registry, metrics_port) if metrics_port else None
     try:
         demo.launch(server_name="0.0.0.0", server_port=7860)
     finally:
+        if metrics_server is not None:
+            metrics_server.shutdown()
         service.close()
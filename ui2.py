@@ -1,24 +1,25 @@
 import gradio as gr
 import yaml
 import os
-import subprocess
 import shutil
 import time
 import base64
+import functools
+import collections
 
 # --- 全局配置与路径 ---
 
-# 假设 export.py 在当前目录下 (YOLOv5 导出脚本)
-EXPORT_SCRIPT = "export.py" 
-# 假设 trtexec 已在系统环境变量中，否则请写绝对路径 (例如: /usr/src/tensorrt/bin/trtexec)
-TRTEXEC_CMD = "/usr/src/tensorrt/bin/trtexec"  
+from metrics import start_metrics_server
+from trt_service import BackendPool, describe_reload, describe_response, infer_image_bytes, stream_folder, stream_video, cancel_streams, load_webui_config, CONFIG_PATH
+from model_registry import ArtifactRegistry, ConversionJobs, load_convert_config, select_engine
 
-# === 配置 ===
-# C++ 编译好的可执行文件路径
-EXE_PATH = "./build/v5lite_trt"  # 请根据实际编译输出路径修改
-CONFIG_PATH = "./config.yaml"   # 配置文件路径
-MODE_FLAG = "webui"              # 触发 C++ 进入循环模式的标志
+# export.py / trtexec 的路径、转换产物目录和并发任务数见 config.yaml 的 convert 段
+registry = ArtifactRegistry.from_config(CONFIG_PATH)
+conversion_jobs = ConversionJobs(registry, load_convert_config(CONFIG_PATH)["max_jobs"])
+# 转换日志框最多显示的行数，完整日志见 artifact_dir/logs/<任务号>.log
+LOG_VIEW_LINES = 400
 
+@functools.lru_cache(maxsize=8)
 def encode_image(image_path):
     if not os.path.exists(image_path):
         print(f"⚠️ 警告: 图片未找到 - {image_path}")
@@ -123,7 +124,7 @@ def save_config(new_content):
         yaml.safe_load(new_content)
         with open(CONFIG_PATH, "w", encoding="utf-8") as f:
             f.write(new_content)
-        return "配置已成功保存 (Configuration saved successfully)."
+        return "配置已成功保存 (Configuration saved successfully).\n" + describe_reload(service.reload())
     except yaml.YAMLError as e:
         return f"YAML 格式错误 (Invalid YAML format): {e}"
     except Exception as e:
@@ -134,124 +135,107 @@ def upload_config_file(file):
         return load_config(), "未上传文件"
     try:
         shutil.copy(file.name, CONFIG_PATH)
-        return load_config(), "配置已通过文件覆盖更新。"
+        return load_config(), "配置已通过文件覆盖更新。\n" + describe_reload(service.reload())
     except Exception as e:
         return load_config(), f"文件覆盖失败: {e}"
 def convert_model_pipeline(pt_file, input_size=640, batch_size=1, precision="fp16"):
     """
     一键转换流水线: PyTorch (.pt) -> ONNX -> TensorRT (.engine)
-    后端自动调用 export.py 和 trtexec
+    转换在后台任务中执行 (export.py 和 trtexec)，这里只流式显示日志；
+    相同权重 / 参数 / 工具版本的产物已存在时直接复用
     """
     if pt_file is None:
-        return "请先上传 .pt 模型文件。"
+        yield "请先上传 .pt 模型文件。", gr.update(), ""
+        return
 
-    logs = []
-    
-    # [...](asc_slot://start-slot-19)获取文件路径
-    pt_path = pt_file.name
-    # [...](asc_slot://start-slot-21)提取文件名 (不带后缀)
-    base_name = os.path.splitext(os.path.basename(pt_path))[0]
-    # [...](asc_slot://start-slot-23)定义输出路径 (默认保存到当前运行目录，方便后续调用)
-    output_dir = os.getcwd()
-    onnx_path = os.path.join(output_dir, f"{base_name}.onnx")
-    engine_path = os.path.join(output_dir, f"{base_name}.engine")
-
-    logs.append(f"====== 开始转换流程: {base_name} ======")
-    
-    # [...](asc_slot://start-slot-27)--- 步骤 1: PyTorch -> ONNX ---
-    logs.append(f"[Step 1] 正在导出 ONNX: {pt_path} -> {onnx_path} ...")
-    
-    # [...](asc_slot://start-slot-29)构造 export.py 命令 (参考 YOLOv5 标准导出参数)
-    # [...](asc_slot://start-slot-31)注意：你需要确保目录下有 export.py，或者修改此处路径指向 YOLOv5 的 export.py
-    cmd_export = [
-        "python", EXPORT_SCRIPT,
-        "--weights", pt_path,
-        "--img-size", str(input_size),
-        "--batch-size", str(batch_size),
-        "--device", "0",
-    ]
-    
-    try:
-        # 执行导出命令
-        process = subprocess.run(cmd_export, capture_output=True, text=True, check=True)
-        logs.append("[Export Log]:\n" + process.stdout)
-    except subprocess.CalledProcessError as e:
-        return "\n".join(logs) + f"\n[Error] ONNX 导出失败:\n{e.stderr}"
-    except FileNotFoundError:
-        return "\n".join(logs) + f"\n[Error] 找不到 {EXPORT_SCRIPT}，请确保该脚本在根目录下。"
-
-    # [...](asc_slot://start-slot-33)检查 ONNX 是否生成 (通常 export.py 会在 pt 文件同级生成，或我们需要将其移动)
-    # [...](asc_slot://start-slot-35)这里做一个简单的查找逻辑
-    generated_onnx_temp = pt_path.replace(".pt", ".onnx")
-    if os.path.exists(generated_onnx_temp):
-        # [...](asc_slot://start-slot-37)如果生成在临时目录，移动到当前工作目录
-        if generated_onnx_temp != onnx_path:
-            shutil.move(generated_onnx_temp, onnx_path)
-    
-    if not os.path.exists(onnx_path):
-         # [...](asc_slot://start-slot-39)尝试直接在当前目录找
-         if not os.path.exists(f"{base_name}.onnx"):
-            return "\n".join(logs) + "\n[Error] 未检测到生成的 ONNX 文件。"
-         else:
-            onnx_path = os.path.join(output_dir, f"{base_name}.onnx")
+    job = conversion_jobs.submit(pt_file.name, int(input_size), int(batch_size), precision)
+    view = collections.deque(maxlen=LOG_VIEW_LINES)
+    for lines, finished in job.follow():
+        if not lines and not finished:
+            continue
+        view.extend(lines)
+        text = "\n".join(view)
+        if len(job.lines) > LOG_VIEW_LINES:
+            text = f"(只显示最近 {LOG_VIEW_LINES} 行，完整日志: {job.log_path})\n" + text
+        if not finished:
+            yield text, gr.update(), job.id
+    if job.status == "done":
+        text += "\n可在下方 \"已构建的引擎\" 中选择该引擎写入 config.yaml"
+        yield text, gr.update(choices=engine_choices(), value=job.result["path"]), job.id
+    else:
+        yield text, gr.update(), job.id
 
-    logs.append(f"[Success] ONNX 文件已就绪: {onnx_path}")
+def cancel_conversion(job_id):
+    if job_id and conversion_jobs.cancel(job_id):
+        return f"已请求取消任务 {job_id}"
+    return "没有正在进行的转换任务。"
 
-    # [...](asc_slot://start-slot-45)--- 步骤 2: ONNX -> TensorRT ---
-    logs.append(f"[Step 2] 正在构建 TensorRT 引擎 (使用 trtexec) ...")
-    
-    # [...](asc_slot://start-slot-47)构造 trtexec 命令
-    cmd_trtexec = [
-        TRTEXEC_CMD,
-        f"--onnx={onnx_path}",
-        f"--saveEngine={engine_path}",
-        
-        "--verbose"
-    ]
-    if precision == "fp16":
-        cmd_trtexec.append("--fp16") 
-    elif precision == "int8":
-        cmd_trtexec.append("--int8")
+def engine_choices():
+    """已构建引擎的下拉选项: (说明, 引擎路径)"""
+    choices = []
+    for e in registry.engines():
+        built = time.strftime("%Y-%m-%d %H:%M", time.localtime(e["created"]))
+        label = f"{e['weights']} | {e['imgsz']} | b{e['batch']} | {e['precision']} | {built} ({e['build_seconds']} s)"
+        choices.append((label, e["path"]))
+    return choices
 
-    try:
-        process = subprocess.run(cmd_trtexec, capture_output=True, text=True, check=True)
-        # trtexec 输出通常很长，这里只截取最后一部分或显示成功信息
-        logs.append("[trtexec Log]: (Output truncated for brevity...)\n" + process.stdout[-1000:]) 
-        logs.append(f"\n====== 转换成功! ======")
-        logs.append(f"Engine saved to: {engine_path}")
-    except subprocess.CalledProcessError as e:
-        logs.append(f"\n[Error] trtexec 转换失败:\n{e.stderr}")
-        return "\n".join(logs)
-    except FileNotFoundError:
-        return "\n".join(logs) + f"\n[Error] 找不到命令 '{TRTEXEC_CMD}'。请确保 TensorRT 已安装并添加到 PATH 环境变量。"
-
-    return "\n".join(logs)
+def refresh_engines():
+    return gr.update(choices=engine_choices())
+
+def use_engine(engine_path):
+    """把选中的引擎 (及其 ONNX、输入尺寸、batch) 写入 config.yaml"""
+    for e in registry.engines():
+        if e["path"] == engine_path:
+            select_engine(e, CONFIG_PATH)
+            return f"已设为当前引擎: {engine_path}\n" + describe_reload(service.reload())
+    return "请先选择一个已构建的引擎。"
 
 # =============================================================================
 # 2. [...](asc_slot://start-slot-51)现有功能包装 (CPPInference)
 # =============================================================================
-def run_inference(file):
+# 初始化服务 (后端进程池，大小与队列深度见 config.yaml 的 webui 段)
+service = BackendPool.from_config(CONFIG_PATH)
+
+def run_inference(file, running):
+    """生成器: 图片产出一次结果；视频先逐步产出预览帧和进度，结束后产出结果视频 (停止时为已处理的部分)"""
     if file is None:
-        return None, None, "", 0, 0, 0
+        yield None, None, "", 0, 0, 0
+        return
     
-    # # Gradio 传入的是 numpy array，我们需要先存为临时文件供 C++ 读取
-    # temp_input = "temp_query.jpg"
-    # 注意：使用 OpenCV 保存，确保格式正确
     import cv2
-    # image 是 RGB (Gradio 默认)，OpenCV 需要 BGR
-    # cv2.imwrite(temp_input, cv2.cvtColor(image, cv2.COLOR_RGB2BGR))
     file_path = file.name
     file_ext = os.path.splitext(file_path)[1].lower()
-    
-    # 复制到临时文件
-    temp_input = f"temp_query{file_ext}"
-    import shutil
-    shutil.copy(file_path, temp_input)
-    
+    is_image = file_ext in ['.jpg', '.jpeg', '.png', '.bmp']
+
     # 调用 C++
-    output_path, output_info, prep_time, inf_time, post_time = service.infer(temp_input)
+    # 图片默认经共享内存传给后端并取回结果图，不落盘；视频及 file 模式直接传上传文件的路径
+    # (Gradio 的上传文件各自独立，不再复制到当前目录的 temp_query 文件)
+    res_img = None
+    if is_image and service.transport == "shm":
+        with open(file_path, "rb") as f:
+            response, res_img = infer_image_bytes(service, f.read(), render=service.render == "backend")
+    elif file_ext in ['.mp4', '.avi', '.mkv', '.mov']:
+        # 视频按进度回传预览帧；点击停止时后端提前结束并写完已处理的部分，关闭页面时生成器被关闭
+        for record, preview in stream_video(service, file_path, on_submit=running.append):
+            if record.get("op") != "progress":
+                response = record
+                break
+            frames_total = record.get("frames_total", 0)
+            progress = f"处理中: 帧 {record['frame'] + 1}/{frames_total if frames_total > 0 else '?'}\n"
+            progress += f"FPS: {record.get('fps', 0.0):.1f}\n"
+            progress += f"当前帧检测目标数: {len(record.get('detections', []))}"
+            frame = cv2.cvtColor(preview, cv2.COLOR_BGR2RGB) if preview is not None else None
+            yield frame, None, progress, 0, 0, record.get("fps", 0.0)
+    else:
+        response = service.infer(file_path)
+    timings = response["timings"]
+    prep_time = timings.get("preprocess", 0.0)
+    inf_time = timings.get("execute", 0.0)
+    post_time = timings.get("postprocess", 0.0)
+    output_path = response.get("output")
+    output_info = describe_response(response)
     
-    if output_path:
+    if response.get("ok"):
         # 读取结果并转回 RGB 供 Gradio 显示
         #res_img = cv2.imread(output_path)
         total_time = prep_time + inf_time + post_time
@@ -261,40 +245,67 @@ def run_inference(file):
         details += f"推理时间: {inf_time:.2f} ms\n"
         details += f"后处理时间: {post_time:.2f} ms\n"
         details += f"总时间: {total_time:.2f} ms\n\n"
-        details += f"C++ 输出信息:\n{output_info}"
+        details += f"检测结果:\n{output_info}"
         
         # 计算 FPS
         fps = 1000 / total_time if total_time > 0 else 0
         
         
         # 根据文件类型返回不同结果
-        if file_ext in ['.jpg', '.jpeg', '.png', '.bmp']:
+        if is_image:
             # 读取结果并转回 RGB 供 Gradio 显示
-            res_img = cv2.imread(output_path)
-            return cv2.cvtColor(res_img, cv2.COLOR_BGR2RGB), None, details, prep_time, inf_time, fps
+            if res_img is None:
+                res_img = cv2.imread(output_path)
+            yield cv2.cvtColor(res_img, cv2.COLOR_BGR2RGB), None, details, prep_time, inf_time, fps
         elif file_ext in ['.mp4', '.avi', '.mkv', '.mov']:
             # 对于视频，返回视频路径
-            return None, output_path, details, prep_time, inf_time, fps
+            if response.get("cancelled"):
+                details = f"已停止，输出为前 {response.get('frames', 0)} 帧\n\n" + details
+            yield None, output_path, details, prep_time, inf_time, fps
         else:
-            return None, None, f"不支持的文件类型: {file_ext}", 0, 0, 0
+            yield None, None, f"不支持的文件类型: {file_ext}", 0, 0, 0
     else:
-        return None, None, f"推理失败\n\n{output_info}", 0, 0, 0
+        yield None, None, f"推理失败\n\n{output_info}\n\nC++ 日志:\n{service.recent_logs()}", 0, 0, 0
+
+def stop_inference(running):
+    """停止按钮: 经进程池取消本页面正在处理的视频 / 文件夹，对应的生成器随后产出带 cancelled 的最终响应"""
+    cancel_streams(service, running)
+
+def run_folder(folder, output_dir, restart, running):
+    """生成器: 文件夹批量推理，逐步产出预览图和进度；中断后再次运行从检查点继续"""
+    import cv2
+    folder = (folder or "").strip()
+    if not folder or not os.path.isdir(folder):
+        yield None, f"文件夹不存在: {folder}"
+        return
+    # 停止 (或关闭页面) 时后端停在当前检查点，下次运行从这里继续
+    for record, preview in stream_folder(service, folder, (output_dir or "").strip(), restart,
+                                         on_submit=running.append):
+        if record.get("op") == "progress":
+            progress = f"处理中: 第 {record['frame'] + 1} 张\n"
+            progress += f"速度: {record.get('fps', 0.0):.1f} 张/秒\n"
+            progress += f"当前图片检测目标数: {len(record.get('detections', []))}"
+            frame = cv2.cvtColor(preview, cv2.COLOR_BGR2RGB) if preview is not None else None
+            yield frame, progress
+            continue
+        if not record.get("ok"):
+            yield None, f"处理失败\n\n{describe_response(record)}\n\nC++ 日志:\n{service.recent_logs()}"
+        elif record.get("cancelled"):
+            yield None, "已停止，再次运行从检查点继续\n\n" + describe_response(record)
+        else:
+            yield None, "处理完成\n\n" + describe_response(record)
 
 # =============================================================================
 # 3. 前端页面布局 (Gradio)
 # =============================================================================
 
 # [...](asc_slot://start-slot-65)自定义 CSS 样式
-my_css = get_bg_css("/media/F/hbf/YOLOv5-Lite-master/cpp_demo/tensorrt/tree/background.png")
-with gr.Blocks(css=my_css, title="TensorRT Inference Platform") as demo:
-    logo_path = "/media/F/hbf/YOLOv5-Lite-master/cpp_demo/tensorrt/samples/xidian.jpg"
-    logo_src = encode_image(logo_path)
+LOGO_PATH = "/media/F/hbf/YOLOv5-Lite-master/cpp_demo/tensorrt/samples/xidian.jpg"
 
-    # 添加logo
-    with gr.Row():
-        # === 替换开始 ===
-        
-        gr.HTML(f"""
+def header_html():
+    """标题栏，logo 在页面加载时才读取编码，不拖慢启动"""
+    logo_src = encode_image(LOGO_PATH)
+    return f"""
         <div style="display: flex; align-items: center; gap: 30px; padding: 10px 0;">
             <!-- 左侧 Logo -->
             <div style="width: 100px; height: 100px; flex-shrink: 0; display: flex; align-items: center; justify-content: center;">
@@ -321,8 +332,29 @@ with gr.Blocks(css=my_css, title="TensorRT Inference Platform") as demo:
             </h1>
         </div>
         </div>
-        """)
+        """
+
+def poll_backend_status():
+    """状态栏定时刷新，后端就绪 (或启动失败) 后停止刷新"""
+    return service.describe_status(), gr.Timer(active=service.state in ("starting", "warming"))
+
+# 背景样式需在构建界面时给出，图片只编码一次
+ui_start = time.time()
+my_css = get_bg_css("/media/F/hbf/YOLOv5-Lite-master/cpp_demo/tensorrt/tree/background.png")
+css_seconds = time.time() - ui_start
+with gr.Blocks(css=my_css, title="TensorRT Inference Platform") as demo:
+
+    # 添加logo
+    with gr.Row():
+        # === 替换开始 ===
+        
+        gr.HTML(header_html)
         # === 替换结束 ===
+
+    # 后端在后台加载引擎和预热，状态栏每秒刷新直到就绪；就绪前提交的请求排队等待
+    status_md = gr.Markdown(service.describe_status)
+    status_timer = gr.Timer(1.0)
+    status_timer.tick(poll_backend_status, outputs=[status_md, status_timer])
     
     with gr.Tabs():
         
@@ -343,16 +375,32 @@ with gr.Blocks(css=my_css, title="TensorRT Inference Platform") as demo:
                             value="fp16",
                             label="量化精度选择"
                         )
-                    convert_btn = gr.Button("一键转换", variant="primary")
+                    with gr.Row():
+                        convert_btn = gr.Button("一键转换", variant="primary")
+                        cancel_convert_btn = gr.Button("取消转换")
                 
                 with gr.Column(scale=2):
                     log_output = gr.Textbox(label="转换日志 (Conversion Logs)", lines=15, autoscroll=True)
 
+            gr.Markdown("### 已构建的引擎")
+            with gr.Row():
+                engine_dropdown = gr.Dropdown(choices=engine_choices(), label="权重 | 输入尺寸 | batch | 精度 | 构建时间",
+                                              scale=3)
+                refresh_engines_btn = gr.Button("刷新", scale=1)
+                use_engine_btn = gr.Button("设为当前引擎", variant="primary", scale=1)
+            engine_status = gr.Textbox(label="状态", interactive=False)
+
+            job_id_state = gr.State("")
+            # 转换在后台任务队列中执行，不限制这里的并发 (并发数见 convert.max_jobs)
             convert_btn.click(
                 fn=convert_model_pipeline,
                 inputs=[pt_file, input_size_num, batch_size_num, precision_dropdown],
-                outputs=[log_output]
+                outputs=[log_output, engine_dropdown, job_id_state],
+                concurrency_limit=None
             )
+            cancel_convert_btn.click(fn=cancel_conversion, inputs=[job_id_state], outputs=[engine_status])
+            refresh_engines_btn.click(fn=refresh_engines, inputs=[], outputs=[engine_dropdown])
+            use_engine_btn.click(fn=use_engine, inputs=[engine_dropdown], outputs=[engine_status])
 
         # [...](asc_slot://start-slot-73)--- 选项卡 2: 参数调整 (新增) ---
         with gr.Tab("参数调整"):
@@ -385,7 +433,9 @@ with gr.Blocks(css=my_css, title="TensorRT Inference Platform") as demo:
                 with gr.Column():
                     img_out = gr.Image(label="推理结果", height=240)
                     vid_out = gr.Video(label="推理结果", height=240)
-            btn = gr.Button("开始推理", variant="primary")
+            with gr.Row():
+                btn = gr.Button("开始推理", variant="primary")
+                stop_btn = gr.Button("停止")
             with gr.Row():
                 details = gr.Textbox(label="推理详细信息", lines=10, interactive=False)
                 
@@ -395,8 +445,40 @@ with gr.Blocks(css=my_css, title="TensorRT Inference Platform") as demo:
                 fps = gr.Number(label="FPS", interactive=False)
                 
             
-            btn.click(run_inference, inputs=inp, outputs=[img_out, vid_out, details, prep_time, inf_time, fps])
+            # 本页面已提交的视频请求，停止按钮经进程池取消，run_inference 照常产出已写出的部分视频
+            running = gr.State([])
+            btn.click(run_inference, inputs=[inp, running], outputs=[img_out, vid_out, details, prep_time, inf_time, fps],
+                      concurrency_limit=service.capacity)
+            stop_btn.click(stop_inference, inputs=[running])
+
+        # --- 选项卡 4: 批量处理 (服务器上的文件夹) ---
+        with gr.Tab("批量处理"):
+            with gr.Row():
+                with gr.Column(scale=1):
+                    folder_path = gr.Textbox(label="图片文件夹 (服务器路径，含子目录)")
+                    folder_output = gr.Textbox(label="输出目录 (为空时用 config.yaml 的 output_dir，再为空时为 <文件夹>_out)")
+                    folder_restart = gr.Checkbox(label="忽略检查点，从头处理", value=False)
+                    with gr.Row():
+                        folder_btn = gr.Button("开始处理", variant="primary")
+                        folder_stop_btn = gr.Button("停止")
+                with gr.Column(scale=1):
+                    folder_preview = gr.Image(label="当前图片", height=320)
+            folder_details = gr.Textbox(label="处理进度", lines=10, interactive=False)
+
+            folder_running = gr.State([])
+            folder_btn.click(run_folder, inputs=[folder_path, folder_output, folder_restart, folder_running],
+                             outputs=[folder_preview, folder_details], concurrency_limit=service.capacity)
+            folder_stop_btn.click(stop_inference, inputs=[folder_running])
             
 
 if __name__ == "__main__":
-    demo.launch(server_name="0.0.0.0", share=False)
+    print(f"界面就绪: 背景样式 {css_seconds:.2f} s, 界面构建 {time.time() - ui_start - css_seconds:.2f} s; "
+          f"{service.describe_status()}")
+    metrics_port = load_webui_config(CONFIG_PATH)["metrics_port"]
+    metrics_server = start_metrics_server(service.metrics.registry, metrics_port) if metrics_port else None
+    try:
+        demo.launch(server_name="0.0.0.0", share=False)
+    finally:
+        if metrics_server is not None:
+            metrics_server.shutdown()
+        service.close()
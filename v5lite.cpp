@@ -1,11 +1,34 @@
+#include <algorithm>
+#include <cassert>
+#include <fstream>
+#include <stdexcept>
+#include <atomic>
+#include <mutex>
+#include <sstream>
+#include <thread>
+#include <unistd.h>
 #include "v5lite.h"
 #include "yaml-cpp/yaml.h"
-#include "common.hpp"
+#include "utils.h"
+#include "protocol.h"
+#include "preprocess.h"
+#include "postprocess.h"
+#include "pipeline.h"
+#include "tracker.h"
+#include "session.h"
+#include "video_encoder.h"
 
 V5lite::V5lite(const std::string &config_file) {
     YAML::Node root = YAML::LoadFile(config_file);
     YAML::Node config = root;
     engine_file = config["engine_file"].as<std::string>();
+    // 推理后端: tensorrt (默认，加载 engine_file) / opencv (纯 CPU，加载 onnx_file)
+    backend_type = config["backend"] ? config["backend"].as<std::string>() : "tensorrt";
+    if (config["onnx_file"])
+        onnx_file = config["onnx_file"].as<std::string>();
+    else
+        onnx_file = engine_file.substr(0, engine_file.find_last_of('.')) + ".onnx";
+    cpu_threads = config["cpu_threads"] ? config["cpu_threads"].as<int>() : 0;
     labels_file = config["labels_file"].as<std::string>();
     BATCH_SIZE = config["BATCH_SIZE"].as<int>();
     INPUT_CHANNEL = config["INPUT_CHANNEL"].as<int>();
@@ -13,487 +36,1074 @@ V5lite::V5lite(const std::string &config_file) {
     IMAGE_HEIGHT = config["IMAGE_HEIGHT"].as<int>();
     obj_threshold = config["obj_threshold"].as<float>();
     nms_threshold = config["nms_threshold"].as<float>();
+    // NMS 重叠度量: diou (默认，与旧版一致) / iou；max_det 为每张图最多输出的框数，0 表示不限制
+    nms_type = config["nms_type"] ? config["nms_type"].as<std::string>() : "diou";
+    max_det = config["max_det"] ? config["max_det"].as<int>() : 0;
     strides = config["strides"].as<std::vector<int>>();
     num_anchors = config["num_anchors"].as<std::vector<int>>();
     assert(strides.size() == num_anchors.size());
     anchors = config["anchors"].as<std::vector<std::vector<int>>>();
+    // 是否在后端画框并输出结果图/视频，false 时只输出检测结果 (JSONL)
+    render = config["render"] ? config["render"].as<bool>() : true;
+    // 结果视频的编码器: ffmpeg (H.264 fragmented MP4) / opencv (MJPG) / none (视频只写 *_.jsonl)
+    if (config["video_encoder"])
+        video_encoder.type = config["video_encoder"].as<std::string>();
+    if (video_encoder.type != "ffmpeg" && video_encoder.type != "opencv" && video_encoder.type != "none")
+        throw std::invalid_argument("video_encoder must be ffmpeg, opencv or none");
+    if (config["video_ffmpeg"])
+        video_encoder.ffmpeg = config["video_ffmpeg"].as<std::string>();
+    if (config["video_codec"])
+        video_encoder.codec = config["video_codec"].as<std::string>();
+    if (config["video_preset"])
+        video_encoder.preset = config["video_preset"].as<std::string>();
+    if (config["video_crf"])
+        video_encoder.crf = config["video_crf"].as<int>();
+    if (config["video_bitrate"])
+        video_encoder.bitrate = config["video_bitrate"].as<std::string>();
+    if (config["video_keyframe_seconds"])
+        video_encoder.keyframe_seconds = config["video_keyframe_seconds"].as<float>();
     coco_labels = readCOCOLabel(labels_file);
     CATEGORY = coco_labels.size();
     int index = 0;
+    output_size = 0;
     for (const int &stride : strides)
     {
         grids.push_back({num_anchors[index], int(IMAGE_HEIGHT / stride), int(IMAGE_WIDTH / stride)});
+        output_size += grids.back()[0] * grids.back()[1] * grids.back()[2] * (CATEGORY + 5);
     }
+    decode_levels = buildDecodeLevels(grids, anchors);
+    top_k = config["top_k"] ? config["top_k"].as<int>() : 0;
+    // 视频 / 文件夹流水线: 阶段间队列深度 (batch 数)、前处理线程数、文件夹模式的读图线程数
+    pipeline_queue_depth = config["pipeline_queue_depth"] ? config["pipeline_queue_depth"].as<int>() : 4;
+    preprocess_threads = std::max(1, config["preprocess_threads"] ? config["preprocess_threads"].as<int>() : 2);
+    loader_threads = std::max(1, config["loader_threads"] ? config["loader_threads"].as<int>() : 4);
+    // 文件夹模式: 结果默认写到 output_dir (为空时为 <folder>_out)，每 checkpoint_every 张图记一次检查点
+    folder_output_dir = config["output_dir"] ? config["output_dir"].as<std::string>() : "";
+    folder_recursive = config["folder_recursive"] ? config["folder_recursive"].as<bool>() : true;
+    checkpoint_every = std::max(1, config["checkpoint_every"] ? config["checkpoint_every"].as<int>() : 200);
+    // 切片推理: 大于 tile 的图切成重叠的 tile 以网络输入尺寸推理，小目标不会被整图缩小后丢失
+    tile_enabled = config["tile"] ? config["tile"].as<bool>() : false;
+    int tile_size = config["tile_size"] ? config["tile_size"].as<int>() : 0;
+    tile_width = tile_size > 0 ? tile_size : IMAGE_WIDTH;
+    tile_height = tile_size > 0 ? tile_size : IMAGE_HEIGHT;
+    tile_overlap = config["tile_overlap"] ? config["tile_overlap"].as<float>() : 0.2f;
+    if (tile_overlap < 0.f || tile_overlap >= 1.f)
+        throw std::invalid_argument("tile_overlap must be in [0, 1)");
+    tile_full_image = config["tile_full_image"] ? config["tile_full_image"].as<bool>() : true;
+    // 视频每 detect_interval 帧检测一次 (场景变化超过 motion_threshold 时提前)，中间帧由跟踪器外推
+    // detect_interval > 1 时自动开启跟踪，track 为 true 时逐帧检测也输出轨迹
+    detect_interval = std::max(1, config["detect_interval"] ? config["detect_interval"].as<int>() : 1);
+    motion_threshold = config["motion_threshold"] ? config["motion_threshold"].as<float>() : 0.f;
+    track = detect_interval > 1 || (config["track"] ? config["track"].as<bool>() : false);
+    track_iou = config["track_iou"] ? config["track_iou"].as<float>() : 0.3f;
+    track_max_age = config["track_max_age"] ? config["track_max_age"].as<int>() : 3;
+    track_min_hits = config["track_min_hits"] ? config["track_min_hits"].as<int>() : 2;
     class_colors.resize(CATEGORY);
     srand((int) time(nullptr));
     for (cv::Scalar &class_color : class_colors)
         class_color = cv::Scalar(255, 0, 0);
+    session.reset(new InferSession());
 }
 
 V5lite::~V5lite() = default;
 
-void V5lite::LoadEngine() {
-    // create and load engine
-    std::fstream existEngine;
-    existEngine.open(engine_file, std::ios::in);
-    readTrtFile(engine_file, engine);
-    assert(engine != nullptr);
+bool V5lite::Reload(const std::string &config_file) {
+    // 先完整解析新配置，解析失败时异常直接抛出，当前对象不受影响
+    V5lite next(config_file);
+    bool swap_engine = next.backend_type != backend_type || next.BATCH_SIZE != BATCH_SIZE ||
+                       next.INPUT_CHANNEL != INPUT_CHANNEL || next.IMAGE_WIDTH != IMAGE_WIDTH ||
+                       next.IMAGE_HEIGHT != IMAGE_HEIGHT ||
+                       (backend_type == "opencv" ? next.onnx_file != onnx_file || next.cpu_threads != cpu_threads
+                                                 : next.engine_file != engine_file);
+    if (swap_engine) {
+        // 新引擎加载成功后才替换旧引擎，加载期间两份引擎同时占用显存
+        next.LoadEngine();
+    } else {
+        // 沿用当前引擎时，类别数和输出网格必须与引擎的输出一致
+        if (next.CATEGORY != CATEGORY || next.grids != grids)
+            throw std::invalid_argument("labels / strides / num_anchors do not match the loaded engine");
+        next.backend = std::move(backend);
+        next.output_size = output_size;
+        next.input_type = input_type;
+        // 输入尺寸和 batch 不变，已经分配好的缓冲区继续使用
+        next.session = std::move(session);
+        next.prepare_sessions = std::move(prepare_sessions);
+        next.batch_pool = std::move(batch_pool);
+        next.input_pool = std::move(input_pool);
+        next.output_pool = std::move(output_pool);
+    }
+    *this = std::move(next);
+    std::cout << "config reloaded from " << config_file << (swap_engine ? " (engine swapped)" : "") << std::endl;
+    return swap_engine;
 }
 
-bool V5lite::InferenceFolder(const std::string &folder_name) {
-    std::vector<std::string> sample_images = readFolder(folder_name);
-    //get context
-    assert(engine != nullptr);
-    context = engine->createExecutionContext();
-    assert(context != nullptr);
-
-    //get buffers
-    assert(engine->getNbIOTensors() == 2);
-    void *buffers[2];
-    std::vector<int64_t> bufferSize;
-    int nbBindings = engine->getNbIOTensors();
-    bufferSize.resize(nbBindings);
-
-    for (int i = 0; i < nbBindings; ++i) {
-        const char* tensorName = engine->getIOTensorName(i);
-        nvinfer1::Dims dims = engine->getTensorShape(tensorName);
-        nvinfer1::DataType dtype = engine->getTensorDataType(tensorName);
-        int64_t totalSize = volume(dims) * 1 * getElementSize(dtype);
-        bufferSize[i] = totalSize;
-        std::cout << "binding" << i << ": " << totalSize << std::endl;
-        cudaMalloc(&buffers[i], totalSize);
+void V5lite::LoadEngine() {
+    // create and load engine
+    if (backend_type == "opencv") {
+        backend.reset(new CpuBackend(onnx_file, BATCH_SIZE, INPUT_CHANNEL, IMAGE_HEIGHT, IMAGE_WIDTH,
+                                     output_size, cpu_threads));
+    } else {
+#ifdef V5LITE_WITH_TENSORRT
+        backend.reset(new TrtBackend(engine_file));
+#else
+        throw std::runtime_error("built without TensorRT, set backend: opencv in config");
+#endif
     }
+    if (!backend->Load())
+        throw std::runtime_error("failed to load " + backend->Name() + " backend");
+    // 以后端实际的输出大小为准
+    output_size = backend->OutputSize() / BATCH_SIZE;
+    input_type = backend->InputFormat();
+    std::cout << "backend: " << backend->Name() << ", input: " << inputTypeName(input_type) << std::endl;
+}
 
-    //get stream
-    cudaStream_t stream;
-    cudaStreamCreate(&stream);
-
-    int outSize = bufferSize[1] / sizeof(float) / BATCH_SIZE;
-
-    
-    EngineInference(sample_images, outSize, buffers, bufferSize, stream);
-
-    // release the stream and the buffers
-    cudaStreamDestroy(stream);
-    cudaFree(buffers[0]);
-    cudaFree(buffers[1]);
-
-    // destroy the engine
-    delete context;
-    delete engine;
+void *V5lite::prepareImage(std::vector<cv::Mat> &vec_img) {
+    // 直接写入后端的输入暂存区 (TensorRT 下为锁页内存)，不再每帧分配
+    void *data = backend->HostInput();
+    letterboxCHW(vec_img, data, input_type, IMAGE_WIDTH, IMAGE_HEIGHT, session->resized);
+    return data;
 }
 
-void V5lite::EngineInference(const std::vector<std::string> &image_list, const int &outSize, void **buffers,
-                             const std::vector<int64_t> &bufferSize, cudaStream_t stream) {
-    int index = 0;
-    int batch_id = 0;
-    std::vector<cv::Mat> vec_Mat(BATCH_SIZE);
-    std::vector<std::string> vec_name(BATCH_SIZE);
-    float total_time = 0;
-    for (const std::string &image_name : image_list)
-    {
-        index++;
-        std::cout << "Processing: " << image_name << std::endl;
-        cv::Mat src_img = cv::imread(image_name);
-        if (src_img.data)
-        {
-            vec_Mat[batch_id] = src_img.clone();
-            vec_name[batch_id] = image_name;
-            batch_id++;
+void V5lite::makeTiles(const std::vector<cv::Mat> &frames, int count, std::vector<Tile> &tiles,
+                       InferSession &scratch) const {
+    tiles.clear();
+    if (!tile_enabled)
+        return;
+    bool split = false;
+    for (int f = 0; f < count; f++) {
+        const cv::Mat &frame = frames[f];
+        cv::Rect whole(0, 0, frame.cols, frame.rows);
+        if (frame.cols <= tile_width && frame.rows <= tile_height) {
+            tiles.push_back({f, whole});
+            continue;
         }
-        if (batch_id == BATCH_SIZE or index == image_list.size())
-        {
-            auto t_start_pre = std::chrono::high_resolution_clock::now();
-            std::cout << "prepareImage" << std::endl;
-            std::vector<float>curInput = prepareImage(vec_Mat);
-            auto t_end_pre = std::chrono::high_resolution_clock::now();
-            float total_pre = std::chrono::duration<float, std::milli>(t_end_pre - t_start_pre).count();
-            std::cout << "prepare image take: " << total_pre << " ms." << std::endl;
-            total_time += total_pre;
-            batch_id = 0;
-            if (!curInput.data()) {
-                std::cout << "prepare images ERROR!" << std::endl;
-                continue;
-            }
-            // DMA the input to the GPU,  execute the batch asynchronously, and DMA it back:
-            std::cout << "host2device" << std::endl;
-            cudaMemcpyAsync(buffers[0], curInput.data(), bufferSize[0], cudaMemcpyHostToDevice, stream);
-
-            // do inference
-            std::cout << "execute" << std::endl;
-            auto t_start = std::chrono::high_resolution_clock::now();
-            context->executeV2(buffers);
-            auto t_end = std::chrono::high_resolution_clock::now();
-            float total_inf = std::chrono::duration<float, std::milli>(t_end - t_start).count();
-            std::cout << "Inference take: " << total_inf << " ms." << std::endl;
-            total_time += total_inf;
-            std::cout << "execute success" << std::endl;
-            std::cout << "device2host" << std::endl;
-            std::cout << "post process" << std::endl;
-            auto r_start = std::chrono::high_resolution_clock::now();
-            auto *out = new float[outSize * BATCH_SIZE];
-            cudaMemcpyAsync(out, buffers[1], bufferSize[1], cudaMemcpyDeviceToHost, stream);
-            cudaStreamSynchronize(stream);
-            auto boxes = postProcess(vec_Mat, out, outSize);
-            auto r_end = std::chrono::high_resolution_clock::now();
-            float total_res = std::chrono::duration<float, std::milli>(r_end - r_start).count();
-            std::cout << "Post process take: " << total_res << " ms." << std::endl;
-            total_time += total_res;
-            for (int i = 0; i < (int)vec_Mat.size(); i++)
-            {
-                auto org_img = vec_Mat[i];
-                if (!org_img.data)
-                    continue;
-                auto rects = boxes[i];
-                for(const auto &rect : rects)
-                {
-                    char t[256];
-                    sprintf(t, "%.2f", rect.prob);
-                    std::string name = coco_labels[rect.classes] + "-" + t;
-
-                    cv::putText(org_img, name, cv::Point(rect.x - rect.w / 2, rect.y - rect.h / 2 - 5), cv::FONT_HERSHEY_COMPLEX, 0.7, class_colors[rect.classes], 2);
-
-                    cv::Rect rst(rect.x - rect.w / 2, rect.y - rect.h / 2, rect.w, rect.h);
+        split = true;
+        tileGrid(frame.size(), cv::Size(tile_width, tile_height), tile_overlap, scratch.rects);
+        for (const cv::Rect &rect : scratch.rects)
+            tiles.push_back({f, rect});
+        // 整图再推理一次，跨多个 tile 的大目标仍能完整检出
+        if (tile_full_image)
+            tiles.push_back({f, whole});
+    }
+    if (!split)
+        tiles.clear();
+}
 
-                    cv::rectangle(org_img, rst, class_colors[rect.classes], 2, cv::LINE_8, 0);
+void V5lite::prepareTiles(const std::vector<cv::Mat> &frames, const std::vector<Tile> &tiles, void *input,
+                          InferSession &scratch) const {
+    // tile 只是原图的 ROI，不拷贝；最后一个网络 batch 中多出的位置留空，letterbox 时填 0
+    std::vector<cv::Mat> &views = scratch.views;
+    views.resize(size_t(chunkCount(tiles.size())) * BATCH_SIZE);
+    for (size_t i = 0; i < views.size(); i++)
+        views[i] = i < tiles.size() ? frames[tiles[i].frame](tiles[i].rect) : cv::Mat();
+    letterboxCHW(views, input, input_type, IMAGE_WIDTH, IMAGE_HEIGHT, scratch.resized);
+}
 
-                }
-                int pos = vec_name[i].find_last_of(".");
-                std::string rst_name = vec_name[i].insert(pos, "_");
-                std::cout << rst_name << std::endl;
-                cv::imwrite(rst_name, org_img);
-            }
-            vec_Mat = std::vector<cv::Mat>(BATCH_SIZE);
-            delete[] out;
-        }
+bool V5lite::inferChunks(const void *input, float *output, int chunks,
+                         std::vector<std::pair<std::string, float>> &parts) {
+    const size_t input_bytes = batchInputBytes();
+    bool ok = true;
+    parts.clear();
+    for (int c = 0; c < chunks; c++) {
+        ok = backend->Infer(static_cast<const uint8_t *>(input) + c * input_bytes, output + size_t(c) * BATCH_SIZE * output_size) && ok;
+        backend->AddTimings(parts);
     }
-    std::cout << "Average processing time is " << total_time / image_list.size() << "ms" << std::endl;
+    return ok;
 }
 
-std::vector<float> V5lite::prepareImage(std::vector<cv::Mat> &vec_img) {
-    std::vector<float> result(BATCH_SIZE * IMAGE_WIDTH * IMAGE_HEIGHT * INPUT_CHANNEL);
-    float *data = result.data();
-    int index = 0;
-    for (const cv::Mat &src_img : vec_img)
-    {
-        if (!src_img.data)
-            continue;
-        float ratio = float(IMAGE_WIDTH) / float(src_img.cols) < float(IMAGE_HEIGHT) / float(src_img.rows) ? float(IMAGE_WIDTH) / float(src_img.cols) : float(IMAGE_HEIGHT) / float(src_img.rows);
-        cv::Mat flt_img = cv::Mat::zeros(cv::Size(IMAGE_WIDTH, IMAGE_HEIGHT), CV_8UC3);
-        cv::Mat rsz_img;
-        cv::resize(src_img, rsz_img, cv::Size(), ratio, ratio);
-        rsz_img.copyTo(flt_img(cv::Rect(0, 0, rsz_img.cols, rsz_img.rows)));
-        flt_img.convertTo(flt_img, CV_32FC3, 1.0 / 255);
-
-        //HWC TO CHW
-        int channelLength = IMAGE_WIDTH * IMAGE_HEIGHT;
-        std::vector<cv::Mat> split_img = {
-                cv::Mat(IMAGE_HEIGHT, IMAGE_WIDTH, CV_32FC1, data + channelLength * (index + 2)),
-                cv::Mat(IMAGE_HEIGHT, IMAGE_WIDTH, CV_32FC1, data + channelLength * (index + 1)),
-                cv::Mat(IMAGE_HEIGHT, IMAGE_WIDTH, CV_32FC1, data + channelLength * index)
-        };
-        index += 3;
-        cv::split(flt_img, split_img);
+void V5lite::postProcessTiles(int frames, const std::vector<Tile> &tiles, const float *output,
+                              std::vector<std::vector<DetectRes>> &boxes) {
+    if ((int)boxes.size() < frames)
+        boxes.resize(frames);
+    for (int f = 0; f < frames; f++)
+        boxes[f].clear();
+    std::vector<DetectRes> &tile_result = session->candidates;
+    auto t_start = std::chrono::high_resolution_clock::now();
+    for (size_t i = 0; i < tiles.size(); i++) {
+        const cv::Rect &rect = tiles[i].rect;
+        float ratio = std::max(float(rect.width) / float(IMAGE_WIDTH), float(rect.height) / float(IMAGE_HEIGHT));
+        decodeOutput(output + i * output_size, decode_levels, CATEGORY, IMAGE_WIDTH, IMAGE_HEIGHT, obj_threshold,
+                     ratio, top_k, tile_result);
+        std::vector<DetectRes> &result = boxes[tiles[i].frame];
+        for (DetectRes &det : tile_result) {
+            det.x += rect.x;
+            det.y += rect.y;
+            result.push_back(det);
+        }
     }
-    return result;
+    auto t_mid = std::chrono::high_resolution_clock::now();
+    for (int f = 0; f < frames; f++)
+        NmsDetect(boxes[f]);
+    auto t_end = std::chrono::high_resolution_clock::now();
+    decode_time = std::chrono::duration<float, std::milli>(t_mid - t_start).count();
+    nms_time = std::chrono::duration<float, std::milli>(t_end - t_mid).count();
 }
 
-std::vector<std::vector<V5lite::DetectRes>> V5lite::postProcess(const std::vector<cv::Mat> &vec_Mat, float *output,
-                                                                const int &outSize) {
-    std::vector<std::vector<DetectRes>> vec_result;
-    int index = 0;
-    for (const cv::Mat &src_img : vec_Mat)
+void V5lite::postProcess(const std::vector<cv::Mat> &frames, const float *output,
+                         std::vector<std::vector<DetectRes>> &boxes) {
+    if (boxes.size() < frames.size())
+        boxes.resize(frames.size());
+    decode_time = 0;
+    nms_time = 0;
+    for (size_t index = 0; index < frames.size(); index++)
     {
-        std::vector<DetectRes> result;
+        const cv::Mat &src_img = frames[index];
+        std::vector<DetectRes> &result = boxes[index];
         float ratio = float(src_img.cols) / float(IMAGE_WIDTH) > float(src_img.rows) / float(IMAGE_HEIGHT)  ? float(src_img.cols) / float(IMAGE_WIDTH) : float(src_img.rows) / float(IMAGE_HEIGHT);
-        float *out = output + index * outSize;
-        int position = 0;
-        for (int n = 0; n < (int)grids.size(); n++)
-        {
-            for (int c = 0; c < grids[n][0]; c++)
-            {
-                std::vector<int> anchor = anchors[n * grids[n][0] + c];
-                for (int h = 0; h < grids[n][1]; h++)
-                    for (int w = 0; w < grids[n][2]; w++)
-                    {
-                        float *row = out + position * (CATEGORY + 5);
-                        position++;
-                        DetectRes box;
-                        auto max_pos = std::max_element(row + 5, row + CATEGORY + 5);
-                        box.prob = row[4] * row[max_pos - row];
-                        if (box.prob < obj_threshold)
-                            continue;
-                        box.classes = max_pos - row - 5;
-                        box.x = (row[0] * 2 - 0.5 + w) / grids[n][2] * IMAGE_WIDTH * ratio;
-                        box.y = (row[1] * 2 - 0.5 + h) / grids[n][1] * IMAGE_HEIGHT * ratio;
-                        box.w = pow(row[2] * 2, 2) * anchor[0] * ratio;
-                        box.h = pow(row[3] * 2, 2) * anchor[1] * ratio;
-                        box.w = box.w < box.h ? box.w : box.h;
-                        box.h = box.w < box.h ? box.w : box.h;
-                        result.push_back(box);
-                    }
-            }
-        }
+        const float *out = output + index * output_size;
+        auto t_start = std::chrono::high_resolution_clock::now();
+        decodeOutput(out, decode_levels, CATEGORY, IMAGE_WIDTH, IMAGE_HEIGHT, obj_threshold, ratio, top_k, result);
+        auto t_mid = std::chrono::high_resolution_clock::now();
         NmsDetect(result);
-        vec_result.push_back(result);
-        index++;
+        auto t_end = std::chrono::high_resolution_clock::now();
+        decode_time += std::chrono::duration<float, std::milli>(t_mid - t_start).count();
+        nms_time += std::chrono::duration<float, std::milli>(t_end - t_mid).count();
     }
-    return vec_result;
 }
-
 void V5lite::NmsDetect(std::vector<DetectRes> &detections) {
-    sort(detections.begin(), detections.end(), [=](const DetectRes &left, const DetectRes &right) {
-        return left.prob > right.prob;
-    });
-
-    for (int i = 0; i < (int)detections.size(); i++)
-        for (int j = i + 1; j < (int)detections.size(); j++)
-        {
-            if (detections[i].classes == detections[j].classes)
-            {
-                float iou = IOUCalculate(detections[i], detections[j]);
-                if (iou > nms_threshold)
-                    detections[j].prob = 0;
-            }
-        }
+    nmsBoxes(detections, nms_threshold, nms_type != "iou", max_det, session->nms);
+}
 
-    detections.erase(std::remove_if(detections.begin(), detections.end(), [](const DetectRes &det)
-    { return det.prob == 0; }), detections.end());
+void V5lite::DrawDetections(cv::Mat &img, const std::vector<DetectRes> &detections) const {
+    drawDetections(img, detections, coco_labels, class_colors);
 }
 
-float V5lite::IOUCalculate(const V5lite::DetectRes &det_a, const V5lite::DetectRes &det_b) {
-    cv::Point2f center_a(det_a.x, det_a.y);
-    cv::Point2f center_b(det_b.x, det_b.y);
-    cv::Point2f left_up(std::min(det_a.x - det_a.w / 2, det_b.x - det_b.w / 2),
-                        std::min(det_a.y - det_a.h / 2, det_b.y - det_b.h / 2));
-    cv::Point2f right_down(std::max(det_a.x + det_a.w / 2, det_b.x + det_b.w / 2),
-                           std::max(det_a.y + det_a.h / 2, det_b.y + det_b.h / 2));
-    float distance_d = (center_a - center_b).x * (center_a - center_b).x + (center_a - center_b).y * (center_a - center_b).y;
-    float distance_c = (left_up - right_down).x * (left_up - right_down).x + (left_up - right_down).y * (left_up - right_down).y;
-    float inter_l = det_a.x - det_a.w / 2 > det_b.x - det_b.w / 2 ? det_a.x - det_a.w / 2 : det_b.x - det_b.w / 2;
-    float inter_t = det_a.y - det_a.h / 2 > det_b.y - det_b.h / 2 ? det_a.y - det_a.h / 2 : det_b.y - det_b.h / 2;
-    float inter_r = det_a.x + det_a.w / 2 < det_b.x + det_b.w / 2 ? det_a.x + det_a.w / 2 : det_b.x + det_b.w / 2;
-    float inter_b = det_a.y + det_a.h / 2 < det_b.y + det_b.h / 2 ? det_a.y + det_a.h / 2 : det_b.y + det_b.h / 2;
-    if (inter_b < inter_t || inter_r < inter_l)
-        return 0;
-    float inter_area = (inter_b - inter_t) * (inter_r - inter_l);
-    float union_area = det_a.w * det_a.h + det_b.w * det_b.h - inter_area;
-    if (union_area == 0)
-        return 0;
-    else
-        return inter_area / union_area - distance_d / distance_c;
+std::string V5lite::GetLabel(int classes) const {
+    return labelName(coco_labels, classes);
 }
 
-std::string V5lite::InferenceImage(const std::string& imagePath) {
-    //get context
-    assert(engine != nullptr);
-    context = engine->createExecutionContext();
-    assert(context != nullptr);
- 
-    //get buffers
-    assert(engine->getNbIOTensors() == 2);
-    void *buffers[2];
-    std::vector<int64_t> bufferSize;
-    int nbBindings = engine->getNbIOTensors();
-    bufferSize.resize(nbBindings);
- 
-    for (int i = 0; i < nbBindings; ++i) {
-        const char* tensorName = engine->getIOTensorName(i);
-        nvinfer1::Dims dims = engine->getTensorShape(tensorName);
-        nvinfer1::DataType dtype = engine->getTensorDataType(tensorName);
-        int64_t totalSize = volume(dims) * 1 * getElementSize(dtype);
-        bufferSize[i] = totalSize;
-        cudaMalloc(&buffers[i], totalSize);
-    }
- 
-    //get stream
-    cudaStream_t stream;
-    cudaStreamCreate(&stream);
- 
-    int outSize = bufferSize[1] / sizeof(float) / BATCH_SIZE;
- 
+bool V5lite::InferenceImage(const std::string& imagePath, InferenceResult *result, bool render) {
     // Process single image
+    auto t_start_dec = std::chrono::high_resolution_clock::now();
     cv::Mat src_img = cv::imread(imagePath);
     if (!src_img.data) {
         std::cout << "Failed to read image: " << imagePath << std::endl;
-        return "";
+        return false;
     }
+    auto t_end_dec = std::chrono::high_resolution_clock::now();
+
+    InferenceResult local_result;
+    if (!result)
+        result = &local_result;
+    InferenceImage(src_img, result, render);
+    result->timings.insert(result->timings.begin(),
+                           {"decode", std::chrono::duration<float, std::milli>(t_end_dec - t_start_dec).count()});
+    if (!render)
+        return true;
+
+    // Save result
+    auto t_start_enc = std::chrono::high_resolution_clock::now();
+    int pos = imagePath.find_last_of(".");
+    std::string tempPath = imagePath;
+    std::string rst_name = tempPath.insert(pos, "_");
+    cv::imwrite(rst_name, src_img);
+    auto t_end_enc = std::chrono::high_resolution_clock::now();
+
+    result->output_path = rst_name;
+    result->timings.push_back({"encode", std::chrono::duration<float, std::milli>(t_end_enc - t_start_enc).count()});
+    return true;
+}
+
+void V5lite::InferenceImage(cv::Mat &src_img, InferenceResult *result, bool render) {
+    assert(backend != nullptr);
+    int outSize = output_size;
+    // 输入 / 输出 / 检测结果都用会话中复用的缓冲区
+    InferSession &s = *session;
  
-    std::vector<cv::Mat> vec_Mat(1, src_img);
-    std::vector<std::string> vec_name(1, imagePath);
-    int total_time = 0;
+    std::vector<cv::Mat> &vec_Mat = s.frames;
+    vec_Mat.assign(1, src_img);
+    // 开启切片且图像大于 tile 时按 tile 推理，否则整图推理
+    const std::vector<Tile> &tiles = image_tiles;
+    makeTiles(vec_Mat, 1, image_tiles, s);
+    int chunks = 1;
+    float total_time = 0;
     // Prepare image
     auto t_start_pre = std::chrono::high_resolution_clock::now();  
-    std::vector<float> curInput = prepareImage(vec_Mat);
+    void *curInput;
+    if (tiles.empty()) {
+        curInput = prepareImage(vec_Mat);
+    } else {
+        chunks = chunkCount(tiles.size());
+        curInput = s.Input(size_t(chunks) * batchInputBytes());
+        prepareTiles(vec_Mat, tiles, curInput, s);
+    }
     auto t_end_pre = std::chrono::high_resolution_clock::now();
     float total_pre = std::chrono::duration<float, std::milli>(t_end_pre - t_start_pre).count();
     std::cout << "prepare image take: " << total_pre << " ms." << std::endl; 
     total_time += total_pre;
-    // DMA the input to the GPU
-    cudaMemcpyAsync(buffers[0], curInput.data(), bufferSize[0], cudaMemcpyHostToDevice, stream);
- 
-    // Do inference
+    // Do inference (host2device + execute + device2host)
+    float *out = s.Output(size_t(outSize) * BATCH_SIZE * chunks);
+    const std::vector<std::pair<std::string, float>> &execute_parts = s.parts;
     auto t_start = std::chrono::high_resolution_clock::now();      
-    context->executeV2(buffers);
+    inferChunks(curInput, out, chunks, s.parts);
     auto t_end = std::chrono::high_resolution_clock::now();
     float total_inf = std::chrono::duration<float, std::milli>(t_end - t_start).count();
     std::cout << "Inference take: " << total_inf << " ms." << std::endl;
     total_time += total_inf;
-     
-    // DMA the output back to the host
-    auto r_start = std::chrono::high_resolution_clock::now();
-    auto *out = new float[outSize * BATCH_SIZE];
-    cudaMemcpyAsync(out, buffers[1], bufferSize[1], cudaMemcpyDeviceToHost, stream);
-    cudaStreamSynchronize(stream);
  
     // Post process           
-    auto boxes = postProcess(vec_Mat, out, outSize);
+    auto r_start = std::chrono::high_resolution_clock::now();
+    std::vector<std::vector<DetectRes>> &boxes = s.Boxes(1);
+    if (tiles.empty())
+        postProcess(vec_Mat, out, boxes);
+    else
+        postProcessTiles(1, tiles, out, boxes);
     auto r_end = std::chrono::high_resolution_clock::now();
     float total_res = std::chrono::duration<float, std::milli>(r_end - r_start).count();
-    std::cout << "Post process take: " << total_res << " ms." << std::endl;
+    std::cout << "Post process take: " << total_res << " ms (decode " << decode_time << ", nms " << nms_time
+              << ")." << std::endl;
     total_time += total_res; 
     // Draw bounding boxes
-    auto org_img = vec_Mat[0];
-    auto rects = boxes[0];
-    for(const auto &rect : rects) {
-        char t[256];
-        sprintf(t, "%.2f", rect.prob);
-        std::string name = coco_labels[rect.classes] + "-" + t;
- 
-        cv::putText(org_img, name, cv::Point(rect.x - rect.w / 2, rect.y - rect.h / 2 - 5), cv::FONT_HERSHEY_COMPLEX, 0.7, class_colors[rect.classes], 2);
-        cv::Rect rst(rect.x - rect.w / 2, rect.y - rect.h / 2, rect.w, rect.h);
-        cv::rectangle(org_img, rst, class_colors[rect.classes], 2, cv::LINE_8, 0);
+    const std::vector<DetectRes> &rects = boxes[0];
+    float total_draw = 0;
+    if (render) {
+        auto d_start = std::chrono::high_resolution_clock::now();
+        DrawDetections(vec_Mat[0], rects);
+        total_draw = std::chrono::duration<float, std::milli>(std::chrono::high_resolution_clock::now() - d_start).count();
     }
  
-    // Save result
-    int pos = imagePath.find_last_of(".");
-    std::string tempPath = imagePath;
-    std::string rst_name = tempPath.insert(pos, "_");
-    cv::imwrite(rst_name, org_img);
+    if (result) {
+        result->detections = rects;
+        result->timings = {{"preprocess", total_pre}, {"execute", total_inf}};
+        // 后端能区分时再细分为 execute.h2d / execute.compute / execute.d2h
+        for (const auto &part : execute_parts)
+            result->timings.push_back({"execute." + part.first, part.second});
+        result->timings.push_back({"postprocess", total_res});
+        result->timings.push_back({"postprocess.decode", decode_time});
+        result->timings.push_back({"postprocess.nms", nms_time});
+        if (render)
+            result->timings.push_back({"draw", total_draw});
+        result->frames = 1;
+        result->tiles = int(tiles.size());
+    }
+    // 会话中不保留调用方图像的引用
+    vec_Mat.clear();
+    s.views.clear();
  
-    // Cleanup
-    cudaStreamDestroy(stream);
-    cudaFree(buffers[0]);
-    cudaFree(buffers[1]);
-    delete[] out;
-    delete context;
     std::cout << "Average processing time is " << total_time << "ms" << std::endl;
- 
-    return rst_name;
 }
  
-std::string V5lite::InferenceVideo(const std::string& videoPath) {
-    //get context
-    assert(engine != nullptr);
-    context = engine->createExecutionContext();
-    assert(context != nullptr);
- 
+static float elapsedMs(const std::chrono::high_resolution_clock::time_point &start) {
+    return std::chrono::duration<float, std::milli>(std::chrono::high_resolution_clock::now() - start).count();
+}
+
+void V5lite::InferenceBatch(std::vector<cv::Mat> &images, std::vector<InferenceResult> &results,
+                            const std::vector<bool> &render) {
+    assert(backend != nullptr);
+    const int n = int(images.size());
+    InferSession &s = *session;
+    // 每张图作为一个整图 tile (开启切片时大图再切开)，统一按 BATCH_SIZE 分组推理
+    std::vector<Tile> &tiles = image_tiles;
+    makeTiles(images, n, tiles, s);
+    bool tiled = !tiles.empty();
+    if (!tiled)
+        for (int i = 0; i < n; i++)
+            tiles.push_back({i, cv::Rect(0, 0, images[i].cols, images[i].rows)});
+
+    auto t_start = std::chrono::high_resolution_clock::now();
+    int chunks = chunkCount(tiles.size());
+    void *input = s.Input(size_t(chunks) * batchInputBytes());
+    prepareTiles(images, tiles, input, s);
+    float total_pre = elapsedMs(t_start);
+    float *out = s.Output(size_t(output_size) * BATCH_SIZE * chunks);
+    const std::vector<std::pair<std::string, float>> &execute_parts = s.parts;
+    t_start = std::chrono::high_resolution_clock::now();
+    inferChunks(input, out, chunks, s.parts);
+    float total_inf = elapsedMs(t_start);
+    t_start = std::chrono::high_resolution_clock::now();
+    std::vector<std::vector<DetectRes>> &boxes = s.Boxes(n);
+    postProcessTiles(n, tiles, out, boxes);
+    float total_res = elapsedMs(t_start);
+    s.views.clear();
+    std::cout << "batch of " << n << " images (" << chunks << " network batches): prepare " << total_pre
+              << " ms, inference " << total_inf << " ms, post process " << total_res << " ms." << std::endl;
+
+    results.assign(n, InferenceResult());
+    for (int i = 0; i < n; i++) {
+        InferenceResult &result = results[i];
+        result.detections = boxes[i];
+        result.timings = {{"preprocess", total_pre}, {"execute", total_inf}};
+        for (const auto &part : execute_parts)
+            result.timings.push_back({"execute." + part.first, part.second});
+        result.timings.push_back({"postprocess", total_res});
+        result.timings.push_back({"postprocess.decode", decode_time});
+        result.timings.push_back({"postprocess.nms", nms_time});
+        if (render[i]) {
+            t_start = std::chrono::high_resolution_clock::now();
+            DrawDetections(images[i], boxes[i]);
+            result.timings.push_back({"draw", elapsedMs(t_start)});
+        }
+        result.frames = 1;
+        result.batch = n;
+        if (tiled)
+            result.tiles = int(std::count_if(tiles.begin(), tiles.end(), [i](const Tile &tile) {
+                return tile.frame == i;
+            }));
+    }
+}
+
+void V5lite::RunPipeline(const std::function<bool(FrameBatch &)> &next_batch,
+                         const std::function<void(FrameBatch &, std::vector<std::vector<DetectRes>> &)> &sink,
+                         PipelineStats &stats) {
+    int outSize = output_size;
+    const size_t input_bytes = batchInputBytes();
+
+    // 流水线: 取图 -> 前处理 (preprocess_threads 个线程) -> 推理 -> 后处理 + sink
+    // 各阶段之间为有界队列，推理阶段按 seq 重新排序，保证输出顺序与输入一致
+    BoundedQueue<FrameBatch> decoded(pipeline_queue_depth);
+    BoundedQueue<FrameBatch> prepared(pipeline_queue_depth);
+    BoundedQueue<FrameBatch> inferred(pipeline_queue_depth);
+    // batch 和前处理输入 / 推理输出缓冲区都循环使用，数量限定了同时在途的 batch 数
+    // 输入只在前处理到推理之间占用，输出只在推理到 sink 之间占用，各自单独成池，不随 batch 在队列中等待
+    // 上一次流水线留下的 batch 和缓冲区直接复用，稳态下每帧不再分配内存
+    BoundedQueue<FrameBatch> free_batches(size_t(pipeline_queue_depth) * 3 + preprocess_threads + 3);
+    BoundedQueue<std::vector<uint8_t>> free_inputs(pipeline_queue_depth + preprocess_threads + 1);
+    BoundedQueue<std::vector<float>> free_outputs(pipeline_queue_depth + 2);
+    for (size_t i = 0; i < free_batches.Capacity(); i++) {
+        FrameBatch batch;
+        if (!batch_pool.empty()) {
+            batch = std::move(batch_pool.back());
+            batch_pool.pop_back();
+        }
+        free_batches.Push(std::move(batch));
+    }
+    for (size_t i = 0; i < free_inputs.Capacity(); i++) {
+        std::vector<uint8_t> input;
+        if (!input_pool.empty()) {
+            input = std::move(input_pool.back());
+            input_pool.pop_back();
+        }
+        input.resize(input_bytes);
+        free_inputs.Push(std::move(input));
+    }
+    for (size_t i = 0; i < free_outputs.Capacity(); i++) {
+        std::vector<float> output;
+        if (!output_pool.empty()) {
+            output = std::move(output_pool.back());
+            output_pool.pop_back();
+        }
+        free_outputs.Push(std::move(output));
+    }
+    while ((int)prepare_sessions.size() < preprocess_threads)
+        prepare_sessions.emplace_back(new InferSession());
+    // 每个 batch 都被用过一次之后进入稳态，从这时起统计分配次数 (编译时开启 V5LITE_COUNT_ALLOCS 才有)
+    const int warmup_batches = int(free_batches.Capacity());
+    size_t steady_allocations = 0;
+    int steady_frames = 0;
+    auto t_start_all = std::chrono::high_resolution_clock::now();
+
+    std::thread source([&] {
+        int seq = 0;
+        FrameBatch batch;
+        while (free_batches.Pop(batch)) {
+            auto t_start = std::chrono::high_resolution_clock::now();
+            batch.Reset(seq++, stats.frames);
+            if ((int)batch.frames.size() < BATCH_SIZE)
+                batch.frames.resize(BATCH_SIZE);
+            if ((int)batch.names.size() < BATCH_SIZE) {
+                batch.names.resize(BATCH_SIZE);
+                batch.indices.resize(BATCH_SIZE);
+            }
+            bool more = next_batch(batch);
+            stats.frames += batch.count;
+            stats.source += elapsedMs(t_start);
+            if (!more || batch.count == 0) {
+                // 没有取到帧的 batch 直接放回池中
+                free_batches.Push(std::move(batch));
+                break;
+            }
+            if (!decoded.Push(std::move(batch)))
+                break;
+        }
+        decoded.Close();
+    });
+
+    // 输入缓冲区先于 batch 领取，按 seq 顺序分配 (见 OrderedTake)，推理线程按 seq 等待时不会死锁
+    OrderedTake<FrameBatch, std::vector<uint8_t>> take(decoded, free_inputs);
+    std::atomic<int> preprocess_running(preprocess_threads);
+    std::vector<float> pre_times(preprocess_threads, 0.f);
+    std::vector<std::thread> preprocessors;
+    for (int t = 0; t < preprocess_threads; t++) {
+        preprocessors.emplace_back([&, t] {
+            InferSession &scratch = *prepare_sessions[t];
+            std::vector<cv::Mat> &inputs = scratch.frames;
+            FrameBatch batch;
+            std::vector<uint8_t> input;
+            while (take.Take(batch, input)) {
+                batch.input = std::move(input);
+                auto t_start = std::chrono::high_resolution_clock::now();
+                batch.DetectFrames(inputs);
+                makeTiles(inputs, int(inputs.size()), batch.tiles, scratch);
+                if (!batch.tiles.empty()) {
+                    batch.input.resize(size_t(chunkCount(batch.tiles.size())) * input_bytes);
+                    prepareTiles(inputs, batch.tiles, batch.input.data(), scratch);
+                } else if (!inputs.empty()) {
+                    // 不足 BATCH_SIZE 的位置留空，letterbox 时填 0
+                    inputs.resize(BATCH_SIZE);
+                    letterboxCHW(inputs, batch.input.data(), input_type, IMAGE_WIDTH, IMAGE_HEIGHT, scratch.resized);
+                }
+                pre_times[t] += elapsedMs(t_start);
+                if (!prepared.Push(std::move(batch)))
+                    break;
+            }
+            if (--preprocess_running == 0)
+                prepared.Close();
+        });
+    }
+
+    std::thread inferencer([&] {
+        // 多个前处理线程完成的顺序不定，按 seq 依次送入推理
+        InOrder<FrameBatch> ordered(prepared);
+        FrameBatch current;
+        std::vector<std::pair<std::string, float>> parts;
+        while (ordered.Pop(current)) {
+            if (!free_outputs.Pop(current.output))
+                break;
+            auto t_start = std::chrono::high_resolution_clock::now();
+            // 隔帧模式下整个 batch 都没有关键帧时不推理
+            int chunks = current.tiles.empty() ? (current.sparse && current.keys.empty() ? 0 : 1)
+                                               : chunkCount(current.tiles.size());
+            current.output.resize(size_t(outSize) * BATCH_SIZE * chunks);
+            if (!inferChunks(current.input.data(), current.output.data(), chunks, parts))
+                std::cout << "inference failed at frame " << current.first_frame << std::endl;
+            stats.execute += elapsedMs(t_start);
+            stats.tiles += int(current.tiles.size());
+            stats.detected += current.sparse ? int(current.keys.size()) : current.count;
+            stats.execute_parts.resize(parts.size());
+            for (size_t i = 0; i < parts.size(); i++) {
+                stats.execute_parts[i].first = parts[i].first;
+                stats.execute_parts[i].second += parts[i].second;
+            }
+            free_inputs.Push(std::move(current.input));
+            if (!inferred.Push(std::move(current)))
+                break;
+        }
+        inferred.Close();
+    });
+
+    // 后处理和 sink (画框 / 编码 / 写结果) 在当前线程，按顺序执行，临时缓冲用 session
+    FrameBatch batch;
+    std::vector<cv::Mat> &vec_Mat = session->frames;
+    int sunk = 0;
+    size_t allocations_start = 0;
+    while (inferred.Pop(batch)) {
+        if (sunk == warmup_batches) {
+            allocations_start = allocationCount();
+            steady_frames = 0;
+        }
+        auto t_start_res = std::chrono::high_resolution_clock::now();
+        batch.DetectFrames(vec_Mat);
+        if (!batch.sparse) {
+            if (batch.tiles.empty())
+                postProcess(vec_Mat, batch.output.data(), batch.boxes);
+            else
+                postProcessTiles(int(vec_Mat.size()), batch.tiles, batch.output.data(), batch.boxes);
+        } else {
+            // 关键帧的结果按帧展开 (交换缓冲区，不拷贝)，非关键帧的检测结果为空，由 sink 中的跟踪器补上
+            std::vector<std::vector<DetectRes>> &keyed = session->Boxes(vec_Mat.size());
+            if (batch.tiles.empty())
+                postProcess(vec_Mat, batch.output.data(), keyed);
+            else
+                postProcessTiles(int(vec_Mat.size()), batch.tiles, batch.output.data(), keyed);
+            if ((int)batch.boxes.size() < batch.count)
+                batch.boxes.resize(batch.count);
+            for (int i = 0; i < batch.count; i++)
+                batch.boxes[i].clear();
+            for (size_t k = 0; k < batch.keys.size(); k++)
+                batch.boxes[batch.keys[k]].swap(keyed[k]);
+        }
+        free_outputs.Push(std::move(batch.output));
+        stats.postprocess += elapsedMs(t_start_res);
+        stats.box_decode += decode_time;
+        stats.nms += nms_time;
+
+        auto t_start_sink = std::chrono::high_resolution_clock::now();
+        sink(batch, batch.boxes);
+        stats.sink += elapsedMs(t_start_sink);
+        steady_frames += batch.count;
+        sunk++;
+        if (sunk > warmup_batches)
+            steady_allocations = allocationCount() - allocations_start;
+        free_batches.Push(std::move(batch));
+    }
+    vec_Mat.clear();
+
+    source.join();
+    for (std::thread &preprocessor : preprocessors)
+        preprocessor.join();
+    inferencer.join();
+    // 缓冲区留给下一次流水线；帧的像素缓存释放 (下一个视频的尺寸可能不同)
+    free_batches.Close();
+    free_inputs.Close();
+    free_outputs.Close();
+    while (free_batches.Pop(batch)) {
+        for (cv::Mat &frame : batch.frames)
+            frame.release();
+        batch_pool.push_back(std::move(batch));
+    }
+    std::vector<uint8_t> input;
+    while (free_inputs.Pop(input))
+        input_pool.push_back(std::move(input));
+    std::vector<float> buffer;
+    while (free_outputs.Pop(buffer))
+        output_pool.push_back(std::move(buffer));
+    for (float t : pre_times)
+        stats.preprocess += t;
+    stats.wall = elapsedMs(t_start_all);
+
+    float n = stats.frames > 0 ? float(stats.frames) : 1.f;
+    std::cout << "Per frame: source " << stats.source / n << " ms, preprocess " << stats.preprocess / n << " ms (x"
+              << preprocess_threads << " threads), execute " << stats.execute / n << " ms, postprocess "
+              << stats.postprocess / n << " ms, sink " << stats.sink / n << " ms." << std::endl;
+    if (allocationCounting() && sunk > warmup_batches)
+        std::cout << "Steady state (after " << warmup_batches << " batches): " << steady_allocations
+                  << " allocations in " << steady_frames << " frames." << std::endl;
+    // 某个队列长期接近满，说明它下游的阶段是瓶颈
+    stats.queues = {{"decoded", decoded.AverageOccupancy()},
+                    {"prepared", prepared.AverageOccupancy()},
+                    {"inferred", inferred.AverageOccupancy()}};
+    std::cout << "Queue occupancy (avg/max of " << pipeline_queue_depth << "): decoded "
+              << stats.queues[0].second << "/" << decoded.MaxOccupancy() << ", prepared "
+              << stats.queues[1].second << "/" << prepared.MaxOccupancy() << ", inferred "
+              << stats.queues[2].second << "/" << inferred.MaxOccupancy() << std::endl;
+}
+
+bool V5lite::InferenceVideo(const std::string& videoPath, InferenceResult *result, bool render,
+                            const FrameCallback &on_frame) {
+    assert(backend != nullptr);
+
     // Open video file
     cv::VideoCapture cap(videoPath);
     if (!cap.isOpened()) {
         std::cout << "Failed to open video: " << videoPath << std::endl;
-        return "";
+        return false;
     }
- 
+
     // Get video properties
     int frame_width = static_cast<int>(cap.get(cv::CAP_PROP_FRAME_WIDTH));
     int frame_height = static_cast<int>(cap.get(cv::CAP_PROP_FRAME_HEIGHT));
-    int fps = static_cast<int>(cap.get(cv::CAP_PROP_FPS));
- 
-    // Create output video
+    double fps = cap.get(cv::CAP_PROP_FPS);
+    int frames_total = std::max(0, static_cast<int>(cap.get(cv::CAP_PROP_FRAME_COUNT)));
+
+    // Create output video (不渲染或 video_encoder 为 none 时改为输出逐帧检测结果 *_.jsonl，不创建编码器)
+    // 编码在单独的线程中进行，只缓冲几帧；编码跟不上时 sink 阻塞，由流水线反压
+    if (video_encoder.type == "none")
+        render = false;
     int pos = videoPath.find_last_of(".");
-    std::string tempPath = videoPath;
-    std::string rst_name = tempPath.insert(pos, "_");
-    cv::VideoWriter out_video(rst_name, cv::VideoWriter::fourcc('M','J','P','G'), fps, cv::Size(frame_width, frame_height));
- 
-    //get buffers
-    assert(engine->getNbIOTensors() == 2);
-    void *buffers[2];
-    std::vector<int64_t> bufferSize;
-    int nbBindings = engine->getNbIOTensors();
-    bufferSize.resize(nbBindings);
- 
-    for (int i = 0; i < nbBindings; ++i) {
-        const char* tensorName = engine->getIOTensorName(i);
-        nvinfer1::Dims dims = engine->getTensorShape(tensorName);
-        nvinfer1::DataType dtype = engine->getTensorDataType(tensorName);
-        int64_t totalSize = volume(dims) * 1 * getElementSize(dtype);
-        bufferSize[i] = totalSize;
-        cudaMalloc(&buffers[i], totalSize);
+    std::string rst_name = videoPath.substr(0, pos) + "_.jsonl";
+    std::unique_ptr<VideoEncoder> encoder;
+    std::ofstream sidecar;
+    if (render) {
+        encoder.reset(new VideoEncoder(video_encoder));
+        std::string extension = encoder->Extension();
+        rst_name = videoPath.substr(0, pos) + "_" + (extension.empty() ? videoPath.substr(pos) : extension);
+        if (!encoder->Open(rst_name, fps, cv::Size(frame_width, frame_height)))
+            return false;
+    } else {
+        sidecar.open(rst_name);
     }
- 
-    //get stream
-    cudaStream_t stream;
-    cudaStreamCreate(&stream);
- 
-    int outSize = bufferSize[1] / sizeof(float) / BATCH_SIZE;
- 
-    // Process video frames
-    float total_time = 0.0;
-    cv::Mat frame;
-    while (cap.read(frame)) {
-        std::vector<cv::Mat> vec_Mat(1, frame);
- 
-        // Prepare image
-        auto t_start_pre = std::chrono::high_resolution_clock::now();
-        std::vector<float> curInput = prepareImage(vec_Mat);
-        auto t_end_pre = std::chrono::high_resolution_clock::now();
-        float total_pre = std::chrono::duration<float, std::milli>(t_end_pre - t_start_pre).count();
-        std::cout << "prepare image take: " << total_pre << " ms." << std::endl; 
-        total_time += total_pre;
- 
-        // DMA the input to the GPU
-        cudaMemcpyAsync(buffers[0], curInput.data(), bufferSize[0], cudaMemcpyHostToDevice, stream);
- 
-        // Do inference
-        auto t_start_inf = std::chrono::high_resolution_clock::now();
-        context->executeV2(buffers);
-        auto t_end_inf = std::chrono::high_resolution_clock::now();
-        float total_inf = std::chrono::duration<float, std::milli>(t_end_inf - t_start_inf).count();
-        std::cout << "Inference take: " << total_inf << " ms." << std::endl;
-        total_time += total_inf;
- 
-        // DMA the output back to the host
-        auto t_start_res = std::chrono::high_resolution_clock::now();
-        auto *out = new float[outSize * BATCH_SIZE];
-        cudaMemcpyAsync(out, buffers[1], bufferSize[1], cudaMemcpyDeviceToHost, stream);
-        cudaStreamSynchronize(stream);
- 
-        // Post process
-        auto boxes = postProcess(vec_Mat, out, outSize);
-        auto t_end_res = std::chrono::high_resolution_clock::now();
-        float total_res = std::chrono::duration<float, std::milli>(t_end_res - t_start_res).count();
-        std::cout << "Post process take: " << total_res << " ms." << std::endl;
-        total_time += total_res;
- 
-        // Draw bounding boxes
-        auto org_img = vec_Mat[0];
-        auto rects = boxes[0];
-        for(const auto &rect : rects) {
-            char t[256];
-            sprintf(t, "%.2f", rect.prob);
-            std::string name = coco_labels[rect.classes] + "-" + t;
- 
-            cv::putText(org_img, name, cv::Point(rect.x - rect.w / 2, rect.y - rect.h / 2 - 5), cv::FONT_HERSHEY_COMPLEX, 0.7, class_colors[rect.classes], 2);
-            cv::Rect rst(rect.x - rect.w / 2, rect.y - rect.h / 2, rect.w, rect.h);
-            cv::rectangle(org_img, rst, class_colors[rect.classes], 2, cv::LINE_8, 0);
+
+    PipelineStats stats;
+    // 回调要求停止后不再取新帧，已在流水线中的帧照常处理完
+    std::atomic<bool> stopped(false);
+    // 跟踪模式: 每个 batch 最多 BATCH_SIZE 个关键帧，连同其间的非关键帧一起流过流水线
+    std::unique_ptr<Tracker> tracker;
+    if (track)
+        tracker.reset(new Tracker(track_iou, track_max_age, track_min_hits));
+    int last_key = -detect_interval;
+    cv::Mat key_thumb, thumb;
+    std::vector<char> is_key;
+    RunPipeline([&](FrameBatch &batch) {
+        if (stopped)
+            return false;
+        if (!tracker) {
+            while (batch.count < BATCH_SIZE && cap.read(batch.frames[batch.count]))
+                batch.count++;
+            return batch.count > 0;
         }
- 
-        // Write frame to output video
-        out_video.write(org_img);
-        
- 
-        // Cleanup
-        delete[] out;
-    }
- 
+        batch.sparse = true;
+        const int max_frames = BATCH_SIZE * detect_interval;
+        if ((int)batch.frames.size() < max_frames)
+            batch.frames.resize(max_frames);
+        while (batch.count < max_frames && cap.read(batch.frames[batch.count])) {
+            int frame = batch.first_frame + batch.count;
+            bool key = frame - last_key >= detect_interval;
+            if (!key && motion_threshold > 0) {
+                // 与上一关键帧的缩略灰度图比较平均差异，场景变化大时提前检测
+                cv::resize(batch.frames[batch.count], thumb, cv::Size(64, 36), 0, 0, cv::INTER_AREA);
+                cv::cvtColor(thumb, thumb, cv::COLOR_BGR2GRAY);
+                cv::absdiff(thumb, key_thumb, thumb);
+                key = cv::mean(thumb)[0] > motion_threshold;
+            }
+            if (key) {
+                last_key = frame;
+                if (motion_threshold > 0) {
+                    cv::resize(batch.frames[batch.count], key_thumb, cv::Size(64, 36), 0, 0, cv::INTER_AREA);
+                    cv::cvtColor(key_thumb, key_thumb, cv::COLOR_BGR2GRAY);
+                }
+                batch.keys.push_back(batch.count);
+            }
+            batch.count++;
+            if (key && (int)batch.keys.size() == BATCH_SIZE)
+                break;
+        }
+        return batch.count > 0;
+    }, [&](FrameBatch &batch, std::vector<std::vector<DetectRes>> &boxes) {
+        is_key.assign(batch.count, 0);
+        for (int key : batch.keys)
+            is_key[key] = 1;
+        for (int i = 0; i < batch.count; i++) {
+            if (tracker)
+                boxes[i] = is_key[i] ? tracker->Update(boxes[i], batch.first_frame + i)
+                                     : tracker->Predict(batch.first_frame + i);
+            if (!render) {
+                // 只输出逐帧检测结果，跳过画框和视频编码
+                sidecar << "{\"frame\":" << batch.first_frame + i << ",\"detections\":";
+                writeDetections(sidecar, *this, boxes[i]);
+                sidecar << "}\n";
+            } else {
+                // Draw bounding boxes and hand the frame to the encoder thread
+                DrawDetections(batch.frames[i], boxes[i]);
+                encoder->Write(batch.frames[i]);
+            }
+            if (on_frame && !stopped && !on_frame(batch.first_frame + i, frames_total, batch.frames[i], boxes[i]))
+                stopped = true;
+        }
+    }, stats);
+
     // Release resources
-    std::cout << "Total time for this frame: " << total_time / fps << " ms." << std::endl;
+    std::cout << "Processed " << stats.frames << " frames in " << stats.wall << " ms, "
+              << stats.frames * 1000.f / std::max(stats.wall, 1.f) << " FPS." << std::endl;
+    std::vector<TrackSummary> tracks;
+    if (tracker) {
+        tracks = tracker->Summaries();
+        std::map<int, int> counts;
+        for (const TrackSummary &summary : tracks)
+            counts[summary.classes]++;
+        std::cout << "Detected on " << stats.detected << " of " << stats.frames << " frames, " << tracks.size()
+                  << " tracks:";
+        for (const auto &count : counts)
+            std::cout << " " << GetLabel(count.first) << " " << count.second;
+        std::cout << std::endl;
+        if (!render) {
+            // 逐帧结果之后追加一行轨迹汇总
+            sidecar << "{\"tracks\":";
+            writeTracks(sidecar, *this, tracks);
+            sidecar << "}\n";
+        }
+    }
     cap.release();
-    out_video.release();
-    cudaStreamDestroy(stream);
-    cudaFree(buffers[0]);
-    cudaFree(buffers[1]);
- 
-    return rst_name;
-}
\ No newline at end of file
+    bool encoded = true;
+    if (render) {
+        encoded = encoder->Close();
+        // 每分钟视频的输出字节数和从开始编码到文件可以播放的时间
+        float minutes = stats.frames / float(fps > 0 ? fps : 25) / 60.f;
+        std::cout << "Encoded " << rst_name << " (" << encoder->Type() << "): " << encoder->Bytes() << " bytes, "
+                  << (minutes > 0 ? encoder->Bytes() / minutes / (1 << 20) : 0.f) << " MB per minute, playable after "
+                  << encoder->PlayableMs() << " ms, encoder busy " << encoder->EncodeMs() << " ms" << std::endl;
+    } else {
+        sidecar.close();
+    }
+
+    if (result) {
+        // 视频只回传各阶段的单帧平均耗时，逐帧检测框不走协议
+        float n = stats.frames > 0 ? float(stats.frames) : 1.f;
+        pipelineResult(stats, result);
+        result->output_path = rst_name;
+        if (render) {
+            // 编码线程的耗时与流水线重叠，作为 encode 的细分单独列出
+            result->timings.push_back({"encode.writer", encoder->EncodeMs() / n});
+            result->output_bytes = encoder->Bytes();
+            result->output_seconds = stats.frames / float(fps > 0 ? fps : 25);
+            result->playable_ms = encoder->PlayableMs();
+        }
+        result->detected_frames = stats.detected;
+        result->tracks = tracks;
+        result->cancelled = stopped;
+    }
+
+    return encoded;
+}
+
+void V5lite::pipelineResult(const PipelineStats &stats, InferenceResult *result) const {
+    // 各阶段并行执行，wall 为实际的单帧耗时
+    float n = stats.frames > 0 ? float(stats.frames) : 1.f;
+    result->timings = {{"decode", stats.source / n}, {"preprocess", stats.preprocess / n},
+                       {"execute", stats.execute / n}};
+    for (const auto &part : stats.execute_parts)
+        result->timings.push_back({"execute." + part.first, part.second / n});
+    result->timings.push_back({"postprocess", stats.postprocess / n});
+    result->timings.push_back({"postprocess.decode", stats.box_decode / n});
+    result->timings.push_back({"postprocess.nms", stats.nms / n});
+    result->timings.push_back({"encode", stats.sink / n});
+    result->wall_time = stats.wall / n;
+    result->queues = stats.queues;
+    result->frames = stats.frames;
+    result->tiles = stats.tiles;
+}
+
+// 清单为一行 JSON，先写临时文件再改名，中途崩溃也不会留下半个清单
+bool V5lite::writeManifest(const FolderJob &job) {
+    std::string temp = job.manifest + ".tmp";
+    {
+        std::ofstream out(temp);
+        out << "{\"input\":\"" << jsonEscape(job.input) << "\",\"walked\":" << job.walked
+            << ",\"sidecar_bytes\":" << job.sidecar_bytes << ",\"last_index\":" << job.last_index
+            << ",\"last\":\"" << jsonEscape(job.last) << "\",\"images\":" << job.images
+            << ",\"unreadable\":" << job.unreadable << ",\"done\":" << (job.done ? "true" : "false") << "}\n";
+        if (!out.flush())
+            return false;
+    }
+    return std::rename(temp.c_str(), job.manifest.c_str()) == 0;
+}
+
+// JSON 是 YAML 的子集，直接用 yaml-cpp 读
+bool V5lite::readManifest(FolderJob &job) {
+    std::ifstream probe(job.manifest);
+    if (!probe.good())
+        return false;
+    try {
+        YAML::Node node = YAML::LoadFile(job.manifest);
+        job.input = node["input"].as<std::string>();
+        job.walked = node["walked"].as<size_t>();
+        job.sidecar_bytes = node["sidecar_bytes"].as<int64_t>();
+        job.last_index = node["last_index"].as<size_t>();
+        job.last = node["last"].as<std::string>();
+        job.images = node["images"].as<size_t>();
+        job.unreadable = node["unreadable"].as<size_t>();
+        job.done = node["done"].as<bool>();
+    } catch (const YAML::Exception &e) {
+        std::cout << "ignoring unreadable manifest " << job.manifest << ": " << e.what() << std::endl;
+        return false;
+    }
+    return true;
+}
+
+bool V5lite::InferenceFolder(const std::string &folder_name, InferenceResult *result, bool render,
+                             const std::string &output_dir, bool restart, const FrameCallback &on_frame) {
+    assert(backend != nullptr);
+    std::string root = folder_name;
+    while (root.size() > 1 && root.back() == '/')
+        root.pop_back();
+    FolderJob job;
+    job.input = root;
+    job.render = render;
+    job.output_dir = !output_dir.empty() ? output_dir : !folder_output_dir.empty() ? folder_output_dir : root + "_out";
+    job.manifest = job.output_dir + "/manifest.json";
+    std::string sidecar_path = job.output_dir + "/detections.jsonl";
+    if (!makeDirs(job.output_dir)) {
+        std::cout << "Failed to create output folder: " << job.output_dir << std::endl;
+        return false;
+    }
+    FolderWalker walker(root, folder_recursive);
+    if (!walker.Open()) {
+        std::cout << "Failed to open folder: " << root << std::endl;
+        return false;
+    }
+
+    // 续跑: 按清单跳过已处理的文件 (只 readdir，不解码)，并确认最后处理的那张图仍在原来的位置
+    bool resumed = !restart && readManifest(job);
+    if (resumed) {
+        if (job.input != root) {
+            std::cout << job.manifest << " belongs to " << job.input << ", not " << root << std::endl;
+            return false;
+        }
+        std::string path;
+        bool matched = job.last.empty();
+        while (walker.Count() < job.walked && walker.Next(path))
+            if (walker.Count() == job.last_index + 1)
+                matched = path.substr(root.size() + 1) == job.last;
+        if (walker.Count() < job.walked || !matched) {
+            std::cout << "Folder changed since the checkpoint in " << job.manifest
+                      << ", restart it to process from the beginning" << std::endl;
+            return false;
+        }
+        // 截掉上次检查点之后多写的检测结果，重新处理的图不会重复出现
+        if (truncate(sidecar_path.c_str(), job.sidecar_bytes) != 0)
+            job.sidecar_bytes = 0;
+        std::cout << "Resuming " << root << " after " << job.walked << " files (" << job.images << " images)"
+                  << std::endl;
+    } else {
+        job.walked = 0;
+        job.sidecar_bytes = 0;
+        job.last_index = 0;
+        job.last.clear();
+        job.images = 0;
+        job.unreadable = 0;
+    }
+    job.done = false;
+    job.sidecar.open(sidecar_path, resumed ? std::ios::app : std::ios::trunc);
+    size_t skipped = job.walked;
+    size_t images_before = job.images;
+    size_t unreadable_before = job.unreadable;
+
+    PipelineStats stats;
+    bool stopped = EngineInference(walker, job, on_frame, stats);
+    job.sidecar.close();
+    std::cout << "detections saved to: " << sidecar_path << std::endl;
+
+    if (result) {
+        pipelineResult(stats, result);
+        result->output_path = job.output_dir;
+        result->sidecar = sidecar_path;
+        result->resumed = skipped;
+        result->unreadable = job.unreadable - unreadable_before;
+        result->cancelled = stopped;
+    }
+    std::cout << "Folder " << root << ": " << job.images - images_before << " images this run, " << job.images
+              << " in total" << (job.done ? ", done" : ", stopped at the checkpoint") << std::endl;
+    return true;
+}
+
+bool V5lite::EngineInference(FolderWalker &walker, FolderJob &job, const FrameCallback &on_frame,
+                             PipelineStats &stats) {
+    auto t_start_all = std::chrono::high_resolution_clock::now();
+
+    // 读图线程池: 加锁从 walker 领取下一个文件 (带遍历序号) 并解码，之后按遍历顺序拼成满 batch 送入流水线
+    struct LoadedImage{
+        size_t index;
+        std::string name;
+        cv::Mat img;
+    };
+    BoundedQueue<LoadedImage> loaded(size_t(BATCH_SIZE) * pipeline_queue_depth);
+    std::mutex walk_mutex;
+    std::atomic<bool> stopped(false);
+    std::atomic<int> loaders_running(loader_threads);
+    std::vector<std::thread> loaders;
+    for (int t = 0; t < loader_threads; t++) {
+        loaders.emplace_back([&] {
+            while (!stopped) {
+                LoadedImage item;
+                {
+                    std::lock_guard<std::mutex> lock(walk_mutex);
+                    if (!walker.Next(item.name))
+                        break;
+                    item.index = walker.Count() - 1;
+                }
+                item.img = cv::imread(item.name);
+                if (!loaded.Push(std::move(item)))
+                    break;
+            }
+            if (--loaders_running == 0)
+                loaded.Close();
+        });
+    }
+
+    // 结果图的编码写盘、检测结果和清单交给单独的写线程，按遍历顺序落盘，不阻塞后处理
+    // 清单只在 batch 边界、该 batch 的输出全部写完之后更新，续跑时从清单位置开始不会漏图
+    struct FolderOutput{
+        size_t index;
+        std::string name;
+        std::string image_path;
+        cv::Mat img;
+        std::string line;
+        size_t walked;
+    };
+    BoundedQueue<FolderOutput> outputs(size_t(BATCH_SIZE) * pipeline_queue_depth);
+    std::thread writer([&] {
+        FolderOutput item;
+        std::string made_dir;
+        size_t since_checkpoint = 0;
+        while (outputs.Pop(item)) {
+            if (!item.image_path.empty()) {
+                std::string dir = item.image_path.substr(0, item.image_path.find_last_of('/'));
+                if (dir != made_dir && makeDirs(dir))
+                    made_dir = dir;
+                if (!cv::imwrite(item.image_path, item.img))
+                    std::cout << "Failed to write " << item.image_path << std::endl;
+            }
+            job.sidecar << item.line;
+            job.images++;
+            job.last_index = item.index;
+            job.last = item.name;
+            since_checkpoint++;
+            if (item.walked > 0) {
+                // 已遍历的文件要么处理完，要么读不出
+                job.walked = item.walked;
+                job.unreadable = job.walked - job.images;
+                if ((int)since_checkpoint >= checkpoint_every) {
+                    job.sidecar.flush();
+                    job.sidecar_bytes = job.sidecar.tellp();
+                    writeManifest(job);
+                    since_checkpoint = 0;
+                }
+            }
+        }
+    });
+
+    std::map<size_t, LoadedImage> pending;
+    size_t next = walker.Count();
+    const size_t images_before = job.images;
+    RunPipeline([&](FrameBatch &batch) {
+        if (stopped)
+            return false;
+        // 读不出来的文件直接跳过，batch 尽量填满
+        while (batch.count < BATCH_SIZE) {
+            auto found = pending.find(next);
+            if (found == pending.end()) {
+                LoadedImage item;
+                if (!loaded.Pop(item))
+                    break;
+                size_t index = item.index;
+                pending[index] = std::move(item);
+                continue;
+            }
+            LoadedImage item = std::move(found->second);
+            pending.erase(found);
+            next++;
+            if (!item.img.data) {
+                std::cout << "Failed to read image: " << item.name << std::endl;
+                continue;
+            }
+            batch.frames[batch.count] = item.img;
+            batch.names[batch.count] = item.name;
+            batch.indices[batch.count] = item.index;
+            batch.count++;
+        }
+        batch.walked = next;
+        return batch.count > 0;
+    }, [&](FrameBatch &batch, std::vector<std::vector<DetectRes>> &boxes) {
+        for (int i = 0; i < batch.count; i++) {
+            FolderOutput item;
+            item.name = batch.names[i].substr(job.input.size() + 1);
+            item.index = batch.indices[i];
+            std::ostringstream line;
+            line << "{\"file\":\"" << jsonEscape(item.name) << "\",\"detections\":";
+            writeDetections(line, *this, boxes[i]);
+            line << "}\n";
+            item.line = line.str();
+            if (job.render) {
+                DrawDetections(batch.frames[i], boxes[i]);
+                item.image_path = job.output_dir + "/" + item.name;
+                item.img = batch.frames[i];
+            }
+            item.walked = i == batch.count - 1 ? batch.walked : 0;
+            if (on_frame && !stopped &&
+                !on_frame(int(images_before + batch.first_frame + i), 0, batch.frames[i], boxes[i]))
+                stopped = true;
+            outputs.Push(std::move(item));
+            // 每张图都是新解码的，回收的 batch 不再持有它 (写线程仍持有自己的引用)
+            batch.frames[i].release();
+        }
+    }, stats);
+
+    // 停止后读图线程不再领取新文件，已读出的丢弃
+    loaded.Close();
+    for (std::thread &loader : loaders)
+        loader.join();
+    outputs.Close();
+    writer.join();
+    // 没有被停止时全部文件都已取出，末尾读不出的文件不在任何 batch 中，这里一并计入
+    if (!stopped) {
+        job.walked = next;
+        job.unreadable = job.walked - job.images;
+    }
+    job.done = !stopped;
+    job.sidecar.flush();
+    job.sidecar_bytes = job.sidecar.tellp();
+    writeManifest(job);
+    float total_all = elapsedMs(t_start_all);
+    std::cout << "Processed " << stats.frames << " images (" << job.unreadable << " unreadable in total) in " << total_all
+              << " ms, " << stats.frames * 1000.f / std::max(total_all, 1.f) << " images/s." << std::endl;
+    return stopped;
+}
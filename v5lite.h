@@ -2,10 +2,19 @@
 #define V5lite_TRT_V5lite_H
 
 #include <opencv2/opencv.hpp>
-#include "NvInfer.h"
+#include <fstream>
+#include <map>
+#include <memory>
+#include <functional>
+#include "infer_backend.h"
+#include "video_encoder.h"
+
+class FolderWalker;
+class InferSession;
 
 class V5lite
 {
+public:
     struct DetectRes{
         int classes;
         float x;
@@ -13,28 +22,225 @@ class V5lite
         float w;
         float h;
         float prob;
+        // 视频跟踪模式下的轨迹号，未跟踪时为 -1
+        int track_id = -1;
     };
 
-public:
+    // 视频跟踪模式下一条轨迹 (一个目标) 的汇总
+    struct TrackSummary{
+        int id;
+        int classes;
+        int first_frame;
+        int last_frame;
+        int hits;          // 匹配到检测框的次数
+        float max_score;
+        float mean_score;
+    };
+
+    // 一个 (stride, anchor) 组合在网络输出中的一段连续区域，构造时预先展开
+    struct DecodeLevel{
+        int start;     // 该段第一个格子在输出中的行号
+        int grid_h;
+        int grid_w;
+        int anchor_w;
+        int anchor_h;
+    };
+
+    // 单次请求的推理结果 (供 webui 协议回传)
+    struct InferenceResult{
+        std::string output_path;
+        std::vector<DetectRes> detections;
+        // 各阶段耗时 (ms)，按执行顺序排列
+        std::vector<std::pair<std::string, float>> timings;
+        int frames = 0;
+        // 结果图写入共享内存时的段名与尺寸 (BGR, 8UC3)
+        std::string output_shm;
+        cv::Size output_size;
+        // 视频流水线: 实际的单帧耗时 (ms) 与各阶段间队列的平均占用
+        float wall_time = 0;
+        std::vector<std::pair<std::string, float>> queues;
+        // 视频被回调提前终止
+        bool cancelled = false;
+        // 切片推理的 tile 总数 (含整图)，未切片时为 0
+        int tiles = 0;
+        // 与本图一起推理的图片数 (InferenceBatch)
+        int batch = 0;
+        // 视频跟踪模式: 实际跑检测的帧数与各轨迹的汇总
+        int detected_frames = 0;
+        std::vector<TrackSummary> tracks;
+        // 视频: 结果视频的字节数、时长 (秒) 和从开始编码到可以播放的时间 (ms)，未输出视频时为 0
+        int64_t output_bytes = 0;
+        float output_seconds = 0;
+        float playable_ms = 0;
+        // 文件夹: 按检查点跳过的文件数、读不出的文件数和逐图检测结果文件 (detections.jsonl)
+        size_t resumed = 0;
+        size_t unreadable = 0;
+        std::string sidecar;
+    };
+
+    // 视频逐帧回调: 帧序号、总帧数 (未知时为 0)、当前帧 (render 时已画框) 与检测结果，返回 false 时提前结束
+    typedef std::function<bool(int frame, int frames_total, const cv::Mat &img,
+                               const std::vector<DetectRes> &detections)> FrameCallback;
+
     V5lite(const std::string &config_file);
     ~V5lite();
+    V5lite &operator=(V5lite &&other) = default;
     void LoadEngine();
-    bool InferenceFolder(const std::string &folder_name);
-    std::string InferenceImage(const std::string& imagePath);
+    // 重新读取配置: 阈值、标签、anchors 等就地生效，只有引擎相关的项 (engine_file / backend / 输入尺寸 / batch)
+    // 变化时才加载新引擎，返回是否更换了引擎；新配置无效或新引擎加载失败时抛出异常，当前配置和引擎保持不变
+    bool Reload(const std::string &config_file);
+    // 流式处理文件夹 (folder_recursive 时含子目录) 中的全部图片，结果写到 output_dir (为空时用 config 的 output_dir，
+    // 再为空时为 <folder>_out): render 时按原相对路径写结果图，逐图检测结果追加到 detections.jsonl，
+    // 进度定期记入 manifest.json，中断后再次运行从检查点继续 (restart 为 true 时从头开始)
+    // on_frame 的 frame 为累计处理的图片序号、frames_total 为 0 (总数未知)，返回 false 时停在当前检查点
+    // 输出目录不可用、清单属于其他输入或输入目录在检查点之前的部分已变化时返回 false
+    bool InferenceFolder(const std::string &folder_name, InferenceResult *result = nullptr, bool render = true,
+                         const std::string &output_dir = "", bool restart = false,
+                         const FrameCallback &on_frame = nullptr);
+    // render 为 false 时不画框、不写结果图，只在 result 中回传检测结果
+    bool InferenceImage(const std::string& imagePath, InferenceResult *result = nullptr, bool render = true);
+    // 对内存中的图像推理，render 为 true 时检测框直接画在 src_img 上
+    void InferenceImage(cv::Mat &src_img, InferenceResult *result, bool render = true);
+
+    // 多张内存中的图像一起推理 (按 BATCH_SIZE 分组成网络 batch)，render[i] 为 true 时检测框直接画在 images[i] 上
+    // results 与 images 一一对应，preprocess / execute / postprocess 为整批耗时
+    void InferenceBatch(std::vector<cv::Mat> &images, std::vector<InferenceResult> &results,
+                        const std::vector<bool> &render);
 
     // === [新增] 单个视频推理接口 ===
-    // 返回处理后的视频路径
-    std::string InferenceVideo(const std::string& videoPath);
+    // 处理后的视频路径写入 result->output_path (video_encoder 为 ffmpeg 时为 <name>_.mp4)；
+    // render 为 false 或 video_encoder 为 none 时改为输出逐帧检测结果 *_.jsonl；结果视频编码失败时返回 false
+    bool InferenceVideo(const std::string& videoPath, InferenceResult *result = nullptr, bool render = true,
+                        const FrameCallback &on_frame = nullptr);
+    void DrawDetections(cv::Mat &img, const std::vector<DetectRes> &detections) const;
+    std::string GetLabel(int classes) const;
+    // config.yaml 中的 render 项，CLI 模式与未指定 render 的 webui 请求使用
+    bool render = true;
+    // config.yaml 中的 video_* 项
+    VideoEncoderConfig video_encoder;
 
 private:
-    void EngineInference(const std::vector<std::string> &image_list, const int &outSize,void **buffers,
-                         const std::vector<int64_t> &bufferSize, cudaStream_t stream);
+    // 切片推理的一个 tile: 所属帧在 batch 中的下标和在原图中的区域
+    struct Tile{
+        int frame;
+        cv::Rect rect;
+    };
+    // 流水线中流转的一个 batch，frames / names 只有前 count 个有效
+    // 用完后回到池中循环使用，帧和检测结果的内存跨 batch 复用 (视频帧读入原有的 Mat，尺寸不变时不重新分配)
+    struct FrameBatch{
+        int seq = 0;
+        int first_frame = 0;
+        int count = 0;
+        std::vector<cv::Mat> frames;
+        std::vector<std::string> names;
+        // 隔帧检测时 sparse 为 true，只有 keys 中的帧 (下标) 送入检测，其余帧由跟踪器外推
+        bool sparse = false;
+        std::vector<int> keys;
+        // 切片推理时 batch 内全部 tile，input / output 为按 BATCH_SIZE 分组的多个网络 batch；为空表示整帧推理
+        std::vector<Tile> tiles;
+        // input 按后端的输入类型存放 (字节)，output 为 float
+        std::vector<uint8_t> input;
+        std::vector<float> output;
+        // 每帧的检测结果，前 count 份有效，交给 sink
+        std::vector<std::vector<DetectRes>> boxes;
+        // 文件夹模式: 每帧的遍历序号，以及取完这个 batch 时已遍历的文件数 (含读不出的文件)，即 batch 之后的检查点位置
+        std::vector<size_t> indices;
+        size_t walked = 0;
+
+        // 送入检测的帧写入 selected (复用其容量): 逐帧模式为前 count 帧，隔帧模式只有关键帧
+        void DetectFrames(std::vector<cv::Mat> &selected) const {
+            selected.clear();
+            if (!sparse)
+                selected.insert(selected.end(), frames.begin(), frames.begin() + count);
+            else
+                for (int key : keys)
+                    selected.push_back(frames[key]);
+        }
+        // 回收后重新填充前清空，保留各容器的容量
+        void Reset(int next_seq, int next_first_frame) {
+            seq = next_seq;
+            first_frame = next_first_frame;
+            count = 0;
+            sparse = false;
+            keys.clear();
+            tiles.clear();
+            walked = 0;
+        }
+    };
+    // 一次文件夹处理的输出位置和进度 (即 manifest.json 的内容)
+    struct FolderJob{
+        std::string input;
+        std::string output_dir;
+        std::string manifest;
+        bool render = true;
+        std::ofstream sidecar;
+        // 按遍历顺序已处理完的文件数 (含读不出的) 和检测结果文件在该位置时的字节数
+        size_t walked = 0;
+        int64_t sidecar_bytes = 0;
+        // 最后处理的一张图的遍历序号和相对路径，续跑时用来确认输入目录没有变化
+        size_t last_index = 0;
+        std::string last;
+        size_t images = 0;
+        size_t unreadable = 0;
+        bool done = false;
+    };
+    // 流水线各阶段的累计耗时 (ms)，queues 为各阶段间队列的平均占用
+    struct PipelineStats{
+        int frames = 0;
+        float source = 0;
+        float preprocess = 0;
+        float execute = 0;
+        // 后端提供的 execute 细分 (h2d / compute / d2h) 累计
+        std::vector<std::pair<std::string, float>> execute_parts;
+        float postprocess = 0;
+        float box_decode = 0;
+        float nms = 0;
+        float sink = 0;
+        float wall = 0;
+        int tiles = 0;
+        int detected = 0;
+        std::vector<std::pair<std::string, float>> queues;
+    };
+    // next_batch 在取图线程中填充 frames/names/count，返回 false 表示结束
+    // sink 在调用线程中按输入顺序接收每个 batch 的检测结果 (前 count 份有效)
+    void RunPipeline(const std::function<bool(FrameBatch &)> &next_batch,
+                     const std::function<void(FrameBatch &, std::vector<std::vector<DetectRes>> &)> &sink,
+                     PipelineStats &stats);
+    // 文件夹批处理: 读图线程池预取，满 batch 推理，结果图异步写盘；sidecar 不为空时只写检测结果
+    // 读图线程池从 walker 流式取文件，结果图和检测结果由单独的写线程按顺序落盘，每 checkpoint_every 张更新一次清单
+    // 内存占用只与队列深度有关，与文件数无关；返回是否被 on_frame 停止
+    bool EngineInference(FolderWalker &walker, FolderJob &job, const FrameCallback &on_frame, PipelineStats &stats);
+    // 清单读写: 写入先写临时文件再改名；文件不存在或无法解析时 readManifest 返回 false
+    static bool writeManifest(const FolderJob &job);
+    static bool readManifest(FolderJob &job);
+    // 流水线 (视频 / 文件夹) 的单帧平均耗时写入 result
+    void pipelineResult(const PipelineStats &stats, InferenceResult *result) const;
     // void EngineInference(const std::vector<cv::Mat> &vec_Mat, const std::vector<std::string> &vec_name, const int &outSize, void **buffers,
     //                          const std::vector<int64_t> &bufferSize, cudaStream_t stream, float total_time);
-    std::vector<float> prepareImage(std::vector<cv::Mat> & vec_img);
-    std::vector<std::vector<DetectRes>> postProcess(const std::vector<cv::Mat> &vec_Mat, float *output, const int &outSize);
+    void *prepareImage(std::vector<cv::Mat> & vec_img);
+    // 切片推理: 前 count 帧中大于 tile 的帧切成重叠的 tile (tile_full_image 时再加整图) 写入 tiles，
+    // 没有帧需要切片时 tiles 为空，按整帧推理；scratch 提供网格的临时缓冲
+    void makeTiles(const std::vector<cv::Mat> &frames, int count, std::vector<Tile> &tiles,
+                   InferSession &scratch) const;
+    // views 张图补齐为 BATCH_SIZE 的整数倍后的网络 batch 数
+    int chunkCount(size_t views) const { return int((views + BATCH_SIZE - 1) / BATCH_SIZE); }
+    // 一个网络 batch 的输入字节数 (按后端的输入类型)
+    size_t batchInputBytes() const {
+        return size_t(BATCH_SIZE) * INPUT_CHANNEL * IMAGE_HEIGHT * IMAGE_WIDTH * inputElementSize(input_type);
+    }
+    // 把 tile 逐个 letterbox 到 input (至少 chunkCount(tiles.size()) 个网络 batch 的长度)，多出的位置填 0
+    void prepareTiles(const std::vector<cv::Mat> &frames, const std::vector<Tile> &tiles, void *input,
+                      InferSession &scratch) const;
+    // 依次推理 chunks 个网络 batch，parts 为后端细分耗时 (h2d / compute / d2h) 的累计
+    bool inferChunks(const void *input, float *output, int chunks, std::vector<std::pair<std::string, float>> &parts);
+    // 逐帧解码 + NMS，结果写入 boxes 的前 frames.size() 份 (boxes 只增不减，复用容量)；临时缓冲用 session
+    void postProcess(const std::vector<cv::Mat> &frames, const float *output,
+                     std::vector<std::vector<DetectRes>> &boxes);
+    // 逐 tile 解码并平移回原图坐标，再对每帧做一次全局 NMS，合并相邻 tile 重叠区域中的重复框
+    // 结果写入 boxes 的前 frames 份，同 postProcess
+    void postProcessTiles(int frames, const std::vector<Tile> &tiles, const float *output,
+                          std::vector<std::vector<DetectRes>> &boxes);
     void NmsDetect(std::vector <DetectRes> &detections);
-    float IOUCalculate(const DetectRes &det_a, const DetectRes &det_b);
     std::string onnx_file;
     std::string engine_file;
     std::string labels_file;
@@ -44,15 +250,57 @@ private:
     int IMAGE_WIDTH;
     int IMAGE_HEIGHT;
     int CATEGORY;
-    nvinfer1::ICudaEngine *engine = nullptr;
-    nvinfer1::IExecutionContext *context = nullptr;
+    std::string backend_type;
+    int cpu_threads;
+    std::unique_ptr<InferBackend> backend;
+    // 每张图的输出 float 个数
+    int output_size;
+    // 后端输入绑定的元素类型，LoadEngine 后有效
+    InputType input_type = InputType::Float32;
     float obj_threshold;
     float nms_threshold;
+    std::string nms_type;
+    int max_det;
     std::vector<int> strides;
     std::vector<int> num_anchors;
     std::vector<std::vector<int>> anchors;
     std::vector<std::vector<int>> grids;
+    std::vector<DecodeLevel> decode_levels;
+    // NMS 前最多保留的候选框数，0 表示不限制
+    int top_k;
+    int pipeline_queue_depth;
+    int preprocess_threads;
+    int loader_threads;
+    // 文件夹模式: 默认输出目录、是否进入子目录、每处理多少张图更新一次检查点
+    std::string folder_output_dir;
+    bool folder_recursive;
+    int checkpoint_every;
+    // 切片推理设置，tile_width / tile_height 默认与网络输入相同
+    bool tile_enabled;
+    int tile_width;
+    int tile_height;
+    float tile_overlap;
+    bool tile_full_image;
+    // 视频隔帧检测 + 跟踪设置
+    bool track;
+    int detect_interval;
+    float motion_threshold;
+    float track_iou;
+    int track_max_age;
+    int track_min_hits;
+    // 最近一次 postProcess 中解码 / NMS 的耗时 (ms)
+    float decode_time = 0;
+    float nms_time = 0;
     std::vector<cv::Scalar> class_colors;
+    // 单图 / batch 请求和流水线后处理 (调用线程) 共用的推理会话，流水线每个前处理线程各用一个
+    // 缓冲区跨帧、跨请求复用，稳态下不再分配，见 session.h
+    std::unique_ptr<InferSession> session;
+    std::vector<std::unique_ptr<InferSession>> prepare_sessions;
+    std::vector<Tile> image_tiles;
+    // 流水线用完的 batch 和输入 / 输出缓冲区，下一个视频 / 文件夹继续使用
+    std::vector<FrameBatch> batch_pool;
+    std::vector<std::vector<uint8_t>> input_pool;
+    std::vector<std::vector<float>> output_pool;
 };
 
 #endif 
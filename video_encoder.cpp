@@ -0,0 +1,169 @@
+#include "video_encoder.h"
+#include <csignal>
+#include <cstdlib>
+#include <fstream>
+#include <map>
+#include <mutex>
+#include <sstream>
+#include <sys/stat.h>
+
+// 拼进 shell 命令的参数统一加单引号
+static std::string shellQuote(const std::string &arg) {
+    std::string quoted = "'";
+    for (char c : arg)
+        quoted += c == '\'' ? std::string("'\\''") : std::string(1, c);
+    return quoted + "'";
+}
+
+static int64_t fileSize(const std::string &path) {
+    struct stat st;
+    return stat(path.c_str(), &st) == 0 ? int64_t(st.st_size) : 0;
+}
+
+bool VideoEncoder::FfmpegAvailable(const std::string &ffmpeg) {
+    static std::mutex mutex;
+    static std::map<std::string, bool> checked;
+    std::lock_guard<std::mutex> lock(mutex);
+    auto it = checked.find(ffmpeg);
+    if (it == checked.end())
+        it = checked.emplace(ffmpeg, std::system((shellQuote(ffmpeg) + " -version >/dev/null 2>&1").c_str()) == 0).first;
+    return it->second;
+}
+
+VideoEncoder::VideoEncoder(const VideoEncoderConfig &config, size_t queue_frames)
+        : config(config), type(config.type), free_frames(queue_frames), pending(queue_frames), failed(false) {
+    if (type == "ffmpeg" && !FfmpegAvailable(config.ffmpeg)) {
+        std::cout << "ffmpeg not found (" << config.ffmpeg << "), falling back to opencv MJPG" << std::endl;
+        type = "opencv";
+    }
+    for (size_t i = 0; i < free_frames.Capacity(); i++)
+        free_frames.Push(cv::Mat());
+}
+
+VideoEncoder::~VideoEncoder() {
+    Close();
+}
+
+bool VideoEncoder::Open(const std::string &path, double fps, const cv::Size &size) {
+    this->path = path;
+    this->size = size;
+    if (fps <= 0)
+        fps = 25;
+    opened = std::chrono::high_resolution_clock::now();
+    if (type == "ffmpeg") {
+        // 原始 BGR 帧从 stdin 送入；yuv420p 要求宽高为偶数，奇数时补一行 / 一列
+        // ffmpeg 的 stdout 重定向到 stderr，webui 模式下 stdout 是协议通道
+        std::ostringstream cmd;
+        cmd << shellQuote(config.ffmpeg) << " -hide_banner -loglevel error -f rawvideo -pix_fmt bgr24 -s "
+            << size.width << "x" << size.height << " -r " << fps << " -i - -an -c:v " << shellQuote(config.codec)
+            << " -preset " << shellQuote(config.preset);
+        if (!config.bitrate.empty())
+            cmd << " -b:v " << shellQuote(config.bitrate);
+        else
+            cmd << " -crf " << config.crf;
+        cmd << " -g " << std::max(1, int(fps * config.keyframe_seconds + 0.5))
+            << " -pix_fmt yuv420p -vf 'pad=ceil(iw/2)*2:ceil(ih/2)*2'"
+            << " -movflags +frag_keyframe+empty_moov+default_base_moof -f mp4 -y " << shellQuote(path) << " >&2";
+        // ffmpeg 异常退出时写管道返回 EPIPE，而不是让 SIGPIPE 结束整个进程
+        std::signal(SIGPIPE, SIG_IGN);
+        pipe = popen(cmd.str().c_str(), "w");
+        if (!pipe) {
+            std::cout << "failed to start ffmpeg: " << cmd.str() << std::endl;
+            return false;
+        }
+    } else {
+        writer.open(path, cv::VideoWriter::fourcc('M','J','P','G'), fps, size);
+        if (!writer.isOpened()) {
+            std::cout << "failed to open video writer: " << path << std::endl;
+            return false;
+        }
+    }
+    worker = std::thread(&VideoEncoder::run, this);
+    return true;
+}
+
+bool VideoEncoder::Write(const cv::Mat &frame) {
+    if (failed)
+        return false;
+    // 流水线中的帧随后会被复用，这里拷入池中的缓冲帧 (尺寸不变，不重新分配)
+    cv::Mat slot;
+    if (!free_frames.Pop(slot))
+        return false;
+    frame.copyTo(slot);
+    return pending.Push(std::move(slot));
+}
+
+void VideoEncoder::run() {
+    cv::Mat frame;
+    while (pending.Pop(frame)) {
+        // 失败后继续取空队列，Write 不会因缓冲帧用完而阻塞
+        if (!failed) {
+            auto t_start = std::chrono::high_resolution_clock::now();
+            if (!writeFrame(frame)) {
+                std::cout << "video encoder failed while writing " << path << std::endl;
+                failed = true;
+            }
+            auto t_end = std::chrono::high_resolution_clock::now();
+            encode_ms += std::chrono::duration<float, std::milli>(t_end - t_start).count();
+            if (type == "ffmpeg" && playable_ms < 0)
+                checkPlayable();
+        }
+        free_frames.Push(std::move(frame));
+    }
+}
+
+bool VideoEncoder::writeFrame(const cv::Mat &frame) {
+    if (type != "ffmpeg") {
+        writer.write(frame);
+        return true;
+    }
+    if (frame.size() != size || frame.type() != CV_8UC3)
+        return false;
+    size_t length = frame.total() * frame.elemSize();
+    return std::fwrite(frame.data, 1, length, pipe) == length;
+}
+
+void VideoEncoder::checkPlayable() {
+    // fragmented MP4 在文件头 (ftyp + 空 moov) 之后每个关键帧写出一个 moof 分片，出现第一个 moof 即可开始播放
+    // 只读取上次检查之后新增的字节
+    int64_t current = fileSize(path);
+    if (current - scanned_bytes < 4)
+        return;
+    int64_t start = scanned_bytes;
+    std::ifstream file(path, std::ios::binary);
+    file.seekg(start);
+    std::string tail(size_t(current - start), '\0');
+    file.read(&tail[0], tail.size());
+    tail.resize(size_t(file.gcount()));
+    if (tail.find("moof") != std::string::npos)
+        playable_ms = sinceOpen();
+    // 下次从末尾前 3 个字节开始，跨读取边界的 "moof" 也能找到
+    scanned_bytes = std::max(start, start + int64_t(tail.size()) - 3);
+}
+
+float VideoEncoder::sinceOpen() const {
+    auto now = std::chrono::high_resolution_clock::now();
+    return std::chrono::duration<float, std::milli>(now - opened).count();
+}
+
+bool VideoEncoder::Close() {
+    if (!worker.joinable() && !pipe && !writer.isOpened())
+        return !failed;
+    pending.Close();
+    if (worker.joinable())
+        worker.join();
+    if (pipe) {
+        if (pclose(pipe) != 0) {
+            std::cout << "ffmpeg exited with an error for " << path << std::endl;
+            failed = true;
+        }
+        pipe = nullptr;
+    }
+    if (writer.isOpened())
+        writer.release();
+    free_frames.Close();
+    bytes = fileSize(path);
+    if (playable_ms < 0 && !failed)
+        playable_ms = sinceOpen();
+    return !failed;
+}
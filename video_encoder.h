@@ -0,0 +1,78 @@
+#ifndef V5lite_TRT_VIDEO_ENCODER_H
+#define V5lite_TRT_VIDEO_ENCODER_H
+
+#include <atomic>
+#include <chrono>
+#include <cstdio>
+#include <string>
+#include <thread>
+#include <opencv2/opencv.hpp>
+#include "pipeline.h"
+
+// 结果视频的编码设置 (config.yaml 中的 video_* 项)
+struct VideoEncoderConfig{
+    // ffmpeg: 管道送入本地 ffmpeg 编码为 H.264 fragmented MP4，浏览器可直接播放，写入过程中即可边下边播
+    // opencv: cv::VideoWriter + MJPG (旧行为，文件大，浏览器通常不能直接播放)
+    // none:   视频不输出结果视频，只写逐帧检测结果 *_.jsonl (图片不受影响)
+    std::string type = "ffmpeg";
+    std::string ffmpeg = "ffmpeg";
+    std::string codec = "libx264";
+    std::string preset = "veryfast";
+    // 画质: crf 越小画质越好、文件越大；bitrate 非空 (如 "2M") 时改为固定码率，忽略 crf
+    int crf = 23;
+    std::string bitrate;
+    // 每隔 keyframe_seconds 秒一个关键帧 (也是 fragmented MP4 的分片间隔)，决定多久之后可以开始播放
+    float keyframe_seconds = 2.f;
+};
+
+// 结果视频编码器: Write 把帧拷入池中的缓冲帧后立即返回，编码在单独的线程中进行，与推理流水线重叠
+// 缓冲帧在两个有界队列之间循环，只有 queue_frames 帧 (每帧一份整帧拷贝)；编码跟不上时 Write 阻塞，
+// 由调用方的流水线反压，不随流水线在途的帧数增长
+class VideoEncoder
+{
+public:
+    // ffmpeg 不可用时退回 opencv (Type / Extension 随之改变)
+    explicit VideoEncoder(const VideoEncoderConfig &config, size_t queue_frames = 3);
+    ~VideoEncoder();
+    // path 的扩展名由调用方按 Extension() 决定
+    bool Open(const std::string &path, double fps, const cv::Size &size);
+    bool Write(const cv::Mat &frame);
+    // 等待剩余帧编码完成并关闭文件，编码失败时返回 false
+    bool Close();
+
+    // 结果视频的扩展名 (含点)，opencv 沿用原视频的扩展名 (为空)
+    std::string Extension() const { return type == "ffmpeg" ? ".mp4" : ""; }
+    std::string Type() const { return type; }
+    // Close 之后有效: 输出文件字节数、编码线程的累计耗时 (ms)、从 Open 到文件可以播放的时间 (ms)
+    // fragmented MP4 写完第一个分片即可播放，其余格式要等 Close
+    int64_t Bytes() const { return bytes; }
+    float EncodeMs() const { return encode_ms; }
+    float PlayableMs() const { return playable_ms; }
+
+    // ffmpeg 是否可用 (按路径缓存检测结果)
+    static bool FfmpegAvailable(const std::string &ffmpeg);
+
+private:
+    void run();
+    bool writeFrame(const cv::Mat &frame);
+    void checkPlayable();
+    float sinceOpen() const;
+
+    VideoEncoderConfig config;
+    std::string type;
+    std::string path;
+    cv::Size size;
+    FILE *pipe = nullptr;
+    cv::VideoWriter writer;
+    BoundedQueue<cv::Mat> free_frames;
+    BoundedQueue<cv::Mat> pending;
+    std::thread worker;
+    std::atomic<bool> failed;
+    std::chrono::high_resolution_clock::time_point opened;
+    int64_t scanned_bytes = 0;
+    int64_t bytes = 0;
+    float encode_ms = 0;
+    float playable_ms = -1;
+};
+
+#endif //V5lite_TRT_VIDEO_ENCODER_H